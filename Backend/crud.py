@@ -1,10 +1,17 @@
 # file: crud.py
 # Desc: CRUD (Create, Read, Update, Delete) functions for interacting with database
 
-from sqlalchemy.orm import Session , aliased
-from sqlalchemy import distinct, func, cast, Numeric
+from sqlalchemy.orm import Session , aliased, joinedload
+from sqlalchemy import and_, distinct, func, cast, Numeric, or_, select, text, tuple_
+from sqlalchemy.dialects import postgresql
+from typing import Dict, List, Optional, Tuple
 from . import models, schemas
+from .services import sensor_stats
+from .services.sensor_values import LAP_MSG_ID
+import numpy as np
+import pandas as pd
 import logging
+import io
 
 
 ## READ DRIVERS
@@ -33,11 +40,23 @@ def create_driver(db: Session, user: schemas.DriverCreate):
 ## READ DRIVES
 
 def get_unique_sensors_from_drive(db: Session, drive_id: int):
+    # Primary key lookup on the manifest instead of a DISTINCT over the drive's raw_data
+    return (
+        db.query(models.SensorManifest.msg_id)
+        .filter(models.SensorManifest.drive_id == drive_id)
+        .order_by(models.SensorManifest.msg_id)
+        .all()
+    )
+
+def get_raw_data_sensor_ids(db: Session, drive_id: int):
+    # Straight from raw_data, for rebuilding things derived from it
     return db.query(distinct(models.RawData.msg_id)).filter(models.RawData.drive_id == drive_id).all()
 
 def get_drives(db: Session, skip: int = 0, limit: int = 500):
+    # Driver joined in the same query, DriveSimple serializes it for every drive
     return (
         db.query(models.Drive)
+        .options(joinedload(models.Drive.driver))
         .order_by(models.Drive.drive_id.desc())
         .offset(skip)
         .limit(limit)
@@ -47,9 +66,48 @@ def get_drives(db: Session, skip: int = 0, limit: int = 500):
 def get_drive(db: Session, drive_id: int):
     return db.query(models.Drive).filter(models.Drive.drive_id == drive_id).first()
 
+def get_drive_detail(db: Session, drive_id: int) -> Optional[Dict]:
+    # Drive + driver, with the row count, sensor count and time range summed up from the sensor manifest.
+    # Only touches raw_data (one index probe) when the drive has no manifest rows
+    drive = (
+        db.query(models.Drive)
+        .options(joinedload(models.Drive.driver))
+        .filter(models.Drive.drive_id == drive_id)
+        .first()
+    )
+    if drive is None:
+        return None
+
+    manifest = models.SensorManifest
+    sensor_count, row_count, first_time, last_time = (
+        db.query(
+            func.count(manifest.msg_id),
+            func.coalesce(func.sum(manifest.sample_count), 0),
+            func.min(manifest.first_time),
+            func.max(manifest.last_time),
+        )
+        .filter(manifest.drive_id == drive_id)
+        .one()
+    )
+    if sensor_count == 0 and db.query(select(models.RawData.data_id).filter(models.RawData.drive_id == drive_id).exists()).scalar():
+        # Rows but no manifest yet (not summarized), the counts are unknown rather than 0
+        sensor_count, row_count = None, None
+    return {
+        "drive_id": drive.drive_id,
+        "date": drive.date,
+        "notes": drive.notes,
+        "driver": drive.driver,
+        "sensor_count": sensor_count,
+        "row_count": int(row_count) if row_count is not None else None,
+        "first_time": first_time,
+        "last_time": last_time,
+        "duration": last_time - first_time if first_time is not None else None,
+    }
+
 def get_drives_by_driver(db: Session, driver_id: int):
     return (
         db.query(models.Drive)
+        .options(joinedload(models.Drive.driver))
         .filter(models.Drive.driver_id == driver_id)
         .order_by(models.Drive.drive_id.desc())
         .all()
@@ -64,18 +122,38 @@ def create_drive(db: Session, drive: schemas.DriveCreate):
 
     db_drive = models.Drive(driver_id=drive.driver_id, date=drive.date, notes=drive.notes, hash=drive.hash)
     db.add(db_drive)
+    db.flush()
+    # Drive and its raw_data partition are committed together
+    create_raw_data_partition(db, db_drive.drive_id)
     db.commit()
     db.refresh(db_drive)
 
     return db_drive
 
 def delete_drive(db: Session, drive: models.Drive):
-    db.query(models.RawData).filter(models.RawData.drive_id == drive.drive_id).delete(
-        synchronize_session=False
-    )
+    # Dropping the drive's partition instead of DELETEing its rows: no per-row WAL or vacuum debt
+    drop_raw_data_partition(db, drive.drive_id)
+    delete_sensor_pyramids(db, drive.drive_id)
+    delete_sensor_manifest(db, drive.drive_id)
+    delete_channel_stats(db, drive.drive_id)
+    delete_drive_laps(db, drive.drive_id)
     db.delete(drive)
     db.commit()
 
+## RAW DATA PARTITIONS
+
+def raw_data_partition_name(drive_id: int) -> str:
+    return f"raw_data_drive_{int(drive_id)}"
+
+def create_raw_data_partition(db: Session, drive_id: int):
+    db.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {raw_data_partition_name(drive_id)} "
+        f"PARTITION OF raw_data FOR VALUES IN ({int(drive_id)})"
+    ))
+
+def drop_raw_data_partition(db: Session, drive_id: int):
+    db.execute(text(f"DROP TABLE IF EXISTS {raw_data_partition_name(drive_id)}"))
+
 ## READ RAW DATA
 
 def get_all_data_from_drive(db: Session, drive_id: int):
@@ -91,54 +169,119 @@ def get_sensors_data_from_drive(db: Session, drive_id: int, sensor_id: int):
     )
 
 
-def get_downsample_data_from_drive(db: Session, drive_id: int, sensor_id: int, start: int, end: int):
-    # Base query with time filtering
-
-    if end == -1 and start == 0:
-        base_query = (
-            db.query(models.RawData)
-            .filter(models.RawData.drive_id == drive_id)
-            .filter(models.RawData.msg_id == sensor_id)
-            .order_by(models.RawData.time.asc())
-        )
-    elif end == -1:
-        base_query = (
-            db.query(models.RawData)
-            .filter(models.RawData.drive_id == drive_id)
-            .filter(models.RawData.msg_id == sensor_id)
-            .filter(models.RawData.time >= start)
-            .order_by(models.RawData.time.asc())
-        )
-    else:
-        base_query = (
-            db.query(models.RawData)
-            .filter(models.RawData.drive_id == drive_id)
-            .filter(models.RawData.msg_id == sensor_id)
-            .filter(models.RawData.time >= start)
-            .filter(models.RawData.time <= end)
-            .order_by(models.RawData.time.asc())
-        )
-
-    # Create subquery with grouping buckets
-    grouped_subq = (
-        base_query.add_columns(
-            func.ntile(500).over(order_by=models.RawData.time).label('bucket')
-        )
-        .subquery()
+def sensor_columns_query(drive_id: int, sensor_ids: Optional[List[int]], start: Optional[int] = None, end: Optional[int] = None):
+    # (msg_id, data_id, time, payload) of some sensors (None = all of them), each in time order,
+    # answered from the covering index
+    query = (
+        select(models.RawData.msg_id, models.RawData.data_id, models.RawData.time, models.RawData.__table__.c.payload)
+        .where(models.RawData.drive_id == drive_id)
+    )
+    if sensor_ids is not None:
+        query = query.where(models.RawData.msg_id.in_(sensor_ids))
+    if start is not None:
+        query = query.where(models.RawData.time >= start)
+    if end is not None:
+        query = query.where(models.RawData.time <= end)
+    return query.order_by(models.RawData.msg_id.asc(), models.RawData.time.asc(), models.RawData.data_id.asc())
+
+def get_sensor_columns(db: Session, drive_id: int, sensor_ids: Optional[List[int]], start: Optional[int] = None, end: Optional[int] = None) -> pd.DataFrame:
+    return copy_query_to_frame(db, sensor_columns_query(drive_id, sensor_ids, start, end))
+
+def sensor_range_columns_query(drive_id: int, ranges: List[Tuple[int, int, Optional[int]]]):
+    # (msg_id, data_id, time, payload) for several (msg_id, first_time, last_time) ranges, last_time None
+    # = open ended, each sensor in time order
+    raw_data = models.RawData
+    conditions = []
+    for sensor_id, first_time, last_time in ranges:
+        condition = and_(raw_data.msg_id == sensor_id, raw_data.time >= first_time)
+        conditions.append(condition if last_time is None else and_(condition, raw_data.time <= last_time))
+    return (
+        select(raw_data.msg_id, raw_data.data_id, raw_data.time, raw_data.__table__.c.payload)
+        .where(raw_data.drive_id == drive_id)
+        .where(or_(*conditions))
+        .order_by(raw_data.msg_id.asc(), raw_data.time.asc(), raw_data.data_id.asc())
     )
 
-    # Create alias for RawData model
-    grouped_alias = aliased(models.RawData, grouped_subq)
+def get_sensor_range_columns(db: Session, drive_id: int, ranges: List[Tuple[int, int, Optional[int]]]) -> pd.DataFrame:
+    return copy_query_to_frame(db, sensor_range_columns_query(drive_id, ranges))
+
+def raw_data_page_query(drive_id: int, sensor_id: Optional[int] = None, after: Optional[Tuple[int, int]] = None, limit: Optional[int] = None,
+                        start: Optional[int] = None, end: Optional[int] = None):
+    # (msg_id, data_id, time, payload) of a drive or one of its sensors in (time, data_id) order,
+    # optionally limited to times in [start, end] (a lap).
+    # Keyset pagination: `after` is the (time, data_id) of the last row of the previous page, no OFFSET scans
+    query = (
+        select(models.RawData.msg_id, models.RawData.data_id, models.RawData.time, models.RawData.__table__.c.payload)
+        .where(models.RawData.drive_id == drive_id)
+    )
+    if sensor_id is not None:
+        query = query.where(models.RawData.msg_id == sensor_id)
+    if start is not None:
+        query = query.where(models.RawData.time >= start)
+    if end is not None:
+        query = query.where(models.RawData.time <= end)
+    if after is not None:
+        query = query.where(tuple_(models.RawData.time, models.RawData.data_id) > tuple_(*after))
+    query = query.order_by(models.RawData.time.asc(), models.RawData.data_id.asc())
+    if limit is not None:
+        query = query.limit(limit)
+    return query
+
+def get_raw_data_page(db: Session, drive_id: int, sensor_id: Optional[int] = None, after: Optional[Tuple[int, int]] = None, limit: Optional[int] = None) -> pd.DataFrame:
+    return copy_query_to_frame(db, raw_data_page_query(drive_id, sensor_id, after, limit))
+
+def get_raw_data_page_end(db: Session, query, limit: int) -> Optional[Tuple[int, int]]:
+    # (time, data_id) of the last row of a raw_data_page_query page of `limit` rows, None if the page comes
+    # back short. For a cursor header that has to be sent before the page itself is streamed, off the index keys only
+    row = db.execute(
+        query.with_only_columns(models.RawData.time, models.RawData.data_id).offset(limit - 1).limit(1)
+    ).first()
+    return None if row is None else (row[0], row[1])
+
+def raw_data_json_copy_sql(query) -> str:
+    # One RawData-shaped JSON object per line (NDJSON) for the rows of a raw_data_page_query
+    raw_data = ", ".join(f"(payload >> {8 * i}) & 255" for i in range(models.PAYLOAD_BYTES))
+    return (
+        "COPY (SELECT json_build_object('data_id', data_id, 'msg_id', msg_id, 'time', time, "
+        f"'raw_data', json_build_array({raw_data})) FROM ({literal_sql(query)}) AS page "
+        "ORDER BY time, data_id) TO STDOUT"
+    )
 
-    # Get first record from each bucket
+def literal_sql(query) -> str:
+    # Postgres SQL for a Core query with its parameters inlined, for COPY (which can't take bind parameters)
+    return str(query.compile(dialect=postgresql.dialect(), compile_kwargs={"literal_binds": True}))
+
+def drive_csv_copy_sql(drive_id: int, start: Optional[int] = None, end: Optional[int] = None) -> str:
+    # Drive export CSV (msg_id, time, buffer0..7), bytes unpacked from the bigint payload by Postgres itself.
+    # start / end limit it to a time range (a lap)
+    buffers = ", ".join(f"(payload >> {8 * i}) & 255 AS buffer{i}" for i in range(models.PAYLOAD_BYTES))
+    time_range = ""
+    if start is not None:
+        time_range += f" AND time >= {int(start)}"
+    if end is not None:
+        time_range += f" AND time <= {int(end)}"
     return (
-        db.query(grouped_alias)
-        .distinct(grouped_subq.c.bucket)
-        .order_by(grouped_subq.c.bucket, grouped_subq.c.time)
-        .limit(500)
-        .all()
+        f"COPY (SELECT msg_id, time, {buffers} FROM raw_data WHERE drive_id = {int(drive_id)}{time_range}) "
+        "TO STDOUT WITH (FORMAT csv, HEADER)"
     )
 
+def copy_query_to_frame(db: Session, query) -> pd.DataFrame:
+    # Streams a SELECT through COPY ... TO STDOUT into a DataFrame, no ORM objects or row tuples in between
+    columns = list(query.selected_columns.keys())
+    sql = literal_sql(query)
+
+    buffer = io.StringIO()
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(f"COPY ({sql}) TO STDOUT WITH (FORMAT csv)", buffer)
+    finally:
+        cursor.close()
+
+    if buffer.tell() == 0:
+        return pd.DataFrame({column: pd.Series(dtype=np.int64) for column in columns})
+    buffer.seek(0)
+    return pd.read_csv(buffer, header=None, names=columns)
+
 
 ## WRITE RAW DATA
 
@@ -151,4 +294,242 @@ def create_raw_data(db: Session, data: schemas.RawDataCreate):
 
     return db_data
 
+def copy_raw_data(db: Session, drive_id: int, msg_id: np.ndarray, time: np.ndarray, payload: np.ndarray):
+    # Bulk load with COPY on the session's connection, skips the ORM unit of work entirely.
+    # payload is an (n, 8) array of bytes, packed into the bigint payload column like models.PackedPayload
+    if len(msg_id) == 0:
+        return
+
+    rows = pd.DataFrame({
+        "drive_id": drive_id,
+        "msg_id": msg_id,
+        "time": time,
+        "payload": pack_payloads(payload),
+    })
+    buffer = io.StringIO()
+    rows.to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY raw_data (drive_id, msg_id, time, payload) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+
+def pack_payloads(payload: np.ndarray) -> np.ndarray:
+    # Vectorized models.pack_payload: (n, 8) byte values -> (n,) little-endian int64
+    if payload.size and (payload.min() < 0 or payload.max() > 255):
+        raise ValueError("raw_data values must be bytes (0-255)")
+    packed = np.zeros((len(payload), models.PAYLOAD_BYTES), dtype=np.uint8)
+    packed[:, :payload.shape[1]] = payload
+    return packed.view("<i8").ravel()
+
+
+## SENSOR PYRAMIDS
+
+def get_sensor_pyramid_extents(db: Session, drive_id: int, sensor_ids: List[int]) -> Dict[int, Dict]:
+    # msg_id -> finest_level, top_level, first_time, last_time for sensors that have a pyramid.
+    # The coarsest level is a single bucket spanning the whole sensor. Two LIMIT 1 index probes per
+    # sensor instead of reading every level
+    rows = db.execute(text(
+        "SELECT s.msg_id, finest.level AS finest_level, top.level AS top_level, top.first_time, top.last_time "
+        "FROM unnest(CAST(:sensor_ids AS integer[])) AS s(msg_id) "
+        "JOIN LATERAL (SELECT level, first_time, last_time FROM sensor_pyramid p "
+        "  WHERE p.drive_id = :drive_id AND p.msg_id = s.msg_id ORDER BY level DESC LIMIT 1) AS top ON true "
+        "JOIN LATERAL (SELECT level FROM sensor_pyramid p "
+        "  WHERE p.drive_id = :drive_id AND p.msg_id = s.msg_id ORDER BY level ASC LIMIT 1) AS finest ON true"
+    ), {"drive_id": drive_id, "sensor_ids": list(sensor_ids)}).mappings()
+    return {row["msg_id"]: dict(row) for row in rows}
+
+def get_sensor_pyramid_buckets(db: Session, drive_id: int, ranges: List[Tuple[int, int, int, int]]) -> pd.DataFrame:
+    # Buckets for several (msg_id, level, first_bucket, last_bucket) ranges in one query
+    pyramid = models.SensorPyramid.__table__
+    return copy_query_to_frame(db, (
+        select(pyramid)
+        .where(pyramid.c.drive_id == drive_id)
+        .where(or_(*(
+            and_(pyramid.c.msg_id == sensor_id, pyramid.c.level == level, pyramid.c.bucket.between(first_bucket, last_bucket))
+            for sensor_id, level, first_bucket, last_bucket in ranges
+        )))
+        .order_by(pyramid.c.msg_id.asc(), pyramid.c.bucket.asc())
+    ))
+
+def copy_sensor_pyramid(db: Session, rows: pd.DataFrame):
+    # rows has a column for every sensor_pyramid column
+    if rows.empty:
+        return
+    columns = [column.name for column in models.SensorPyramid.__table__.columns]
+    buffer = io.StringIO()
+    rows[columns].to_csv(buffer, index=False, header=False)
+    buffer.seek(0)
+
+    cursor = db.connection().connection.cursor()
+    try:
+        cursor.copy_expert(
+            f"COPY sensor_pyramid ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)",
+            buffer
+        )
+    finally:
+        cursor.close()
+
+def delete_sensor_pyramids(db: Session, drive_id: int):
+    db.query(models.SensorPyramid).filter(models.SensorPyramid.drive_id == drive_id).delete(synchronize_session=False)
+
+## SENSOR MANIFEST
+
+def get_sensor_manifest(db: Session, drive_id: int):
+    return (
+        db.query(models.SensorManifest)
+        .filter(models.SensorManifest.drive_id == drive_id)
+        .order_by(models.SensorManifest.msg_id)
+        .all()
+    )
 
+def upsert_sensor_manifest(db: Session, drive_id: int, summary: pd.DataFrame):
+    # Merge a batch's per-sensor summary (sensor_values.summarize_sensors) into the drive's manifest.
+    # Doesn't commit, so the summary lands in the same transaction as the rows it describes
+    if summary.empty:
+        return
+
+    table = models.SensorManifest.__table__
+    statement = postgresql.insert(table).values(summary.assign(drive_id=drive_id).to_dict("records"))
+    old, new = table.c, statement.excluded
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[old.drive_id, old.msg_id],
+        set_={
+            "sample_count": old.sample_count + new.sample_count,
+            "first_time": func.least(old.first_time, new.first_time),
+            "last_time": func.greatest(old.last_time, new.last_time),
+            "min_value": func.least(old.min_value, new.min_value),
+            "max_value": func.greatest(old.max_value, new.max_value),
+        }
+    ))
+
+def replace_sensor_manifest(db: Session, drive_id: int, rows: List[Dict]):
+    # Swap the drive's manifest for rows computed from all of its samples (sensor_values.manifest_row).
+    # Doesn't commit
+    delete_sensor_manifest(db, drive_id)
+    if rows:
+        db.execute(postgresql.insert(models.SensorManifest.__table__), [{**row, "drive_id": drive_id} for row in rows])
+
+def delete_sensor_manifest(db: Session, drive_id: int):
+    db.query(models.SensorManifest).filter(models.SensorManifest.drive_id == drive_id).delete(synchronize_session=False)
+
+## CHANNEL STATISTICS
+
+def get_channel_stats(db: Session, drive_id: int):
+    stats = models.SensorChannelStats
+    return (
+        db.query(stats)
+        .filter(stats.drive_id == drive_id)
+        .order_by(stats.msg_id, stats.channel, stats.selector)
+        .all()
+    )
+
+def get_sensors_without_channel_stats(db: Session, drive_id: int, sensor_ids: List[int]) -> List[int]:
+    # Sensors that already have samples (a manifest row) but no channel statistics: drives from before the
+    # statistics, a batch can't be merged into those without covering only part of the samples
+    stats = models.SensorChannelStats
+    rows = (
+        db.query(models.SensorManifest.msg_id)
+        .filter(
+            models.SensorManifest.drive_id == drive_id,
+            models.SensorManifest.msg_id.in_(sensor_ids),
+            ~select(stats.msg_id)
+            .where(stats.drive_id == drive_id, stats.msg_id == models.SensorManifest.msg_id)
+            .exists(),
+        )
+        .all()
+    )
+    return [row.msg_id for row in rows]
+
+def upsert_channel_stats(db: Session, drive_id: int, summary: pd.DataFrame):
+    # Merge a batch's per-channel summary (sensor_stats.summarize_channels) into the drive's statistics.
+    # Doesn't commit, so the summary lands in the same transaction as the rows it describes
+    if summary.empty:
+        return
+
+    table = models.SensorChannelStats.__table__
+    statement = postgresql.insert(table).values(summary.assign(drive_id=drive_id).to_dict("records"))
+    old, new = table.c, statement.excluded
+    # Mean and squared deviations merge with the parallel variance formula (Chan et al.), every
+    # expression sees the row as it was before the update
+    count = old.sample_count + new.sample_count
+    delta = new.mean_value - old.mean_value
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[old.drive_id, old.msg_id, old.channel, old.selector],
+        set_={
+            "sample_count": count,
+            "first_time": func.least(old.first_time, new.first_time),
+            "last_time": func.greatest(old.last_time, new.last_time),
+            "min_value": func.least(old.min_value, new.min_value),
+            "max_value": func.greatest(old.max_value, new.max_value),
+            "mean_value": old.mean_value + delta * new.sample_count / count,
+            "m2_value": old.m2_value + new.m2_value + delta * delta * old.sample_count * new.sample_count / count,
+            # Stale as soon as there's more data, finalize_drive recomputes them
+            **{column: None for column in sensor_stats.PERCENTILE_COLUMNS},
+        }
+    ))
+
+def replace_channel_stats(db: Session, drive_id: int, rows: List[Dict], sensor_ids: Optional[List[int]] = None):
+    # Swap the drive's statistics (or just these sensors') for rows computed from all of their samples
+    # (sensor_stats.exact_stats). Doesn't commit
+    delete_channel_stats(db, drive_id, sensor_ids)
+    if rows:
+        db.execute(postgresql.insert(models.SensorChannelStats.__table__), [{**row, "drive_id": drive_id} for row in rows])
+
+def delete_channel_stats(db: Session, drive_id: int, sensor_ids: Optional[List[int]] = None):
+    query = db.query(models.SensorChannelStats).filter(models.SensorChannelStats.drive_id == drive_id)
+    if sensor_ids is not None:
+        query = query.filter(models.SensorChannelStats.msg_id.in_(sensor_ids))
+    query.delete(synchronize_session=False)
+
+## LAPS
+
+def get_drive_laps(db: Session, drive_id: int):
+    return db.query(models.DriveLap).filter(models.DriveLap.drive_id == drive_id).order_by(models.DriveLap.start_time).all()
+
+def get_drive_lap(db: Session, drive_id: int, lap: int):
+    return db.query(models.DriveLap).filter(models.DriveLap.drive_id == drive_id, models.DriveLap.lap == lap).first()
+
+def upsert_drive_laps(db: Session, drive_id: int, laps: pd.DataFrame):
+    # Merge a batch's lap frames (sensor_values.summarize_laps) into the lap index. Doesn't commit
+    if laps.empty:
+        return
+
+    table = models.DriveLap.__table__
+    statement = postgresql.insert(table).values(
+        laps.assign(drive_id=drive_id, duration=laps["end_time"] - laps["start_time"] + 1).to_dict("records")
+    )
+    old, new = table.c, statement.excluded
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[old.drive_id, old.lap],
+        set_={
+            "start_time": func.least(old.start_time, new.start_time),
+            "end_time": func.greatest(old.end_time, new.end_time),
+            "duration": func.greatest(old.end_time, new.end_time) - func.least(old.start_time, new.start_time) + 1,
+        }
+    ))
+
+def rebuild_drive_laps(db: Session, drive_id: int):
+    # Exact lap index from the drive's lap frames: each lap ends right before the next one starts,
+    # the last one at the drive's last sample (from the sensor manifest). Doesn't commit
+    delete_drive_laps(db, drive_id)
+    db.execute(text(
+        "INSERT INTO drive_lap (drive_id, lap, start_time, end_time, duration) "
+        "SELECT :drive_id, lap, start_time, end_time, end_time - start_time + 1 FROM ("
+        "  SELECT lap, start_time, coalesce("
+        "    lead(start_time) OVER (ORDER BY start_time) - 1, "
+        "    (SELECT max(last_time) FROM sensor_manifest WHERE drive_id = :drive_id)"
+        "  ) AS end_time "
+        "  FROM (SELECT (payload & 255)::integer AS lap, min(time) AS start_time FROM raw_data "
+        "        WHERE drive_id = :drive_id AND msg_id = :lap_msg_id GROUP BY 1) AS laps"
+        ") AS bounded"
+    ), {"drive_id": drive_id, "lap_msg_id": LAP_MSG_ID})
+
+def delete_drive_laps(db: Session, drive_id: int):
+    db.query(models.DriveLap).filter(models.DriveLap.drive_id == drive_id).delete(synchronize_session=False)
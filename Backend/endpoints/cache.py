@@ -0,0 +1,13 @@
+# file: cache.py
+# Desc: Endpoint for checking the drive response cache (hit/miss counters, memory use)
+
+from fastapi import APIRouter
+from ..services import response_cache
+
+
+router = APIRouter()
+
+
+@router.get("/cache", response_model=dict)
+def get_response_cache_stats():
+    return response_cache.cache.stats()
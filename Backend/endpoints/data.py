@@ -1,10 +1,16 @@
 # file: data.py
 # Desc: Endpoint for adding and getting sensor data to and from db
 
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from .. import crud, models, schemas
 from ..database import SessionLocal, engine
+from ..services import can_channels, columnar, downsample, drive_ingest, export, response_cache
+from ..services.sensor_values import payload_bytes, raw_data_records
 from sqlalchemy.orm import Session
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+import pandas as pd
 
 
 router = APIRouter()
@@ -19,28 +25,246 @@ def get_db():
         db.close()
 
 
+# Largest page a ?limit= request can ask for
+MAX_PAGE_ROWS : int = 100000
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[int, int]]:
+    if cursor is None:
+        return None
+    try:
+        time, data_id = cursor.split(":")
+        return int(time), int(data_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor, expected <time>:<data_id>")
+
+
+def response_format(request: Request) -> str:
+    '''Negotiated body format, part of the response cache key'''
+    if columnar.accepts(request, export.NDJSON_MEDIA_TYPE):
+        return "ndjson"
+    if columnar.wants_columnar(request):
+        return "columnar"
+    return "json"
+
+
+def negotiated_response(request: Request, drive_id: int, build: Callable[[], Response]) -> Response:
+    '''Cached response of a route whose body format depends on Accept. Vary: Accept on every answer
+    (fresh, cached or 304) so browser and proxy caches keep the JSON and binary bodies apart.'''
+    response = response_cache.cached_response(request, drive_id, response_format(request), build)
+    response.headers["Vary"] = "Accept"
+    return response
+
+
+def lap_range(db: Session, drive_id: int, lap: Optional[int]) -> Tuple[Optional[int], Optional[int]]:
+    '''?lap= selector -> the lap's inclusive [start, end] time range from the lap index, (None, None) without one'''
+    if lap is None:
+        return None, None
+    drive_lap = crud.get_drive_lap(db, drive_id, lap)
+    if drive_lap is None:
+        raise HTTPException(status_code=404, detail=f"Unknown lap: {lap}")
+    return drive_lap.start_time, drive_lap.end_time
+
+
+def clip_to_lap(db: Session, drive_id: int, lap: Optional[int], start: int, end: int) -> Tuple[int, int]:
+    '''Downsample range (end -1 = open ended) narrowed to a lap'''
+    lap_start, lap_end = lap_range(db, drive_id, lap)
+    if lap is None:
+        return start, end
+    return max(start, lap_start), lap_end if end == -1 else min(end, lap_end)
+
+
+def raw_data_response(request: Request, db: Session, drive_id: int, sensor_id: Optional[int], cursor: Optional[str], limit: Optional[int],
+                      lap: Optional[int] = None):
+    '''Rows of a drive (or one sensor, or one lap of either) in (time, data_id) order, in whichever format the client asked for.
+    Without ?limit the whole result is streamed straight out of COPY (a JSON array, or NDJSON with
+    Accept: application/x-ndjson). With ?limit it's one keyset page in any format, and the X-Next-Cursor
+    header holds the ?cursor= for the next one while pages come back full.'''
+    after = parse_cursor(cursor)
+    start, end = lap_range(db, drive_id, lap)
+    query = crud.raw_data_page_query(drive_id, sensor_id, after, limit, start, end)
+
+    if columnar.accepts(request, export.NDJSON_MEDIA_TYPE):
+        headers = {}
+        if limit is not None:
+            # Streamed pages send their headers first, so the last row's key is looked up up front
+            last = crud.get_raw_data_page_end(db, query, limit)
+            if last is not None:
+                headers["X-Next-Cursor"] = f"{last[0]}:{last[1]}"
+        return StreamingResponse(
+            export.stream_copy_out(crud.raw_data_json_copy_sql(query)),
+            media_type=export.NDJSON_MEDIA_TYPE,
+            headers=headers
+        )
+    if limit is None and not columnar.wants_columnar(request):
+        return StreamingResponse(
+            export.json_array_chunks(export.stream_copy_out(crud.raw_data_json_copy_sql(query))),
+            media_type="application/json"
+        )
+
+    page = crud.copy_query_to_frame(db, query)
+    headers = {}
+    if limit is not None and len(page) == limit:
+        headers["X-Next-Cursor"] = f"{page['time'].iloc[-1]}:{page['data_id'].iloc[-1]}"
+
+    if columnar.wants_columnar(request):
+        return columnar.columnar_response(page, headers)
+    return JSONResponse(raw_data_records(page), headers=headers)
+
+
+def check_downsample_request(points: Optional[int], algorithm: str):
+    if algorithm not in downsample.ALGORITHMS:
+        raise HTTPException(status_code=400, detail=f"Unknown downsample algorithm: {algorithm}")
+    if algorithm == downsample.MINMAX and points is not None and points < downsample.MINMAX_MIN_POINTS:
+        # One minmax bucket is already four samples
+        raise HTTPException(status_code=422, detail=f"minmax needs at least {downsample.MINMAX_MIN_POINTS} points: {points}")
+
+
 @router.get("/data/{drive_id}", response_model=list[schemas.RawData])
-def get_data_from_drive(drive_id: int, db: Session = Depends(get_db)):
-    data = crud.get_all_data_from_drive(db, drive_id)
+def get_data_from_drive(
+    drive_id: int,
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_ROWS),
+    lap: Optional[int] = Query(None),
+    db: Session = Depends(get_db)
+):
+    return negotiated_response(request, drive_id,
+        lambda: raw_data_response(request, db, drive_id, None, cursor, limit, lap))
 
-    return data
+@router.get("/data/{drive_id}/batch/{start}/{end}", response_model=Dict[int, list[schemas.RawData]])
+def get_downsampled_data_from_drive_for_sensors(
+    drive_id: int,
+    start: int,
+    end: int,
+    request: Request,
+    sensor_ids: List[int] = Query(...),
+    points: int = Query(downsample.DOWNSAMPLE_POINTS, ge=2, le=downsample.MAX_DOWNSAMPLE_POINTS),
+    algorithm: str = Query(downsample.MINMAX),
+    lap: Optional[int] = Query(None),
+    db: Session = Depends(get_db)
+):
+    '''Every overlaid series of a chart in one request: ?sensor_ids=1&sensor_ids=2... -> {sensor_id: [RawData]}.
+    The columnar format sends all series as one body, grouped by msg_id.'''
+    check_downsample_request(points, algorithm)
 
-@router.get("/data/{drive_id}/{sensor_id}", response_model=list[schemas.RawData])
-def get_data_from_drive_for_sensor(drive_id: int, sensor_id: int, db: Session = Depends(get_db)):
+    sensor_ids = list(dict.fromkeys(sensor_ids))
+
+    def build():
+        range_start, range_end = clip_to_lap(db, drive_id, lap, start, end)
+        if columnar.wants_columnar(request):
+            series = downsample.downsample_series(db, drive_id, sensor_ids, range_start, range_end, points, algorithm)
+            return columnar.columnar_response(pd.concat(series.values(), ignore_index=True))
+        return JSONResponse(downsample.downsample_sensors(db, drive_id, sensor_ids, range_start, range_end, points, algorithm))
 
-    data = crud.get_sensors_data_from_drive(db, drive_id, sensor_id)
+    return negotiated_response(request, drive_id, build)
 
-    return data
+@router.get("/data/{drive_id}/{sensor_id}", response_model=list[schemas.RawData])
+def get_data_from_drive_for_sensor(
+    drive_id: int,
+    sensor_id: int,
+    request: Request,
+    cursor: Optional[str] = Query(None),
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_ROWS),
+    lap: Optional[int] = Query(None),
+    db: Session = Depends(get_db)
+):
+    return negotiated_response(request, drive_id,
+        lambda: raw_data_response(request, db, drive_id, sensor_id, cursor, limit, lap))
 
 
 @router.get("/data/{drive_id}/{sensor_id}/{start}/{end}", response_model=list[schemas.RawData])
-def get_downsampled_data_from_drive_for_sensor(drive_id: int, sensor_id: int, start: int, end: int, db: Session = Depends(get_db)):
-    data = crud.get_downsample_data_from_drive(db, drive_id, sensor_id, start, end)
+def get_downsampled_data_from_drive_for_sensor(
+    drive_id: int,
+    sensor_id: int,
+    start: int,
+    end: int,
+    request: Request,
+    points: int = Query(downsample.DOWNSAMPLE_POINTS, ge=2, le=downsample.MAX_DOWNSAMPLE_POINTS),
+    algorithm: str = Query(downsample.MINMAX),
+    lap: Optional[int] = Query(None),
+    db: Session = Depends(get_db)
+):
+    check_downsample_request(points, algorithm)
+
+    def build():
+        range_start, range_end = clip_to_lap(db, drive_id, lap, start, end)
+        if columnar.wants_columnar(request):
+            series = downsample.downsample_series(db, drive_id, [sensor_id], range_start, range_end, points, algorithm)
+            return columnar.columnar_response(series[sensor_id])
+        return JSONResponse(downsample.downsample_sensor(db, drive_id, sensor_id, range_start, range_end, points, algorithm))
+
+    return negotiated_response(request, drive_id, build)
+
+
+def channel_series(sensor_id: int, samples: Optional[pd.DataFrame], names: List[str]) -> Dict:
+    '''Samples of one sensor -> ChannelSeries-shaped dict, channels decoded and scaled by the registry'''
+    spec = can_channels.message_spec(sensor_id)
+    if samples is None or samples.empty:
+        times, decoded = [], {name: [] for name in names}
+    else:
+        times = samples["time"].tolist()
+        decoded = {
+            name: values.tolist()
+            for name, values in can_channels.decode_channels(sensor_id, payload_bytes(samples["payload"].to_numpy()), names).items()
+        }
+    return {
+        "msg_id": sensor_id,
+        "name": spec.name,
+        "units": {name: spec.channel(name).unit for name in names},
+        "time": times,
+        "channels": decoded,
+    }
+
+
+@router.get("/channels", response_model=list[schemas.MessageChannels])
+def get_channels():
+    '''The CAN decoder registry: every known msg_id with its named channels'''
+    return can_channels.registry()
+
+
+@router.get("/data/{drive_id}/{sensor_id}/channels", response_model=schemas.ChannelSeries)
+def get_channels_from_drive_for_sensor(
+    drive_id: int,
+    sensor_id: int,
+    request: Request,
+    start: int = Query(0),
+    end: int = Query(-1),
+    channels: Optional[List[str]] = Query(None),
+    points: Optional[int] = Query(None, ge=2, le=downsample.MAX_DOWNSAMPLE_POINTS),
+    algorithm: str = Query(downsample.MINMAX),
+    lap: Optional[int] = Query(None),
+    db: Session = Depends(get_db)
+):
+    '''One sensor decoded server side into its physical channels (?channels= picks some, default all) as
+    parallel arrays. Every sample between start and end (end -1 = open ended), or with ?points= a
+    downsampled selection ranked by the chart channel, same as the chart routes.'''
+    check_downsample_request(points, algorithm)
+    spec = can_channels.message_spec(sensor_id)
+    known = [channel.name for channel in spec.channels]
+    names = list(dict.fromkeys(channels)) if channels else known
+    for name in names:
+        if name not in known:
+            raise HTTPException(status_code=400, detail=f"Unknown channel: {name}")
+
+    def build():
+        range_start, range_end = clip_to_lap(db, drive_id, lap, start, end)
+        if points is None:
+            samples = crud.get_sensor_columns(db, drive_id, [sensor_id], range_start, None if range_end == -1 else range_end)
+        else:
+            series = downsample.downsample_series(db, drive_id, [sensor_id], range_start, range_end, points, algorithm)
+            samples = series.get(sensor_id)
+        return JSONResponse(channel_series(sensor_id, samples, names))
 
-    return data
+    return response_cache.cached_response(request, drive_id, "json", build)
 
 
 @router.post("/data", response_model=schemas.RawData)
 def create_data(data: schemas.RawDataCreate, db: Session = Depends(get_db)):
-    
-    return crud.create_raw_data(db=db, data=data)
+    db_data = crud.create_raw_data(db=db, data=data)
+    drive_ingest.update_drive_summaries(
+        db, data.drive_id, np.array([data.msg_id]), np.array([data.time]), np.array([models.pack_payload(data.raw_data)])
+    )
+    db.commit()
+    response_cache.cache.invalidate_drive(data.drive_id)
+    return db_data
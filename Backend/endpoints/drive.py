@@ -1,17 +1,19 @@
 # file: drive.py
 # Desc: Endpoint for adding and getting drive data
 
-from fastapi import APIRouter, Depends, HTTPException, File, UploadFile
-from fastapi.responses import StreamingResponse
-import pandas as pd
-import io
-import csv
+from fastapi import APIRouter, Depends, HTTPException, File, Form, Query, Request, Response, UploadFile
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import List, Optional
+from datetime import datetime, timezone
+import os
 import re
+import zipfile
 from .. import crud, models, schemas
 from ..database import SessionLocal, engine
 from sqlalchemy.orm import Session
 from secrets import compare_digest
 from ..configDB import DELETE_PASSWORD
+from ..services import batch_ingest, drive_ingest, export, ingest_jobs, response_cache, sensor_stats
 
 router = APIRouter()
 
@@ -29,10 +31,20 @@ def get_drives_by_driver(driver_id: int, db: Session = Depends(get_db)):
     drives = crud.get_drives_by_driver(db, driver_id)
     return drives
 
-@router.get("/drive/{drive_id}", response_model=schemas.Drive)
-def get_drive_by_id(drive_id: int, db: Session = Depends(get_db)):
-    drive = crud.get_drive(db, drive_id)
-    return drive
+# GET /drive/{drive_id} is taken by the by-driver list above, so the detail lives one level down
+@router.get("/drive/{drive_id}/detail", response_model=schemas.DriveDetail)
+def get_drive_by_id(drive_id: int, request: Request, db: Session = Depends(get_db)):
+    '''Drive metadata, driver, row / sensor counts and time range without loading any raw data'''
+    def build():
+        detail = crud.get_drive_detail(db, drive_id)
+        if detail is None:
+            raise HTTPException(status_code=404, detail="Drive not found")
+        return Response(
+            schemas.DriveDetail.model_validate(detail, from_attributes=True).model_dump_json(),
+            media_type="application/json"
+        )
+
+    return response_cache.cached_response(request, drive_id, "json", build)
 
 @router.delete("/drive/{drive_id}", response_model=dict)
 def delete_drive(drive_id: int, 
@@ -45,54 +57,106 @@ def delete_drive(drive_id: int,
         raise HTTPException(status_code=403, detail="Wrong password")
 
     crud.delete_drive(db, drive)
+    response_cache.cache.invalidate_drive(drive_id)
     return {"message": "Drive deleted successfully"}
 
 @router.get("/drive/{drive_id}/csv")
-def download_drive_csv(drive_id: int, db: Session = Depends(get_db)):
+def download_drive_csv(drive_id: int, request: Request, gzip: bool = Query(False), lap: Optional[int] = Query(None),
+                       db: Session = Depends(get_db)):
+    '''Streams the drive (or one ?lap=) as CSV straight out of COPY ... TO STDOUT, gzipped on the fly with ?gzip=true'''
     drive = crud.get_drive(db, drive_id)
     if not drive:
         raise HTTPException(status_code=404, detail="Drive not found")
-    
-    raw_rows = crud.get_all_data_from_drive(db, drive_id)
-    csv_buffer = io.StringIO()
-    writer = csv.writer(csv_buffer)
-    writer.writerow([
-        "msg_id",
-        "time",
-        "buffer0",
-        "buffer1",
-        "buffer2",
-        "buffer3",
-        "buffer4",
-        "buffer5",
-        "buffer6",
-        "buffer7",
-    ])
-
-    for row in raw_rows:
-        raw_data = list(row.raw_data or [])
-        padded_raw_data = raw_data + [None] * (8 - len(raw_data))
-        writer.writerow([row.msg_id, row.time, *padded_raw_data[:8]])
 
+    start = end = None
+    if lap is not None:
+        drive_lap = crud.get_drive_lap(db, drive_id, lap)
+        if drive_lap is None:
+            raise HTTPException(status_code=404, detail=f"Unknown lap: {lap}")
+        start, end = drive_lap.start_time, drive_lap.end_time
+    
     safe_driver_name = re.sub(r"[^A-Za-z0-9_-]+", "_", drive.driver.name).strip("_") or "driver"
     formatted_date = drive.date.strftime("%Y%m%d_%H%M%S")
-    filename = f"{safe_driver_name}_{formatted_date}_drive_{drive.drive_id}.csv"
+    lap_suffix = f"_lap_{lap}" if lap is not None else ""
+    filename = f"{safe_driver_name}_{formatted_date}_drive_{drive.drive_id}{lap_suffix}.csv"
+
+    def build():
+        chunks = export.stream_copy_out(crud.drive_csv_copy_sql(drive_id, start, end))
+        if gzip:
+            return StreamingResponse(
+                export.gzip_chunks(chunks),
+                media_type="application/gzip",
+                headers={"Content-Disposition": f'attachment; filename="{filename}.gz"'},
+            )
+        return StreamingResponse(
+            chunks,
+            media_type="text/csv",
+            headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+        )
 
-    return StreamingResponse(
-        iter([csv_buffer.getvalue()]),
-        media_type="text/csv",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
-    )
+    return response_cache.cached_response(request, drive_id, "csv.gz" if gzip else "csv", build)
 
 @router.get("/sensors/{drive_id}", response_model=list[int])
-def get_unique_sensors_from_drive(drive_id: int, db: Session = Depends(get_db)):
-    sensors = crud.get_unique_sensors_from_drive(db, drive_id)
+def get_unique_sensors_from_drive(drive_id: int, request: Request, db: Session = Depends(get_db)):
+    def build():
+        sensors = crud.get_unique_sensors_from_drive(db, drive_id)
+
+        if not sensors:
+            raise HTTPException(status_code=404, detail="No sensors found for this drive")
+
+        # Extract the sensor IDs from the results
+        return JSONResponse([sensor_id[0] for sensor_id in sensors])
+
+    return response_cache.cached_response(request, drive_id, "json", build)
+
+
+@router.get("/sensors/{drive_id}/manifest", response_model=list[schemas.SensorManifest])
+def get_sensor_manifest_for_drive(drive_id: int, request: Request, db: Session = Depends(get_db)):
+    '''Every sensor of the drive with its sample count, time range and value range'''
+    def build():
+        manifest = crud.get_sensor_manifest(db, drive_id)
+
+        if not manifest:
+            raise HTTPException(status_code=404, detail="No sensors found for this drive")
+
+        return JSONResponse([
+            schemas.SensorManifest.model_validate(sensor, from_attributes=True).model_dump() for sensor in manifest
+        ])
+
+    return response_cache.cached_response(request, drive_id, "json", build)
+
+
+@router.get("/drive/{drive_id}/stats", response_model=list[schemas.SensorStats])
+def get_drive_sensor_stats(drive_id: int, request: Request, db: Session = Depends(get_db)):
+    '''Count, min, max, mean, stddev and percentiles of every decoded channel of every sensor, per tire /
+    axis for multiplexed messages. Live drives have everything but the percentiles, those come once the
+    drive closes.'''
+    def build():
+        stats = crud.get_channel_stats(db, drive_id)
+        if not stats and crud.get_unique_sensors_from_drive(db, drive_id) and not response_cache.cache.is_being_written(drive_id):
+            # Drive from before the channel statistics, computed once from raw_data. Drives being written
+            # get theirs from the next batch (drive_ingest.update_drive_summaries)
+            drive_ingest.rebuild_channel_stats(db, drive_id)
+            db.commit()
+            stats = crud.get_channel_stats(db, drive_id)
+
+        if not stats:
+            raise HTTPException(status_code=404, detail="No sensors found for this drive")
+
+        return JSONResponse([sensor_stats.stats_record(row) for row in stats])
+
+    return response_cache.cached_response(request, drive_id, "json", build)
+
 
-    if not sensors:
-        raise HTTPException(status_code=404, detail="No sensors found for this drive")
+@router.get("/drive/{drive_id}/laps", response_model=list[schemas.DriveLap])
+def get_drive_laps(drive_id: int, request: Request, db: Session = Depends(get_db)):
+    '''Lap index of the drive, each lap's range works as ?lap= on the data and export routes'''
+    def build():
+        return JSONResponse([
+            schemas.DriveLap.model_validate(lap, from_attributes=True).model_dump() for lap in crud.get_drive_laps(db, drive_id)
+        ])
 
-    # Extract the sensor IDs from the results
-    return [sensor_id[0] for sensor_id in sensors]
+    return response_cache.cached_response(request, drive_id, "json", build)
 
 
 @router.post("/drive", response_model=schemas.Drive)
@@ -111,71 +175,94 @@ def get_drives(db: Session = Depends(get_db)):
     drives = crud.get_drives(db)
     return drives
 
-@router.post("/drive/{drive_id}", response_model=dict)
-async def add_data_to_drive_from_file(
+# Declared before /drive/{drive_id} so "batch" isn't parsed as a drive id
+@router.post("/drive/batch", response_model=list[dict])
+def add_drives_from_files(
+    driver_id: int = Form(...),
+    notes: Optional[str] = Form(None),
+    date: Optional[datetime] = Form(None),
+    files: List[UploadFile] = File(...),  # CSVs / .bin logs and/or zip archives of them
+    db: Session = Depends(get_db)
+):
+    # Creates one drive per log file and ingests them in parallel worker processes.
+    # Returns one result per log file, in upload order. Every upload is checked, expanded and spooled
+    # before the first drive is created, so a bad file anywhere in the batch leaves no drives behind
+    if crud.get_driver(db, driver_id) is None:
+        raise HTTPException(status_code=404, detail="Driver not found")
+    for file in files:
+        if not batch_ingest.is_supported_upload(file.filename):
+            raise HTTPException(status_code=400, detail=f"Unsupported log file: {file.filename}")
+
+    drive_date = date or datetime.now(timezone.utc)
+    results: List[dict] = []
+    spooled: List[tuple] = [] # (filename, path, file_hash)
+    pending: List[tuple] = [] # (result, drive_id, path, file_format)
+
+    try:
+        for file in files:
+            for filename, source in batch_ingest.iter_log_sources(file.filename, file.file):
+                path, file_hash = batch_ingest.spool_to_temp_file(source)
+                spooled.append((filename, path, file_hash))
+
+        try:
+            for filename, path, file_hash in spooled:
+                result = {"filename": filename, "drive_id": None}
+                results.append(result)
+
+                if crud.get_drive_by_hash(db, file_hash):
+                    result.update(status="skipped", detail="Drive already uploaded")
+                    continue
+
+                drive = crud.create_drive(db=db, drive=schemas.DriveCreate(
+                    driver_id=driver_id, date=drive_date, notes=notes or filename, hash=file_hash
+                ))
+                result["drive_id"] = drive.drive_id
+                response_cache.cache.begin_write(drive.drive_id)
+                pending.append((result, drive.drive_id, path, drive_ingest.detect_format(filename)))
+        except Exception:
+            # Nothing has been ingested yet, don't leave the drives created so far behind
+            db.rollback()
+            for _, drive_id, _, _ in pending:
+                crud.delete_drive(db, crud.get_drive(db, drive_id))
+            raise
+
+        outcomes = batch_ingest.ingest_drives_in_parallel([job[1:] for job in pending])
+        for (result, *_), outcome in zip(pending, outcomes):
+            result.update(outcome)
+
+    except zipfile.BadZipFile as e:
+        raise HTTPException(status_code=400, detail=f"Invalid zip archive: {e}")
+    finally:
+        for _, drive_id, _, _ in pending:
+            response_cache.cache.end_write(drive_id)
+        for _, path, _ in spooled:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    return results
+
+@router.post("/drive/{drive_id}", response_model=dict, status_code=202)
+def add_data_to_drive_from_file(
     drive_id: int,  # Ensure this is passed as a proper dictionary in the request body
     db: Session = Depends(get_db),
-    file: UploadFile = File(...)  # Ensure file upload is set correctly
+    file: UploadFile = File(...),  # Ensure file upload is set correctly
+    format: Optional[str] = Query(None)  # "csv" or "bin" (raw 14 byte Pi records), default from file extension
 ):
-    try:
+    # Parsing and inserting happens in the background ingest worker pool. This only spools
+    # the upload and returns the job, poll /api/ingest/jobs/{job_id} for progress
+    drive = crud.get_drive(db, drive_id)
+    if not drive:
+        raise HTTPException(status_code=404, detail="Drive not found")
 
-        # Read the uploaded file's contents
-        contents = await file.read()
-
-        # Parse the CSV data using pandas
-        df = pd.read_csv(io.StringIO(contents.decode('utf-8')))
-
-        # Iterate through the rows of the CSV
-        for index, row in df.iterrows():
-            msg_id, time, *buffers = row[:10]  # Adjust as needed
-
-            if(msg_id >= 50 and  msg_id <= 54): ##HOT BOX CASE
-                db_data = models.RawData(
-                    drive_id=drive_id,
-                    msg_id=((msg_id * 10) + 0),
-                    raw_data=[buffers[0], buffers[1], 0, 0, 0, 0, 0, 0],
-                    time=time
-                )
-                db.add(db_data)
-                db_data = models.RawData(
-                    drive_id=drive_id,
-                    msg_id=((msg_id * 10) + 1),
-                    raw_data=[buffers[2], buffers[3], 0, 0, 0, 0, 0, 0],
-                    time=time
-                )
-                db.add(db_data)
-                db_data = models.RawData(
-                    drive_id=drive_id,
-                    msg_id=((msg_id * 10) + 2),
-                    raw_data=[buffers[4], buffers[5], 0, 0, 0, 0, 0, 0],
-                    time=time
-                )
-                db.add(db_data)
-
-            elif(msg_id == 4): #Accelerometer CASE
-                db_data = models.RawData(
-                    drive_id=drive_id,
-                    msg_id=(((msg_id) * 100) + buffers[0]),
-                    raw_data=[buffers[1],buffers[2], buffers[3], buffers[4], 0, 0, 0, 0],
-                    time=time
-                )
-                db.add(db_data)
-
-            else:
-                db_data = models.RawData(
-                    drive_id=drive_id, 
-                    msg_id=msg_id, 
-                    raw_data=buffers, 
-                    time=time
-                )
-                db.add(db_data)
-
-        # Commit all changes at once
-        db.commit()
+    file_format = format or drive_ingest.detect_format(file.filename)
+    if file_format not in drive_ingest.FILE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown upload format: {file_format}")
 
+    try:
+        job = ingest_jobs.manager.submit(drive_id, file.file, file.filename, file_format)
     except Exception as e:
-        db.rollback()
-        raise HTTPException(status_code=400, detail=f"Failed to insert data: {e}")
+        raise HTTPException(status_code=400, detail=f"Failed to queue upload: {e}")
     
-    return {"status": "success"}
-
+    return job.as_dict()
@@ -0,0 +1,30 @@
+# file: ingest.py
+# Desc: Endpoints for checking on and cancelling background drive upload (ingest) jobs
+
+from fastapi import APIRouter, HTTPException
+from typing import Optional
+from ..services import ingest_jobs
+
+
+router = APIRouter()
+
+
+@router.get("/ingest/jobs", response_model=list[dict])
+def get_ingest_jobs(drive_id: Optional[int] = None):
+    return [job.as_dict() for job in ingest_jobs.manager.list_jobs(drive_id)]
+
+
+@router.get("/ingest/jobs/{job_id}", response_model=dict)
+def get_ingest_job(job_id: str):
+    job = ingest_jobs.manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job.as_dict()
+
+
+@router.delete("/ingest/jobs/{job_id}", response_model=dict)
+def cancel_ingest_job(job_id: str):
+    job = ingest_jobs.manager.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Ingest job not found")
+    return job.as_dict()
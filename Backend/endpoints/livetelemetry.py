@@ -3,8 +3,8 @@
 # Desc: Our live telemetry WebSocket endpoint, based off of telemetry.py (the one from Claude)
 # Receives data from the Pi over /ws/send, decodes it, then sends to Frontend over /ws/livetelemetry and database
 
-from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
-from typing import List, Dict, Optional
+from fastapi import APIRouter, HTTPException, Query, WebSocket, WebSocketDisconnect
+from typing import List, Dict, Optional, Set
 import logging
 import asyncio
 import os
@@ -12,6 +12,7 @@ import uuid
 from datetime import datetime, timezone, timedelta
 from sqlalchemy.orm import Session
 from .. import crud, models, schemas
+from ..services import drive_ingest, live_clients, live_coalescer, live_writer, response_cache
 from ..services.livetelemetry_decoder import decode_pi_to_server, convert_decoded_can_data
 from ..database import SessionLocal
 
@@ -35,12 +36,17 @@ logger = logging.getLogger(__name__)
 
 class ConnectionManager:
     def __init__(self):
-        self.active_connections: List[WebSocket] = []
+        # Each client gets its own bounded queue and sender task, see services/live_clients.py
+        self.active_connections: Dict[WebSocket, live_clients.LiveClient] = {}
+        self._closing: Set[asyncio.Task] = set()
         
-    async def connect(self, websocket: WebSocket, client = True):
+    async def connect(self, websocket: WebSocket, client = True, overflow: str = live_clients.LIVE_CLIENT_OVERFLOW,
+                      live_format: str = live_clients.JSON_FORMAT, batch: bool = False):
         await websocket.accept()
         if client:
-            self.active_connections.append(websocket)
+            live_client = live_clients.LiveClient(websocket, self._sender_failed, overflow, live_format, batch)
+            live_client.start()
+            self.active_connections[websocket] = live_client
             logger.info(f"New client connection established. Total clients: {len(self.active_connections)}")
         if not client:
             await self.broadcast({
@@ -52,8 +58,9 @@ class ConnectionManager:
         
     async def disconnect(self, websocket: WebSocket, client = True):
         if client:
-            if websocket in self.active_connections:
-                self.active_connections.remove(websocket)
+            live_client = self.active_connections.pop(websocket, None)
+            if live_client is not None:
+                await live_client.close()
                 logger.info(f"Connection closed. Total clients: {len(self.active_connections)}")
         else:
             logger.info("Sender disconnected (/ws/send)")
@@ -63,29 +70,56 @@ class ConnectionManager:
                 "timestamp": datetime.now(timezone.utc).isoformat(),
                 "message": "Sender disconnected from WebSocket"
             })
-    
-    # Sends message to all connected clients. If a client is disconnected, removes it from the list.
-    async def broadcast(self, message: Dict):
-        disconnected: List[WebSocket] = []
-
-        for conn in self.active_connections:
-            try:
-                await conn.send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending to client: {e}")
-                disconnected.append(conn)
 
-        # Clean up dead connections
-        for conn in disconnected:
-            await self.disconnect(conn)
+    # Sends message to one client, through its queue so it never interleaves with broadcasts
+    async def send(self, websocket: WebSocket, message: Dict):
+        live_client = self.active_connections.get(websocket)
+        if live_client is not None:
+            live_client.enqueue(live_clients.encode_frame(message, live_client.live_format), live_clients.latest_key(message))
+    
+    # Queues message for all connected clients without waiting on any of them. Clients that fell too far behind are disconnected.
+    # batch=True / False only reaches clients that did / didn't opt into coalesced telemetry (?batch=1)
+    async def broadcast(self, message: Dict, batch: Optional[bool] = None):
+        # Encoded once per feed format, every client of that format gets the same frame
+        frames: Dict[str, live_clients.Frame] = {}
+        key = live_clients.latest_key(message)
+        lagging: List[live_clients.LiveClient] = []
+        for live_client in self.active_connections.values():
+            if batch is not None and live_client.batch != batch:
+                continue
+            if live_client.overflow == live_clients.LATEST and message.get("type") == "telemetry_batch":
+                # Merged into the client's pending batch per msg_id instead of queueing whole batches
+                if not live_client.enqueue_batch(message):
+                    lagging.append(live_client)
+                continue
+            frame = frames.get(live_client.live_format)
+            if frame is None:
+                frame = frames[live_client.live_format] = live_clients.encode_frame(message, live_client.live_format)
+            if not live_client.enqueue(frame, key):
+                lagging.append(live_client)
+
+        for live_client in lagging:
+            logger.warning("Disconnecting lagging client: %s", live_client.stats())
+            self.active_connections.pop(live_client.websocket, None)
+            # Closing waits on the client too, so it happens off the broadcast path
+            task = asyncio.create_task(live_client.close(live_clients.LAGGING_CLOSE_CODE))
+            self._closing.add(task)
+            task.add_done_callback(self._closing.discard)
+
+    def _sender_failed(self, live_client: live_clients.LiveClient):
+        # Dead socket, websocket_endpoint's receive loop notices too and calls disconnect (a no-op by then)
+        self.active_connections.pop(live_client.websocket, None)
+        logger.info(f"Connection closed. Total clients: {len(self.active_connections)}")
+
+    def has_batch_clients(self) -> bool:
+        return any(live_client.batch for live_client in self.active_connections.values())
+
+    def stats(self) -> List[Dict]:
+        return [live_client.stats() for live_client in self.active_connections.values()]
 
 
 # ========== Functions for adding data to database ===========
 
-def normalize_raw_data(raw_data: List[int]) -> List[int]:
-    # Analysis pipeline expects 8-byte payload-style arrays.
-    return (raw_data + [0] * 8)[:8]
-
 def get_or_create_default_driver_id(db: Session) -> int:
     driver = crud.get_driver(db, DEFAULT_LIVE_DRIVER_ID)
     if driver is not None:
@@ -136,27 +170,22 @@ def create_live_drive(db: Session) -> models.Drive:
         notes=AUTO_DRIVE_NOTE,
         hash=f"live-{uuid.uuid4().hex}"
     )
-    return crud.create_drive(db=db, drive=drive)
-
-def persist_live_packet(db: Session, drive_id: int, decoded_packet: Dict):
-    db_row = models.RawData(
-        drive_id=drive_id,
-        msg_id=decoded_packet["id"],
-        raw_data=normalize_raw_data(decoded_packet["bytes"]),
-        time=decoded_packet["timestamp"]
-    )
-    db.add(db_row)
-    db.commit()
+    db_drive = crud.create_drive(db=db, drive=drive)
+    # Rows keep arriving until finalize_live_drive, don't cache its responses before then
+    response_cache.cache.begin_write(db_drive.drive_id)
+    return db_drive
 
 
 # ========== Websocket Handlers ===========
 
 manager = ConnectionManager()
+# Telemetry from /ws/send goes out as one batch per tick to clients that asked for it (?batch=1), see services/live_coalescer.py
+coalescer = live_coalescer.TickCoalescer(lambda message: manager.broadcast(message, batch=True))
 
 # Reconnect state
 _pi_live_drive: Optional[models.Drive] = None
 _pi_db: Optional[Session] = None
-_pi_packets_written: int = 0
+_pi_writer: Optional[live_writer.LiveWriter] = None
 _pi_reconnect_task: Optional[asyncio.Task] = None
 RECONNECT_TIMEOUT_SEC = 5
 
@@ -183,7 +212,7 @@ def update_database_enabled(enabled: bool) -> bool:
 
 
 def reset_pi_state(close_db: bool = False):
-    global _pi_db, _pi_live_drive, _pi_packets_written, _pi_reconnect_task
+    global _pi_db, _pi_live_drive, _pi_writer, _pi_reconnect_task
 
     if close_db and _pi_db is not None:
         try:
@@ -193,10 +222,43 @@ def reset_pi_state(close_db: bool = False):
 
     _pi_db = None
     _pi_live_drive = None
-    _pi_packets_written = 0
+    _pi_writer = None
     _pi_reconnect_task = None
 
 
+def finalize_live_drive(drive_id: int):
+    '''Live drive is closed for good, summarize it like a finished upload (runs in a worker thread)'''
+    db = SessionLocal()
+    try:
+        drive_ingest.finalize_drive(db, drive_id)
+    except Exception as exc:
+        db.rollback()
+        logger.error("Failed to finalize live drive_id=%s: %s", drive_id, exc)
+    finally:
+        db.close()
+        response_cache.cache.end_write(drive_id)
+
+
+@router.get("/livetelemetry/writer", response_model=dict)
+def get_live_writer_stats():
+    '''Write-behind queue depth, flush latency and counters of the live drive being recorded'''
+    if _pi_writer is None:
+        raise HTTPException(status_code=404, detail="No live drive is being recorded")
+    return _pi_writer.stats()
+
+
+@router.get("/livetelemetry/clients", response_model=list[dict])
+def get_live_clients():
+    '''Send queue depth, lag and sent / dropped counters of every connected dashboard'''
+    return manager.stats()
+
+
+@router.get("/livetelemetry/coalescer", response_model=dict)
+def get_live_coalescer_stats():
+    '''Tick length and messages in / out, batches and mean batch size of the live feed coalescing'''
+    return coalescer.stats()
+
+
 @router.get("/livetelemetry/db")
 def get_live_db_state():
     return get_database_state_payload()
@@ -209,23 +271,31 @@ async def set_live_db_state(enabled: bool = Query(...)):
     return get_database_state_payload()
 
 @router.websocket("/ws/livetelemetry") # handler for connecting to client for sending data to Frontend
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def websocket_endpoint(websocket: WebSocket, overflow: str = Query(live_clients.LIVE_CLIENT_OVERFLOW),
+                             live_format: str = Query(live_clients.JSON_FORMAT, alias="format"),
+                             batch: bool = Query(False)):
+    if overflow not in live_clients.OVERFLOW_POLICIES:
+        await websocket.close(code=1008, reason=f"Unknown overflow policy: {overflow}")
+        return
+    if live_format not in live_clients.LIVE_FORMATS:
+        await websocket.close(code=1008, reason=f"Unknown live feed format: {live_format}")
+        return
+    await manager.connect(websocket, overflow=overflow, live_format=live_format, batch=batch)
     logger.info("Client connected to live telemetry WebSocket")
     try:
-        await websocket.send_json({
+        await manager.send(websocket, {
             "type": "connection",
             "status": "connected",
             "timestamp": datetime.now(timezone.utc).isoformat(),
             "message": "Connected to live telemetry WebSocket"
         })
-        await websocket.send_json(get_database_state_payload())
+        await manager.send(websocket, get_database_state_payload())
         
         while True:
             # For testing
             msg = await websocket.receive_json()
             if msg.get("type") == "ping":
-                await websocket.send_json({"type": "pong"})
+                await manager.send(websocket, {"type": "pong"})
             
             # "type": "db",
             # "enabled": bool",
@@ -235,7 +305,7 @@ async def websocket_endpoint(websocket: WebSocket):
                 enabled = msg.get("database_enabled", msg.get("enabled"))
                 if isinstance(enabled, bool):
                     update_database_enabled(enabled)
-                await websocket.send_json(get_database_state_payload())
+                await manager.send(websocket, get_database_state_payload())
                 await broadcast_database_state()
     except WebSocketDisconnect:
         pass
@@ -248,12 +318,13 @@ async def websocket_endpoint(websocket: WebSocket):
 @router.websocket("/ws/send") # handler for data from pi
 async def websocket_sendpoint(websocket: WebSocket):
     '''WS handler for data sent from pi'''
-    global _pi_live_drive, _pi_db, _pi_packets_written, _pi_reconnect_task
+    global _pi_live_drive, _pi_db, _pi_writer, _pi_reconnect_task
     await manager.connect(websocket, client=False)
     logger.info("Pi connected to send telemetry WebSocket")
 
     db: Optional[Session] = None
     live_drive: Optional[models.Drive] = None
+    writer: Optional[live_writer.LiveWriter] = None
 
     if (
         _pi_reconnect_task
@@ -264,11 +335,12 @@ async def websocket_sendpoint(websocket: WebSocket):
         _pi_reconnect_task.cancel()
         _pi_reconnect_task = None
         logger.info("Pi reconnected within window, resuming drive_id=%s", _pi_live_drive.drive_id)
-        db, live_drive = _pi_db, _pi_live_drive
+        db, live_drive, writer = _pi_db, _pi_live_drive, _pi_writer
     else:
         db = SessionLocal()
         try:
             live_drive = create_live_drive(db)
+            writer = live_writer.LiveWriter(live_drive.drive_id)
             logger.info(
                 "Live telemetry drive started: drive_id=%s driver_id=%s",
                 live_drive.drive_id,
@@ -280,7 +352,7 @@ async def websocket_sendpoint(websocket: WebSocket):
             db = None
             live_drive = None
 
-        _pi_db, _pi_live_drive, _pi_packets_written = db, live_drive, 0
+        _pi_db, _pi_live_drive, _pi_writer = db, live_drive, writer
 
     if live_drive is not None:
         await manager.broadcast({
@@ -301,7 +373,8 @@ async def websocket_sendpoint(websocket: WebSocket):
                     db = SessionLocal()
                     try:
                         live_drive = create_live_drive(db)
-                        _pi_db, _pi_live_drive, _pi_packets_written = db, live_drive, 0
+                        writer = live_writer.LiveWriter(live_drive.drive_id)
+                        _pi_db, _pi_live_drive, _pi_writer = db, live_drive, writer
                         await manager.broadcast({
                             "type": "drive",
                             "status": "started",
@@ -314,22 +387,18 @@ async def websocket_sendpoint(websocket: WebSocket):
                         db.close()
                         db = None
                         live_drive = None
-                        _pi_db, _pi_live_drive = None, None
+                        writer = None
+                        _pi_db, _pi_live_drive, _pi_writer = None, None, None
 
-                if db is not None and live_drive is not None:
-                    try:
-                        persist_live_packet(db, live_drive.drive_id, decoded_packet)
-                        _pi_packets_written += 1
-                    except Exception as exc:
-                        db.rollback()
-                        logger.error(
-                            "Failed to persist live telemetry packet for drive_id=%s: %s",
-                            live_drive.drive_id,
-                            exc
-                        )
+                if writer is not None:
+                    # Written in batches by the drive's writer thread, see services/live_writer.py
+                    writer.submit(decoded_packet["id"], decoded_packet["timestamp"], decoded_packet["bytes"])
 
             sensor_data = convert_decoded_can_data(decoded_packet)
-            await manager.broadcast(sensor_data)
+            # One message per frame unless the client opted into batches
+            await manager.broadcast(sensor_data, batch=False)
+            if manager.has_batch_clients():
+                await coalescer.add(sensor_data)
     
     except WebSocketDisconnect:
         pass
@@ -338,6 +407,8 @@ async def websocket_sendpoint(websocket: WebSocket):
             db.rollback()
         logger.error(f"SendTelemetry webSocket error: {e}")
     finally:
+        # Last partial tick goes out before the "disconnected" status
+        await coalescer.close()
         await manager.disconnect(websocket, client=False)
         if db is None or live_drive is None:
             reset_pi_state(close_db=True)
@@ -345,17 +416,21 @@ async def websocket_sendpoint(websocket: WebSocket):
 
         logger.info("Pi disconnecting, attempting to reconnect within %ss", RECONNECT_TIMEOUT_SEC)
 
-        async def wait_for_reconnect(drive_id: int):
+        async def wait_for_reconnect(drive_id: int, writer: live_writer.LiveWriter):
             try:
+                # Everything received so far goes to disk while we wait for the Pi
+                await asyncio.to_thread(writer.flush)
                 await asyncio.sleep(RECONNECT_TIMEOUT_SEC)
+                reset_pi_state(close_db=True)
+                await asyncio.to_thread(writer.close)
                 logger.info(
                     "Reconnect timer expired, closing drive_id=%s with %s packets written",
                     drive_id,
-                    _pi_packets_written
+                    writer.packets_written
                 )
-                reset_pi_state(close_db=True)
+                await asyncio.to_thread(finalize_live_drive, drive_id)
             except asyncio.CancelledError:
                 logger.info("Reconnect timer cancelled for drive_id=%s", drive_id)
                 raise
 
-        _pi_reconnect_task = asyncio.create_task(wait_for_reconnect(live_drive.drive_id))
+        _pi_reconnect_task = asyncio.create_task(wait_for_reconnect(live_drive.drive_id, writer))
@@ -2,7 +2,7 @@
 # Desc: Main FastAPI app, runs on startup. Sets up endpoints, db, and connects to frontend
 
 from fastapi import FastAPI
-from .endpoints import drive, driver, data, livetelemetry
+from .endpoints import cache, drive, driver, data, livetelemetry, ingest
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 from fastapi.staticfiles import StaticFiles
@@ -11,7 +11,7 @@ from .configDB import DATABASE_URL
 from starlette.exceptions import HTTPException as StarletteHTTPException
 from typing import Union
 
-from . import crud, models, schemas
+from . import crud, migrations, models, schemas
 from .database import SessionLocal, engine
 
 BASE_DIR = Path(__file__).resolve().parent  # Backend/
@@ -22,6 +22,12 @@ try:
 except Exception as e:
     print(f"Warning: Could not create database tables: {e}")
 
+# Bring tables created by older versions up to date with models.py
+try:
+    migrations.run_migrations(engine)
+except Exception as e:
+    print(f"Warning: Could not run database migrations: {e}")
+
 #fastapi dev main.py
 
 app = FastAPI()
@@ -32,6 +38,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],  
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 def get_db():
@@ -51,6 +58,8 @@ app.include_router(drive.router, prefix="/api")
 app.include_router(driver.router, prefix="/api")
 app.include_router(data.router, prefix="/api")
 app.include_router(livetelemetry.router, prefix="/api")
+app.include_router(ingest.router, prefix="/api")
+app.include_router(cache.router, prefix="/api")
 
 class SPAStaticFiles(StaticFiles):
     async def get_response(self, path: str, scope) -> (FileResponse | Response):
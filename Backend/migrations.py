@@ -0,0 +1,210 @@
+# file: migrations.py
+# Desc: Versioned schema migrations for databases created before a model change.
+# create_all builds new databases straight from models.py; these bring existing ones up to date.
+# Every step checks the current schema first, so on a fresh database it's a no-op that just gets recorded.
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection, Engine
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Arbitrary key so only one app process migrates at a time
+MIGRATION_LOCK_KEY = 20240207
+
+
+# ========== Helpers ===========
+
+def column_type(conn: Connection, table: str, column: str):
+    return conn.execute(
+        text(
+            "SELECT data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = :table AND column_name = :column"
+        ),
+        {"table": table, "column": column}
+    ).scalar()
+
+
+# ========== Migrations ===========
+
+def pack_raw_data_payload(conn: Connection):
+    '''raw_data.raw_data int[] -> raw_data.payload bigint (little-endian, byte 0 lowest).
+    ALTER ... TYPE rewrites the table once, so the old array storage is reclaimed.'''
+    if column_type(conn, "raw_data", "raw_data") != "ARRAY":
+        return
+
+    packed = " | ".join(
+        f"((coalesce(raw_data[{i + 1}], 0)::bigint & 255) << {8 * i})" for i in range(8)
+    )
+    conn.execute(text(f"ALTER TABLE raw_data ALTER COLUMN raw_data TYPE bigint USING ({packed})"))
+    conn.execute(text("ALTER TABLE raw_data RENAME COLUMN raw_data TO payload"))
+
+
+def add_raw_data_lookup_index(conn: Connection):
+    # Same index models.RawData declares, for tables create_all made before it existed
+    conn.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_raw_data_drive_msg_time "
+        "ON raw_data (drive_id, msg_id, time) INCLUDE (data_id, payload)"
+    ))
+
+
+def partition_raw_data_by_drive(conn: Connection):
+    '''Rebuild raw_data as a LIST (drive_id) partitioned table with one partition per drive,
+    matching models.RawData. Rows are copied over and the old heap is dropped.'''
+    is_partitioned = conn.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('raw_data'))"
+    )).scalar()
+    if is_partitioned:
+        return
+
+    old_sequence = conn.execute(text("SELECT pg_get_serial_sequence('raw_data', 'data_id')")).scalar()
+    conn.execute(text("ALTER TABLE raw_data RENAME TO raw_data_unpartitioned"))
+    conn.execute(text("ALTER INDEX IF EXISTS raw_data_pkey RENAME TO raw_data_unpartitioned_pkey"))
+    conn.execute(text(
+        "ALTER INDEX IF EXISTS ix_raw_data_drive_msg_time RENAME TO ix_raw_data_unpartitioned_drive_msg_time"
+    ))
+    if old_sequence:
+        conn.execute(text(f"ALTER SEQUENCE {old_sequence} RENAME TO raw_data_unpartitioned_data_id_seq"))
+
+    conn.execute(text(
+        "CREATE TABLE raw_data ("
+        "data_id SERIAL NOT NULL, "
+        "drive_id INTEGER NOT NULL, "
+        "msg_id INTEGER, "
+        "time INTEGER, "
+        "payload BIGINT, "
+        "PRIMARY KEY (data_id, drive_id)"
+        ") PARTITION BY LIST (drive_id)"
+    ))
+    drive_ids = conn.execute(text(
+        "SELECT drive_id FROM drive UNION SELECT DISTINCT drive_id FROM raw_data_unpartitioned "
+        "WHERE drive_id IS NOT NULL"
+    )).scalars()
+    for drive_id in drive_ids:
+        conn.execute(text(
+            f"CREATE TABLE raw_data_drive_{int(drive_id)} PARTITION OF raw_data FOR VALUES IN ({int(drive_id)})"
+        ))
+
+    conn.execute(text(
+        "INSERT INTO raw_data (data_id, drive_id, msg_id, time, payload) "
+        "SELECT data_id, drive_id, msg_id, time, payload FROM raw_data_unpartitioned "
+        "WHERE drive_id IS NOT NULL"
+    ))
+    # Index after the copy, it's much faster than maintaining it row by row
+    add_raw_data_lookup_index(conn)
+    conn.execute(text(
+        "SELECT setval(pg_get_serial_sequence('raw_data', 'data_id'), "
+        "(SELECT coalesce(max(data_id), 0) + 1 FROM raw_data), false)"
+    ))
+    conn.execute(text("DROP TABLE raw_data_unpartitioned"))
+
+
+def add_raw_data_time_index(conn: Connection):
+    # Same index models.RawData declares, created on the partitioned parent so every partition gets one
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_raw_data_time_data_id ON raw_data (time, data_id)"))
+
+
+def backfill_sensor_manifest(conn: Connection):
+    '''Fill sensor_manifest (created by create_all) for drives ingested before it existed. Every pyramid
+    level covers all of a sensor's samples, so the top level alone has the counts and ranges.
+    Drives without a pyramid get theirs from raw_data (backfill_sensor_manifest_from_raw_data).'''
+    conn.execute(text(
+        "INSERT INTO sensor_manifest (drive_id, msg_id, sample_count, first_time, last_time, min_value, max_value) "
+        "SELECT p.drive_id, p.msg_id, sum(p.sample_count), min(p.first_time), max(p.last_time), "
+        "min(p.min_value), max(p.max_value) "
+        "FROM sensor_pyramid p "
+        "JOIN (SELECT drive_id, msg_id, max(level) AS level FROM sensor_pyramid GROUP BY drive_id, msg_id) top "
+        "USING (drive_id, msg_id, level) "
+        "GROUP BY p.drive_id, p.msg_id "
+        "ON CONFLICT (drive_id, msg_id) DO NOTHING"
+    ))
+    backfill_sensor_manifest_from_raw_data(conn)
+
+
+def backfill_sensor_manifest_from_raw_data(conn: Connection):
+    '''Sample counts and time ranges for drives that still have no sensor_manifest rows (no pyramid either),
+    so listing their sensors and their detail work straight after the deploy. Value ranges and statistics
+    need the decoded values and stay NULL until scripts/backfill_drive_summaries.py rebuilds the drive.'''
+    conn.execute(text(
+        "INSERT INTO sensor_manifest (drive_id, msg_id, sample_count, first_time, last_time) "
+        "SELECT drive_id, msg_id, count(*), min(time), max(time) "
+        "FROM raw_data "
+        "WHERE msg_id IS NOT NULL AND drive_id NOT IN (SELECT DISTINCT drive_id FROM sensor_manifest) "
+        "GROUP BY 1, 2 "
+        "ON CONFLICT (drive_id, msg_id) DO NOTHING"
+    ))
+
+
+def add_sensor_manifest_stats(conn: Connection):
+    '''Statistics columns added to sensor_manifest after it was first created. Existing rows get their
+    statistics from scripts/backfill_drive_summaries.py'''
+    columns = ["mean_value", "m2_value", "p1", "p5", "p25", "p50", "p75", "p95", "p99"]
+    conn.execute(text(
+        "ALTER TABLE sensor_manifest "
+        + ", ".join(f"ADD COLUMN IF NOT EXISTS {column} DOUBLE PRECISION" for column in columns)
+    ))
+
+
+def backfill_drive_laps(conn: Connection):
+    '''Lap index (drive_lap, created by create_all) for drives ingested before it existed,
+    same bounds as crud.rebuild_drive_laps'''
+    conn.execute(text(
+        "INSERT INTO drive_lap (drive_id, lap, start_time, end_time, duration) "
+        "SELECT drive_id, lap, start_time, end_time, end_time - start_time + 1 FROM ("
+        "  SELECT laps.drive_id, lap, start_time, coalesce("
+        "    lead(start_time) OVER (PARTITION BY laps.drive_id ORDER BY start_time) - 1, "
+        "    drive_end.last_time, laps.last_seen"
+        "  ) AS end_time "
+        "  FROM (SELECT drive_id, (payload & 255)::integer AS lap, min(time) AS start_time, max(time) AS last_seen "
+        "        FROM raw_data WHERE msg_id = 10 GROUP BY 1, 2) AS laps "
+        "  LEFT JOIN (SELECT drive_id, max(last_time) AS last_time FROM sensor_manifest GROUP BY 1) AS drive_end "
+        "  ON drive_end.drive_id = laps.drive_id"
+        ") AS bounded "
+        "ON CONFLICT (drive_id, lap) DO NOTHING"
+    ))
+
+
+def drop_sensor_manifest_stats(conn: Connection):
+    '''Statistics moved from sensor_manifest to sensor_channel_stats (created by create_all), one row per
+    decoded channel. Drives get theirs on finalize, their next batch or the first /drive/{id}/stats read'''
+    columns = ["mean_value", "m2_value", "p1", "p5", "p25", "p50", "p75", "p95", "p99"]
+    conn.execute(text(
+        "ALTER TABLE sensor_manifest "
+        + ", ".join(f"DROP COLUMN IF EXISTS {column}" for column in columns)
+    ))
+
+
+# (version, description, function) in the order they're applied. Never renumber or remove entries.
+MIGRATIONS = [
+    (1, "Pack raw_data payload arrays into a bigint column", pack_raw_data_payload),
+    (2, "Covering (drive_id, msg_id, time) index on raw_data", add_raw_data_lookup_index),
+    (3, "Partition raw_data by drive_id", partition_raw_data_by_drive),
+    (4, "(time, data_id) keyset index on raw_data", add_raw_data_time_index),
+    (5, "Backfill sensor_manifest from sensor pyramids", backfill_sensor_manifest),
+    (6, "Statistics columns on sensor_manifest", add_sensor_manifest_stats),
+    (7, "Backfill drive_lap from lap number frames", backfill_drive_laps),
+    (8, "Backfill sensor_manifest from raw_data for drives without a pyramid", backfill_sensor_manifest_from_raw_data),
+    (9, "Move sensor statistics to per-channel sensor_channel_stats", drop_sensor_manifest_stats),
+]
+
+
+def run_migrations(engine: Engine):
+    with engine.begin() as conn:
+        conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        conn.execute(text(
+            "CREATE TABLE IF NOT EXISTS schema_migrations ("
+            "version INTEGER PRIMARY KEY, "
+            "description VARCHAR, "
+            "applied_at TIMESTAMPTZ NOT NULL DEFAULT now())"
+        ))
+        applied = set(conn.execute(text("SELECT version FROM schema_migrations")).scalars())
+
+        for version, description, migrate in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info("Applying migration %s: %s", version, description)
+            migrate(conn)
+            conn.execute(
+                text("INSERT INTO schema_migrations (version, description) VALUES (:version, :description)"),
+                {"version": version, "description": description}
+            )
@@ -1,10 +1,34 @@
-from sqlalchemy import Boolean, Column, ForeignKey, Integer, String, DateTime
+from sqlalchemy import BigInteger, Boolean, Column, Float, ForeignKey, Index, Integer, SmallInteger, String, DateTime
 from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.types import TypeDecorator
 
 from .database import Base
 
 
+PAYLOAD_BYTES = 8
+
+def pack_payload(raw_data):
+    # [b0, ..., b7] -> signed little-endian int64 (b0 is the low byte). Short lists are zero padded
+    padded = (list(raw_data) + [0] * PAYLOAD_BYTES)[:PAYLOAD_BYTES]
+    return int.from_bytes(bytes(padded), byteorder="little", signed=True)
+
+def unpack_payload(payload):
+    return list(payload.to_bytes(PAYLOAD_BYTES, byteorder="little", signed=True))
+
+
+class PackedPayload(TypeDecorator):
+    '''Stores an 8 byte CAN payload as one fixed-width BIGINT instead of an int[] array,
+    while the ORM attribute stays a list of 8 ints'''
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else pack_payload(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else unpack_payload(value)
+
+
 class Driver(Base):
     __tablename__ = "drivers"
     driver_id = Column(Integer, primary_key=True)
@@ -26,18 +50,125 @@ class Drive(Base):
     driver = relationship("Driver", back_populates="drives")
 
 
-    raw_data = relationship("RawData", back_populates="drive")
+    # No FK on raw_data (see RawData), so the join is spelled out
+    raw_data = relationship(
+        "RawData",
+        back_populates="drive",
+        primaryjoin="Drive.drive_id == foreign(RawData.drive_id)"
+    )
 
 
 
 
 class RawData(Base):
     __tablename__ = "raw_data"
-    data_id = Column(Integer, primary_key=True)
-    drive_id = Column(Integer, ForeignKey("drive.drive_id"))
+    __table_args__ = (
+        # Every read filters drive_id (+ msg_id) and orders by time. INCLUDE makes it covering,
+        # so chart / sensor queries are index-only scans. Existing databases get it from migration 2
+        Index(
+            "ix_raw_data_drive_msg_time",
+            "drive_id",
+            "msg_id",
+            "time",
+            postgresql_include=["data_id", "payload"],
+        ),
+        # Keyset pagination over a whole drive in (time, data_id) order, see crud.raw_data_page_query.
+        # Existing databases get it from migration 4
+        Index("ix_raw_data_time_data_id", "time", "data_id"),
+        # One LIST partition per drive (raw_data_drive_<id>), made by crud.create_drive and dropped
+        # by crud.delete_drive. Existing databases are converted by migration 3
+        {"postgresql_partition_by": "LIST (drive_id)"},
+    )
+    # Partition key has to be part of the primary key. No FK to drive: a drive's partition only
+    # exists while the drive does, and skipping the per-row FK check keeps COPY ingest fast
+    data_id = Column(Integer, primary_key=True, autoincrement=True)
+    drive_id = Column(Integer, primary_key=True)
     msg_id = Column(Integer)
-    raw_data = Column(ARRAY(Integer))
     time = Column(Integer)
+    # Column is "payload" in the table, 8 bytes packed into a bigint (see PackedPayload)
+    raw_data = Column("payload", PackedPayload)
 
 
-    drive = relationship("Drive", back_populates="raw_data")
\ No newline at end of file
+    drive = relationship(
+        "Drive",
+        back_populates="raw_data",
+        primaryjoin="Drive.drive_id == foreign(RawData.drive_id)"
+    )
+
+class SensorPyramid(Base):
+    # Min/max downsampling pyramid, built per (drive, sensor) when a drive finishes ingesting.
+    # Level L buckets cover 2^L time units: bucket b spans [b << L, (b + 1) << L).
+    # Each bucket keeps the actual first / last / min / max samples so spikes survive any zoom level
+    __tablename__ = "sensor_pyramid"
+
+    drive_id = Column(Integer, primary_key=True)
+    msg_id = Column(Integer, primary_key=True)
+    level = Column(SmallInteger, primary_key=True)
+    bucket = Column(BigInteger, primary_key=True)
+    sample_count = Column(Integer)
+    min_value = Column(Float)
+    max_value = Column(Float)
+
+    first_data_id = Column(Integer)
+    first_time = Column(Integer)
+    first_payload = Column(BigInteger)
+    last_data_id = Column(Integer)
+    last_time = Column(Integer)
+    last_payload = Column(BigInteger)
+    min_data_id = Column(Integer)
+    min_time = Column(Integer)
+    min_payload = Column(BigInteger)
+    max_data_id = Column(Integer)
+    max_time = Column(Integer)
+    max_payload = Column(BigInteger)
+
+class SensorManifest(Base):
+    # One row per (drive, sensor), kept up to date as rows are written (uploads, live packets)
+    # so listing a drive's sensors and their ranges never has to scan raw_data. min / max are the chart channel's
+    __tablename__ = "sensor_manifest"
+
+    drive_id = Column(Integer, primary_key=True)
+    msg_id = Column(Integer, primary_key=True)
+    sample_count = Column(BigInteger)
+    first_time = Column(Integer)
+    last_time = Column(Integer)
+    min_value = Column(Float)
+    max_value = Column(Float)
+
+class SensorChannelStats(Base):
+    # Statistics of every decoded channel of a drive's sensor, one row per selector value (tire, axis) for
+    # multiplexed messages, selector -1 otherwise. Kept up to date as rows are written like the manifest.
+    # See services/sensor_stats.py for how they are maintained
+    __tablename__ = "sensor_channel_stats"
+
+    drive_id = Column(Integer, primary_key=True)
+    msg_id = Column(Integer, primary_key=True)
+    channel = Column(String, primary_key=True)
+    selector = Column(Integer, primary_key=True)
+    sample_count = Column(BigInteger)
+    first_time = Column(Integer)
+    last_time = Column(Integer)
+    min_value = Column(Float)
+    max_value = Column(Float)
+    mean_value = Column(Float)
+    m2_value = Column(Float) # sum of squared deviations from the mean, for the variance
+    # Percentiles of the decoded values, NULL until the drive is finalized
+    p1 = Column(Float)
+    p5 = Column(Float)
+    p25 = Column(Float)
+    p50 = Column(Float)
+    p75 = Column(Float)
+    p95 = Column(Float)
+    p99 = Column(Float)
+
+class DriveLap(Base):
+    # Lap index from the lap number frames (msg_id 10, lap number in byte 0). A lap runs from its first
+    # lap frame to just before the next lap's first one, the last lap to the drive's last sample.
+    # Live drives only know the last lap frame seen so far, finalize_drive closes the gaps
+    __tablename__ = "drive_lap"
+
+    drive_id = Column(Integer, primary_key=True)
+    lap = Column(Integer, primary_key=True)
+    start_time = Column(Integer)
+    end_time = Column(Integer) # inclusive
+    duration = Column(Integer)
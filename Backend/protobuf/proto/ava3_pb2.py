@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10proto/ava3.proto\x12\x04\x61va3\"a\n\tTelemetry\x12\x12\n\x04type\x18\x01 \x01(\tR\x04type\x12\x1c\n\ttimestamp\x18\x02 \x01(\tR\ttimestamp\x12\x0e\n\x02id\x18\x03 \x01(\rR\x02id\x12\x12\n\x04\x64\x61ta\x18\x04 \x03(\tR\x04\x64\x61tab\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x10proto/ava3.proto\x12\x04\x61va3\"a\n\tTelemetry\x12\x12\n\x04type\x18\x01 \x01(\tR\x04type\x12\x1c\n\ttimestamp\x18\x02 \x01(\tR\ttimestamp\x12\x0e\n\x02id\x18\x03 \x01(\rR\x02id\x12\x12\n\x04\x64\x61ta\x18\x04 \x03(\tR\x04\x64\x61ta\";\n\x0eTelemetryBatch\x12)\n\x07samples\x18\x01 \x03(\x0b\x32\x0f.ava3.TelemetryR\x07samplesb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -33,4 +33,6 @@ if not _descriptor._USE_C_DESCRIPTORS:
   DESCRIPTOR._loaded_options = None
   _globals['_TELEMETRY']._serialized_start=26
   _globals['_TELEMETRY']._serialized_end=123
+  _globals['_TELEMETRYBATCH']._serialized_start=125
+  _globals['_TELEMETRYBATCH']._serialized_end=184
 # @@protoc_insertion_point(module_scope)
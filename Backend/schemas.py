@@ -2,7 +2,7 @@
 # Desc: Pydantic schemas for database models
 
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 
@@ -43,6 +43,65 @@ class Drive(DriveBase):
     class Config:
         orm_mode = True
         
+# Schema for a drive's per-sensor manifest (sample count, time range and value range)
+class SensorManifest(BaseModel):
+    msg_id: int
+    sample_count: int
+    first_time: int
+    last_time: int
+    # None for drives from before the manifest until their summaries are rebuilt
+    min_value: Optional[float] = None
+    max_value: Optional[float] = None
+
+    class Config:
+        orm_mode = True
+
+# Schema for the statistics of one decoded channel of a sensor over a drive (per tire etc. for
+# multiplexed messages, selector_channel / selector say which), see services/sensor_stats.py
+class SensorStats(BaseModel):
+    msg_id: int
+    channel: str
+    unit: str
+    selector_channel: Optional[str] = None
+    selector: Optional[int] = None
+    count: int
+    first_time: int
+    last_time: int
+    min: float
+    max: float
+    mean: Optional[float] = None
+    stddev: Optional[float] = None
+    percentiles: Optional[Dict[str, float]] = None
+
+# Schema for one lap of a drive, times are inclusive
+class DriveLap(BaseModel):
+    lap: int
+    start_time: int
+    end_time: int
+    duration: int
+
+    class Config:
+        orm_mode = True
+
+# Schemas for the CAN channel registry (services/can_channels.py) and decoded channel series
+class ChannelInfo(BaseModel):
+    name: str
+    unit: str
+
+class MessageChannels(BaseModel):
+    msg_id: int
+    name: str
+    chart: str
+    selector: Optional[str] = None
+    channels: List[ChannelInfo]
+
+class ChannelSeries(BaseModel):
+    msg_id: int
+    name: str
+    units: Dict[str, str]
+    time: List[int]
+    channels: Dict[str, List[float]]
+
 # Schema for deleting drives; the drive_id is included in the url
 class DeleteDriveRequest(BaseModel):
     password: str
@@ -80,3 +139,19 @@ class DriveSimple(BaseModel):
     class Config:
         orm_mode = True
 
+# Drive metadata without its raw data, counts and time range come from the sensor manifest
+class DriveDetail(BaseModel):
+    drive_id: int
+    date: datetime
+    notes: Optional[str] = None
+    driver: DriverSimple
+    # None while a drive with data has no sensor manifest yet
+    sensor_count: Optional[int] = None
+    row_count: Optional[int] = None
+    first_time: Optional[int] = None
+    last_time: Optional[int] = None
+    duration: Optional[int] = None
+
+    class Config:
+        orm_mode = True
+
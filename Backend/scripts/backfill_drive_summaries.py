@@ -0,0 +1,35 @@
+# file: backfill_drive_summaries.py
+# Desc: Runs the post-ingest summaries (drive_ingest.finalize_drive) for drives that already exist,
+# e.g. drives uploaded before a summary table was added. Safe to re-run, each drive is rebuilt from raw_data.
+#
+# Usage (from the repo root, DATABASE_URL set):
+#   python -m Backend.scripts.backfill_drive_summaries            # every drive
+#   python -m Backend.scripts.backfill_drive_summaries 12 13 14   # just these drives
+
+import argparse
+import time
+
+from .. import crud, models
+from ..database import SessionLocal, engine
+from ..services import drive_ingest
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild post-ingest drive summaries")
+    parser.add_argument("drive_ids", type=int, nargs="*", help="drives to rebuild (default: all)")
+    args = parser.parse_args()
+
+    models.Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        drive_ids = args.drive_ids or [drive.drive_id for drive in crud.get_drives(db, limit=None)]
+        for drive_id in drive_ids:
+            started = time.perf_counter()
+            drive_ingest.finalize_drive(db, drive_id)
+            print(f"drive {drive_id}: {time.perf_counter() - started:.2f}s")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# file: bench_data_formats.py
+# Desc: Response size / serialization time benchmark for a full-drive /api/data fetch,
+# JSON (ORM rows validated through schemas.RawData, what the route does by default) vs the
+# columnar binary format from services/columnar.py. Seeds one synthetic drive in a scratch Postgres
+# schema inside a transaction that is rolled back, so it's safe to point at a local dev database.
+#
+# Usage (from the repo root, DATABASE_URL set):
+#   python -m Backend.scripts.bench_data_formats --rows 1000000
+
+import argparse
+import gzip
+import statistics
+import time
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from .. import crud, models, schemas
+from ..configDB import DATABASE_URL
+from ..services import columnar
+
+SCHEMA = "data_format_bench"
+DRIVE_ID = 1
+SENSORS = 20
+
+RAW_DATA_LIST = TypeAdapter(list[schemas.RawData])
+
+
+def seed(conn, db: Session, rows: int):
+    models.Base.metadata.create_all(bind=conn)
+    conn.execute(text("INSERT INTO drivers (driver_id, name) VALUES (1, 'Bench')"))
+    conn.execute(text(
+        "INSERT INTO drive (drive_id, driver_id, date, notes, hash) VALUES (:drive_id, 1, now(), 'bench', 'bench')"
+    ), {"drive_id": DRIVE_ID})
+    crud.create_raw_data_partition(db, DRIVE_ID)
+    conn.execute(text(
+        "INSERT INTO raw_data (drive_id, msg_id, time, payload) "
+        "SELECT :drive_id, i % :sensors, i / :sensors, hashint8extended(i, 0) FROM generate_series(1, :rows) AS i"
+    ), {"drive_id": DRIVE_ID, "sensors": SENSORS, "rows": rows})
+    conn.execute(text("ANALYZE"))
+
+
+def as_json(db: Session) -> bytes:
+    # Same work as the FastAPI route: ORM rows -> response_model validation -> JSON
+    rows = crud.get_all_data_from_drive(db, DRIVE_ID)
+    body = RAW_DATA_LIST.dump_json(RAW_DATA_LIST.validate_python(rows, from_attributes=True))
+    db.expunge_all()
+    return body
+
+
+def as_columnar(db: Session) -> bytes:
+    return columnar.encode_columns(crud.get_sensor_columns(db, DRIVE_ID, None))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Full-drive JSON vs columnar response benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="raw_data rows in the synthetic drive")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per format (median is reported)")
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        try:
+            db = Session(bind=conn)
+            seed(conn, db, args.rows)
+
+            print(f"{'format':<10}{'body':>12}{'gzipped':>12}{'time':>12}")
+            for label, encode in (("json", as_json), ("columnar", as_columnar)):
+                timings = []
+                for _ in range(args.repeat):
+                    started = time.perf_counter()
+                    body = encode(db)
+                    timings.append(time.perf_counter() - started)
+                gzipped = len(gzip.compress(body, compresslevel=6))
+                print(
+                    f"{label:<10}{len(body) / 1024 / 1024:>9.1f} MB{gzipped / 1024 / 1024:>9.1f} MB"
+                    f"{statistics.median(timings) * 1000:>9.0f} ms"
+                )
+        finally:
+            conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+# file: bench_downsample.py
+# Desc: Latency benchmark for the chart downsample path against zoom range size.
+# Seeds one synthetic drive (a noisy signal with rare spikes) in a scratch Postgres schema, builds its
+# sensor pyramid, then times services.downsample for every algorithm / point budget over growing ranges.
+# The old ntile(500) first-in-bucket query is timed too as the "before" number.
+# Everything runs in one transaction that is rolled back, so it's safe to point at a local dev database.
+#
+# Usage (from the repo root, DATABASE_URL set):
+#   python -m Backend.scripts.bench_downsample --samples 2000000
+
+import argparse
+import statistics
+import time
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from .. import crud, models
+from ..configDB import DATABASE_URL
+from ..services import downsample
+
+SCHEMA = "downsample_bench"
+DRIVE_ID = 1
+SENSOR_ID = 192
+
+# The query downsampling used before the pyramid, kept here for comparison
+NTILE_QUERY = text(
+    "SELECT DISTINCT ON (bucket) data_id, time, payload FROM ("
+    " SELECT data_id, time, payload, ntile(500) OVER (ORDER BY time) AS bucket FROM raw_data"
+    " WHERE drive_id = :drive_id AND msg_id = :sensor_id AND time >= :start AND time <= :end"
+    ") AS grouped ORDER BY bucket, time LIMIT 500"
+)
+
+
+def seed(conn, db: Session, samples: int):
+    models.Base.metadata.create_all(bind=conn)
+    conn.execute(text("INSERT INTO drivers (driver_id, name) VALUES (1, 'Bench')"))
+    conn.execute(text(
+        "INSERT INTO drive (drive_id, driver_id, date, notes, hash) VALUES (:drive_id, 1, now(), 'bench', 'bench')"
+    ), {"drive_id": DRIVE_ID})
+    crud.create_raw_data_partition(db, DRIVE_ID)
+    # One sample per time unit, u16 value in bytes 0-1: slow sine + noise, every 10007th sample spikes
+    conn.execute(text(
+        "INSERT INTO raw_data (drive_id, msg_id, time, payload) "
+        "SELECT :drive_id, :sensor_id, t, CASE WHEN t % 10007 = 0 THEN 65000 "
+        "ELSE (20000 + 10000 * sin(t / 5000.0) + (hashint8extended(t, 0) & 1023))::bigint END "
+        "FROM generate_series(1, :samples) AS t"
+    ), {"drive_id": DRIVE_ID, "sensor_id": SENSOR_ID, "samples": samples})
+    conn.execute(text("ANALYZE"))
+
+    started = time.perf_counter()
+    downsample.build_drive_pyramids(db, DRIVE_ID)
+    print(f"pyramid build: {time.perf_counter() - started:.2f}s")
+    # Deployed databases have sensor_pyramid statistics (autovacuum analyzes after a drive's pyramid is written)
+    conn.execute(text("ANALYZE sensor_pyramid"))
+
+
+def time_ms(run, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        run()
+        timings.append((time.perf_counter() - started) * 1000)
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Downsample latency vs range size")
+    parser.add_argument("--samples", type=int, default=2_000_000, help="samples in the synthetic sensor")
+    parser.add_argument("--points", type=int, nargs="+", default=[500, 2000], help="point budgets to try")
+    parser.add_argument("--repeat", type=int, default=5, help="runs per cell (median is reported)")
+    args = parser.parse_args()
+
+    ranges = [size for size in (1_000, 10_000, 100_000, 1_000_000, 10_000_000) if size <= args.samples]
+    engine = create_engine(DATABASE_URL)
+
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        try:
+            db = Session(bind=conn)
+            seed(conn, db, args.samples)
+
+            print(f"{'algorithm':<16}{'points':>8}" + "".join(f"{f'{size:,}':>12}" for size in ranges))
+            print(f"{'ntile (before)':<16}{500:>8}" + "".join(
+                f"{time_ms(lambda: conn.execute(NTILE_QUERY, {'drive_id': DRIVE_ID, 'sensor_id': SENSOR_ID, 'start': 1, 'end': size}).all(), args.repeat):>9.1f} ms"
+                for size in ranges
+            ))
+            for algorithm in downsample.ALGORITHMS:
+                for points in args.points:
+                    print(f"{algorithm:<16}{points:>8}" + "".join(
+                        f"{time_ms(lambda: downsample.downsample_sensor(db, DRIVE_ID, SENSOR_ID, 1, size, points, algorithm), args.repeat):>9.1f} ms"
+                        for size in ranges
+                    ))
+        finally:
+            conn.rollback()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+# file: bench_live_broadcast.py
+# Desc: Per-packet CPU cost of the live telemetry broadcast against the number of connected dashboards.
+# "per-client send_json" is the old broadcast loop (every client JSON-encodes the message itself);
+# "encode once" is ConnectionManager.broadcast (one orjson encode, the same frame queued for every
+# client, sender tasks draining the queues). Clients are real Starlette WebSockets on a no-op ASGI send,
+# so only server-side work is measured, no network or database.
+# --burst is how many packets arrive between event loop turns: under load the /ws/send loop reads
+# several buffered packets before the sender tasks get to run, at low rates it's 1.
+#
+# Usage (from the repo root):
+#   python -m Backend.scripts.bench_live_broadcast --packets 20000 --clients 1 10 50 100 --burst 1
+
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, List
+
+from starlette.websockets import WebSocket
+
+from ..endpoints.livetelemetry import ConnectionManager
+from ..services.livetelemetry_decoder import convert_decoded_can_data
+
+SENSOR_IDS = list(range(11))
+
+
+def sample_messages(count: int) -> List[Dict]:
+    '''Telemetry dicts as /ws/send broadcasts them, from random packets of the Pi's sensor ids'''
+    rng = random.Random(0)
+    return [
+        convert_decoded_can_data({
+            "timestamp": i,
+            "id": rng.choice(SENSOR_IDS),
+            "length": 8,
+            "bytes": [rng.randrange(256) for _ in range(8)],
+        })
+        for i in range(count)
+    ]
+
+
+def make_websocket() -> WebSocket:
+    async def receive():
+        return {"type": "websocket.connect"}
+
+    async def send(message):
+        pass
+
+    return WebSocket({"type": "websocket", "path": "/", "headers": [], "query_string": b""}, receive, send)
+
+
+async def per_client_send_json(messages: List[Dict], clients: int) -> float:
+    websockets = [make_websocket() for _ in range(clients)]
+    for websocket in websockets:
+        await websocket.accept()
+    started = time.process_time()
+    for message in messages:
+        for websocket in websockets:
+            await websocket.send_json(message)
+    return time.process_time() - started
+
+
+async def encode_once(messages: List[Dict], clients: int, burst: int) -> float:
+    manager = ConnectionManager()
+    for _ in range(clients):
+        await manager.connect(make_websocket())
+    queues = list(manager.active_connections.values())
+
+    started = time.process_time()
+    for i, message in enumerate(messages, 1):
+        await manager.broadcast(message)
+        if i % burst == 0 or i == len(messages):
+            # Let the sender tasks drain, like the event loop does once the /ws/send loop waits for data
+            while any(live_client.queue_depth for live_client in queues):
+                await asyncio.sleep(0)
+    elapsed = time.process_time() - started
+
+    for live_client in queues:
+        await live_client.close()
+    return elapsed
+
+
+async def run(packets: int, client_counts: List[int], burst: int):
+    messages = sample_messages(packets)
+    print(f"{'clients':>8}{'per-client send_json':>24}{'encode once':>16}{'speedup':>10}")
+    for clients in client_counts:
+        before = await per_client_send_json(messages, clients)
+        after = await encode_once(messages, clients, burst)
+        print(
+            f"{clients:>8}{before / packets * 1e6:>21.1f} us{after / packets * 1e6:>13.1f} us"
+            f"{before / after:>9.1f}x"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live telemetry broadcast CPU cost per packet vs client count")
+    parser.add_argument("--packets", type=int, default=20000, help="telemetry messages broadcast per run")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 5, 10, 25, 50, 100], help="client counts to measure")
+    parser.add_argument("--burst", type=int, default=1, help="packets broadcast between event loop turns")
+    args = parser.parse_args()
+    asyncio.run(run(args.packets, args.clients, args.burst))
+
+
+if __name__ == "__main__":
+    main()
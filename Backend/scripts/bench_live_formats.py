@@ -0,0 +1,63 @@
+# file: bench_live_formats.py
+# Desc: Wire size / encode / parse cost of the live telemetry feed formats (services/live_clients.py):
+# one JSON text frame per sample vs binary ava3.TelemetryBatch frames, which senders build by joining
+# queued one-sample batches. Parsing is timed in Python (json.loads vs TelemetryBatch.FromString) as a
+# stand-in for the dashboard's JSON.parse vs protobuf-es fromBinary.
+#
+# Usage (from the repo root):
+#   python -m Backend.scripts.bench_live_formats --packets 20000 --batch 1 32 256
+
+import argparse
+import json
+import time
+from typing import List
+
+from ..protobuf.proto import ava3_pb2
+from ..services import live_clients
+from .bench_live_broadcast import sample_messages
+
+
+def per_sample_us(seconds: float, samples: int) -> float:
+    return seconds / samples * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Live feed JSON vs protobuf frame size and encode / parse cost")
+    parser.add_argument("--packets", type=int, default=20000, help="telemetry samples")
+    parser.add_argument("--batch", type=int, nargs="+", default=[1, 32, 256], help="samples per protobuf frame")
+    args = parser.parse_args()
+
+    messages = sample_messages(args.packets)
+    print(f"{'format':<16}{'bytes/sample':>14}{'frames':>9}{'encode':>12}{'parse':>12}")
+
+    started = time.perf_counter()
+    json_frames = [live_clients.encode_frame(message, live_clients.JSON_FORMAT) for message in messages]
+    encode = time.perf_counter() - started
+    started = time.perf_counter()
+    for frame in json_frames:
+        json.loads(frame)
+    parse = time.perf_counter() - started
+    size = sum(len(frame.encode()) for frame in json_frames)
+    print(
+        f"{'json':<16}{size / args.packets:>14.1f}{len(json_frames):>9}"
+        f"{per_sample_us(encode, args.packets):>9.2f} us{per_sample_us(parse, args.packets):>9.2f} us"
+    )
+
+    started = time.perf_counter()
+    samples = [live_clients.encode_frame(message, live_clients.PROTOBUF_FORMAT) for message in messages]
+    encode = time.perf_counter() - started
+    for batch in args.batch:
+        frames: List[bytes] = [b"".join(samples[i:i + batch]) for i in range(0, len(samples), batch)]
+        started = time.perf_counter()
+        parsed = sum(len(ava3_pb2.TelemetryBatch.FromString(frame).samples) for frame in frames)
+        parse = time.perf_counter() - started
+        assert parsed == args.packets
+        size = sum(len(frame) for frame in frames)
+        print(
+            f"{f'protobuf x{batch}':<16}{size / args.packets:>14.1f}{len(frames):>9}"
+            f"{per_sample_us(encode, args.packets):>9.2f} us{per_sample_us(parse, args.packets):>9.2f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
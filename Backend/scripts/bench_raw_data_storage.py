@@ -0,0 +1,77 @@
+# file: bench_raw_data_storage.py
+# Desc: Before/after size benchmark for raw_data payload storage (int[] array vs packed bigint).
+# Loads the same synthetic drive into scratch tables with both layouts and reports table size,
+# index size and the time of a full sequential scan that reads every payload. Drops the scratch tables when done.
+#
+# Usage (from the repo root, DATABASE_URL set):
+#   python -m Backend.scripts.bench_raw_data_storage --rows 2000000
+
+import argparse
+import time
+
+from sqlalchemy import create_engine, text
+
+from ..configDB import DATABASE_URL
+
+LAYOUTS = {
+    "int[] (before)": (
+        "bench_raw_data_array",
+        "raw_data INTEGER[]",
+        "ARRAY[(b >> 0) & 255, (b >> 8) & 255, (b >> 16) & 255, (b >> 24) & 255,"
+        " (b >> 32) & 255, (b >> 40) & 255, (b >> 48) & 255, (b >> 56) & 255]::integer[]",
+        "raw_data[1]",
+    ),
+    "bigint (after)": (
+        "bench_raw_data_packed",
+        "payload BIGINT",
+        "b",
+        "payload & 255",
+    ),
+}
+
+
+def mb(size: int) -> str:
+    return f"{size / 1024 / 1024:8.1f} MB"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="raw_data payload storage benchmark")
+    parser.add_argument("--rows", type=int, default=2_000_000, help="rows in the synthetic drive")
+    parser.add_argument("--scans", type=int, default=5, help="sequential scans to average")
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    with engine.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        print(f"{'layout':<16}{'table':>12}{'index':>12}{'seq scan':>12}")
+
+        for label, (table, column, value, first_byte) in LAYOUTS.items():
+            conn.execute(text(f"DROP TABLE IF EXISTS {table}"))
+            conn.execute(text(
+                f"CREATE TABLE {table} (data_id SERIAL PRIMARY KEY, drive_id INTEGER, "
+                f"msg_id INTEGER, time INTEGER, {column})"
+            ))
+            # Same pseudo-random payloads for both layouts
+            conn.execute(text(
+                f"INSERT INTO {table} (drive_id, msg_id, time, {column.split()[0]}) "
+                f"SELECT 1, i % 12, i, {value} "
+                f"FROM (SELECT i, hashint8extended(i, 0) AS b FROM generate_series(1, :rows) AS i) AS src"
+            ), {"rows": args.rows})
+            conn.execute(text(f"VACUUM ANALYZE {table}"))
+
+            table_size = conn.execute(text(f"SELECT pg_table_size('{table}')")).scalar()
+            index_size = conn.execute(text(f"SELECT pg_indexes_size('{table}')")).scalar()
+
+            conn.execute(text("SET max_parallel_workers_per_gather = 0"))
+            started = time.perf_counter()
+            for _ in range(args.scans):
+                # Full drive scan that has to read every payload, like the CSV export / charts do
+                conn.execute(text(f"SELECT sum({first_byte}) FROM {table} WHERE drive_id = 1")).scalar()
+            scan_ms = (time.perf_counter() - started) / args.scans * 1000
+
+            print(f"{label:<16}{mb(table_size):>12}{mb(index_size):>12}{scan_ms:>9.1f} ms")
+            conn.execute(text(f"DROP TABLE {table}"))
+
+
+if __name__ == "__main__":
+    main()
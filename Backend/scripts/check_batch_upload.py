@@ -0,0 +1,129 @@
+# file: check_batch_upload.py
+# Desc: Check that a failing batch upload (POST /drive/batch, endpoints/drive.py add_drives_from_files)
+# leaves no orphan drives. Batches with a good CSV followed by a bad zip, a zip member failing its CRC check,
+# or an unsupported file must be rejected with 400, and afterwards there must be no drives, no raw_data
+# partitions and no spooled temp files. A drive failing to be created halfway through a batch must also take
+# the drives created before it with it. Runs in a scratch Postgres schema that's dropped at the end, so it's
+# safe to point at a local dev database.
+#
+# Usage (from the repo root, DATABASE_URL set):
+#   python -m Backend.scripts.check_batch_upload
+# Exits 1 if any check fails.
+
+import glob
+import io
+import os
+import sys
+import tempfile
+import zipfile
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from .. import crud, models
+from ..configDB import DATABASE_URL
+from ..endpoints import drive as drive_endpoints
+
+SCHEMA = "batch_upload_check"
+DRIVER_ID = 1
+GOOD_CSV = b"time,id,data\n0,5,0 0 0 0 0 0 0 0\n"
+
+
+def upload(filename: str, content: bytes) -> UploadFile:
+    return UploadFile(file=io.BytesIO(content), filename=filename)
+
+
+def corrupt_zip() -> bytes:
+    '''Zip whose only member fails its CRC check once it's read'''
+    archive = io.BytesIO()
+    with zipfile.ZipFile(archive, "w", zipfile.ZIP_STORED) as zf:
+        zf.writestr("second.csv", GOOD_CSV * 100)
+    data = bytearray(archive.getvalue())
+    data[data.index(b"time,id,data") + 100] ^= 0xFF
+    return bytes(data)
+
+
+def spooled_files():
+    return set(glob.glob(os.path.join(tempfile.gettempdir(), "ava-batch-*")))
+
+
+def main():
+    engine = create_engine(DATABASE_URL)
+    failures = []
+
+    def check(name: str, ok: bool):
+        print(f"[{'  ok' if ok else 'FAIL'}] {name}")
+        if not ok:
+            failures.append(name)
+
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        conn.commit()
+        try:
+            models.Base.metadata.create_all(bind=conn)
+            conn.execute(text("INSERT INTO drivers (driver_id, name) VALUES (:driver_id, 'Batch check')"),
+                         {"driver_id": DRIVER_ID})
+            conn.commit()
+            db = Session(bind=conn)
+
+            def leftovers():
+                drives = db.query(models.Drive).count()
+                partitions = db.execute(text(
+                    "SELECT count(*) FROM pg_tables WHERE schemaname = :schema AND tablename LIKE 'raw_data_drive_%'"
+                ), {"schema": SCHEMA}).scalar()
+                return drives, partitions
+
+            def rejected(name: str, files):
+                spooled_before = spooled_files()
+                try:
+                    drive_endpoints.add_drives_from_files(driver_id=DRIVER_ID, notes=None, date=None, files=files, db=db)
+                    status = None
+                except HTTPException as e:
+                    status = e.status_code
+                check(f"{name}: rejected with 400 (got {status})", status == 400)
+                check(f"{name}: no drives or partitions left behind", leftovers() == (0, 0))
+                check(f"{name}: no spooled files left behind", spooled_files() <= spooled_before)
+
+            rejected("good CSV then bad zip", [upload("first.csv", GOOD_CSV), upload("second.zip", b"not a zip")])
+            rejected("good CSV then corrupt zip member",
+                     [upload("first.csv", GOOD_CSV), upload("second.zip", corrupt_zip())])
+            rejected("good CSV then unsupported file",
+                     [upload("first.csv", GOOD_CSV), upload("notes.txt", b"hello")])
+
+            # Drive creation itself failing on the second file
+            create_drive = crud.create_drive
+            created = []
+
+            def failing_create_drive(db, drive):
+                if created:
+                    raise RuntimeError("drive insert failed")
+                created.append(drive)
+                return create_drive(db, drive)
+
+            crud.create_drive = failing_create_drive
+            try:
+                drive_endpoints.add_drives_from_files(
+                    driver_id=DRIVER_ID, notes=None, date=None, db=db,
+                    files=[upload("first.csv", GOOD_CSV), upload("second.csv", GOOD_CSV + GOOD_CSV)],
+                )
+                raised = False
+            except RuntimeError:
+                raised = True
+            finally:
+                crud.create_drive = create_drive
+            check("failed drive insert: error surfaces", raised)
+            check("failed drive insert: first drive and partition removed", leftovers() == (0, 0))
+            db.close()
+        finally:
+            conn.rollback()
+            conn.execute(text(f"DROP SCHEMA {SCHEMA} CASCADE"))
+            conn.commit()
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+# file: check_downsample_budget.py
+# Desc: Point budget check for services.downsample. Seeds one synthetic drive (a noisy signal) in a scratch
+# Postgres schema, builds its sensor pyramid, then downsamples it with every algorithm and a spread of point
+# budgets over ranges read from the pyramid and from raw_data. Each result must stay within its budget and
+# come close to it (or to the samples the range has, if that's fewer). Minmax fills its budget four samples
+# per bucket, and a bucket's first / last sample is sometimes its min / max too, so it gets more slack.
+# Minmax results must also keep the range's first, last, min and max samples (no edge bucket trimmed away).
+# Everything runs in one transaction that is rolled back, so it's safe to point at a local dev database.
+#
+# Usage (from the repo root, DATABASE_URL set):
+#   python -m Backend.scripts.check_downsample_budget
+# Exits 1 if any result misses its budget.
+
+import sys
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session
+
+from .. import crud
+from ..configDB import DATABASE_URL
+from ..services import downsample
+from ..services.sensor_values import decode_values
+from .bench_downsample import DRIVE_ID, SENSOR_ID, seed
+
+SCHEMA = "downsample_budget_check"
+SAMPLES = 300_000
+POINTS = (4, 5, 7, 50, 333, 500, 2000, downsample.MAX_DOWNSAMPLE_POINTS)
+# (first, last) ranges: whole drive, pyramid zooms, raw_data zooms, and ranges smaller than the budget
+RANGES = ((0, -1), (1, 250_000), (12_345, 98_765), (1_000, 31_000), (5_000, 9_000), (100, 400), (7, 7))
+# Share of the budget (or of the samples in range) a result has to reach
+MIN_FILL = {downsample.MINMAX: 0.85, downsample.LTTB: 0.95, downsample.FIRST: 0.95}
+
+
+def extremes(samples):
+    '''(first time, last time, min value, max value) of time-ordered samples'''
+    values = decode_values(SENSOR_ID, samples["payload"].to_numpy())
+    return samples["time"].iloc[0], samples["time"].iloc[-1], values.min(), values.max()
+
+
+def main():
+    engine = create_engine(DATABASE_URL)
+    failures = []
+
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        try:
+            db = Session(bind=conn)
+            seed(conn, db, SAMPLES)
+
+            for algorithm in downsample.ALGORITHMS:
+                for points in POINTS:
+                    if algorithm == downsample.MINMAX and points < downsample.MINMAX_MIN_POINTS:
+                        continue
+                    for start, end in RANGES:
+                        available = (SAMPLES if end == -1 else min(end, SAMPLES)) - max(start, 1) + 1
+                        budget = points - points % len(downsample.SAMPLE_ROLES) if algorithm == downsample.MINMAX else points
+                        series = downsample.downsample_series(db, DRIVE_ID, [SENSOR_ID], start, end, points, algorithm)[SENSOR_ID]
+                        got = len(series)
+                        ok = got <= points and got >= MIN_FILL[algorithm] * min(budget, available)
+                        if algorithm == downsample.MINMAX:
+                            ok = ok and extremes(series) == extremes(
+                                crud.get_sensor_columns(db, DRIVE_ID, [SENSOR_ID], start, None if end == -1 else end))
+                        print(f"[{'  ok' if ok else 'FAIL'}] {algorithm:<7}{points:>7} points  "
+                              f"[{start}, {end}]: {got} samples")
+                        if not ok:
+                            failures.append((algorithm, points, start, end))
+
+            try:
+                downsample.downsample_sensor(db, DRIVE_ID, SENSOR_ID, 0, -1, downsample.MINMAX_MIN_POINTS - 1)
+                rejected = False
+            except ValueError:
+                rejected = True
+            print(f"[{'  ok' if rejected else 'FAIL'}] minmax below {downsample.MINMAX_MIN_POINTS} points is rejected")
+            if not rejected:
+                failures.append("minmax minimum")
+        finally:
+            conn.rollback()
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
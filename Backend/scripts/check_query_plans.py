@@ -0,0 +1,136 @@
+# file: check_query_plans.py
+# Desc: Query plan regression check for the raw_data read paths in crud.py.
+# Builds the schema from models.py in a scratch Postgres schema, seeds several drives, runs each
+# CRUD read and EXPLAINs the exact SQL it sent. A plan fails if it touches any raw_data partition
+# other than the drive's own, or if a per-sensor read sequentially scans instead of using the index.
+# (Whole-drive reads may seq scan the drive's own partition, that's the cheapest plan for them.)
+# Everything runs in one transaction that is rolled back, so it's safe to point at a local dev database.
+#
+# Usage (from the repo root, DATABASE_URL set):
+#   python -m Backend.scripts.check_query_plans
+# Exits 1 if any query plan regressed.
+
+import argparse
+import json
+import sys
+from typing import Callable, Dict, List, Tuple
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.orm import Session
+
+from .. import crud, models
+from ..configDB import DATABASE_URL
+
+SCHEMA = "query_plan_check"
+DRIVES = 20
+SENSORS = 12
+SAMPLES_PER_SENSOR = 2000
+
+DRIVE_ID = 7
+SENSOR_ID = 5
+
+# name -> (crud read to check, reads the whole drive)
+QUERIES: Dict[str, Tuple[Callable[[Session], object], bool]] = {
+    "get_all_data_from_drive": (lambda db: crud.get_all_data_from_drive(db, DRIVE_ID), True),
+    "get_sensors_data_from_drive": (lambda db: crud.get_sensors_data_from_drive(db, DRIVE_ID, SENSOR_ID), False),
+    # get_sensor_columns wraps this SELECT in COPY ... TO STDOUT, which the cursor events don't see
+    "sensor_columns_query (full)": (lambda db: db.execute(crud.sensor_columns_query(DRIVE_ID, [SENSOR_ID])), False),
+    "sensor_columns_query (range)": (lambda db: db.execute(crud.sensor_columns_query(DRIVE_ID, [SENSOR_ID], 500, 900)), False),
+    "sensor_columns_query (whole drive)": (lambda db: db.execute(crud.sensor_columns_query(DRIVE_ID, None)), True),
+    "sensor_columns_query (several sensors)": (lambda db: db.execute(crud.sensor_columns_query(DRIVE_ID, [1, 3, SENSOR_ID], 500, 900)), False),
+    "sensor_range_columns_query": (lambda db: db.execute(crud.sensor_range_columns_query(DRIVE_ID, [(1, 500, 563), (SENSOR_ID, 900, None)])), False),
+    "raw_data_page_query (drive page)": (lambda db: db.execute(crud.raw_data_page_query(DRIVE_ID, None, (900, 0), 1000)), False),
+    "raw_data_page_query (sensor page)": (lambda db: db.execute(crud.raw_data_page_query(DRIVE_ID, SENSOR_ID, (900, 0), 1000)), False),
+    "raw_data_page_query (lap)": (lambda db: db.execute(crud.raw_data_page_query(DRIVE_ID, None, None, 1000, 500, 900)), False),
+    "get_unique_sensors_from_drive": (lambda db: crud.get_unique_sensors_from_drive(db, DRIVE_ID), True),
+}
+
+
+def seed(conn, db: Session):
+    models.Base.metadata.create_all(bind=conn)
+    conn.execute(text("INSERT INTO drivers (driver_id, name) VALUES (1, 'Plan Check')"))
+    conn.execute(text(
+        "INSERT INTO drive (drive_id, driver_id, date, notes, hash) "
+        "SELECT d, 1, now(), 'plan check', 'plan-check-' || d FROM generate_series(1, :drives) AS d"
+    ), {"drives": DRIVES})
+    for drive_id in range(1, DRIVES + 1):
+        crud.create_raw_data_partition(db, drive_id)
+    conn.execute(text(
+        "INSERT INTO raw_data (drive_id, msg_id, time, payload) "
+        "SELECT d, s, t, hashint8extended(d * 1000000 + s * 10000 + t, 0) "
+        "FROM generate_series(1, :drives) AS d, generate_series(0, :sensors - 1) AS s, "
+        "generate_series(1, :samples) AS t"
+    ), {"drives": DRIVES, "sensors": SENSORS, "samples": SAMPLES_PER_SENSOR})
+    conn.execute(text("ANALYZE"))
+
+
+def capture_statements(conn, run: Callable[[], object]) -> List[Tuple[str, object]]:
+    statements = []
+
+    def before_cursor_execute(_conn, _cursor, statement, parameters, _context, _executemany):
+        statements.append((statement, parameters))
+
+    event.listen(conn, "before_cursor_execute", before_cursor_execute)
+    try:
+        run()
+    finally:
+        event.remove(conn, "before_cursor_execute", before_cursor_execute)
+    return statements
+
+
+def raw_data_scans(plan: Dict) -> List[Tuple[str, str]]:
+    '''(node type, relation) for every scan of raw_data or one of its partitions'''
+    found = []
+    if plan.get("Relation Name", "").startswith("raw_data"):
+        found.append((plan["Node Type"], plan["Relation Name"]))
+    for child in plan.get("Plans", []):
+        found.extend(raw_data_scans(child))
+    return found
+
+
+def plan_problems(plan: Dict, whole_drive: bool) -> List[str]:
+    own_partition = crud.raw_data_partition_name(DRIVE_ID)
+    problems = []
+    for node_type, relation in raw_data_scans(plan):
+        if relation != own_partition:
+            problems.append(f"{node_type} on {relation} (not pruned to {own_partition})")
+        elif node_type == "Seq Scan" and not whole_drive:
+            problems.append(f"Seq Scan on {relation}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="EXPLAIN regression check for crud.py raw_data reads")
+    parser.add_argument("--verbose", action="store_true", help="print every plan")
+    args = parser.parse_args()
+
+    engine = create_engine(DATABASE_URL)
+    failures = 0
+
+    with engine.connect() as conn:
+        conn.execute(text(f"CREATE SCHEMA {SCHEMA}"))
+        conn.execute(text(f"SET search_path TO {SCHEMA}"))
+        try:
+            db = Session(bind=conn)
+            seed(conn, db)
+
+            for name, (query, whole_drive) in QUERIES.items():
+                for statement, parameters in capture_statements(conn, lambda: query(db)):
+                    plan = conn.exec_driver_sql(
+                        "EXPLAIN (FORMAT JSON) " + statement, parameters
+                    ).scalar()[0]["Plan"]
+                    problems = plan_problems(plan, whole_drive)
+
+                    status = "FAIL" if problems else "ok"
+                    failures += bool(problems)
+                    print(f"[{status:>4}] {name}" + (f": {'; '.join(problems)}" if problems else ""))
+                    if problems or args.verbose:
+                        print(json.dumps(plan, indent=2))
+        finally:
+            conn.rollback()
+
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
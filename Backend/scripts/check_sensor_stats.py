@@ -0,0 +1,96 @@
+# file: check_sensor_stats.py
+# Desc: Check of the per-channel sensor statistics (services/sensor_stats.py) on synthetic frames, no database.
+# TireRPM frames of four tires are interleaved and every tire's max RPM must come out on its own row, from
+# both the exact (finalize) and the batch (upload / live) summaries. Also checks that every value channel of
+# TireTemperature and GPS gets statistics, not just the chart channel.
+#
+# Usage (from the repo root):
+#   python -m Backend.scripts.check_sensor_stats
+# Exits 1 if any check fails.
+
+import struct
+import sys
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from ..crud import pack_payloads
+from ..services import sensor_stats
+
+TIRE_RPM_MSG_ID = 5
+TIRE_TEMPERATURE_MSG_ID = 6
+GPS_MSG_ID = 9
+TIRES = 4
+FRAMES = 4000
+
+
+def tire_rpm_frames(rng: np.random.Generator) -> Tuple[np.ndarray, np.ndarray, Dict[int, int]]:
+    '''(times, packed payloads) of interleaved TireRPM frames and the max RPM of each tire'''
+    tires = rng.integers(0, TIRES, FRAMES)
+    # Tire t spins in [0, 1000 * (t + 1)), so a mixed-up series would report 4000 for every tire
+    rpms = (rng.random(FRAMES) * 1000 * (tires + 1)).astype(np.uint32)
+    payload = np.zeros((FRAMES, 8), dtype=np.int64)
+    payload[:, 0] = tires
+    payload[:, 1:5] = rpms.astype("<u4").view(np.uint8).reshape(-1, 4)
+    expected = {tire: int(rpms[tires == tire].max()) for tire in range(TIRES)}
+    return np.arange(FRAMES, dtype=np.int64), pack_payloads(payload), expected
+
+
+def frame(fmt: str, *fields) -> List[int]:
+    return list(struct.pack(fmt, *fields).ljust(8, b"\0"))
+
+
+def main():
+    failures = []
+
+    def check(name: str, ok: bool):
+        print(f"[{'  ok' if ok else 'FAIL'}] {name}")
+        if not ok:
+            failures.append(name)
+
+    times, packed, expected = tire_rpm_frames(np.random.default_rng(0))
+
+    exact = {
+        row["selector"]: row["max_value"]
+        for row in sensor_stats.exact_stats(TIRE_RPM_MSG_ID, times, packed) if row["channel"] == "rpm"
+    }
+    check("exact_stats: max RPM per tire", exact == {tire: float(rpm) for tire, rpm in expected.items()})
+
+    # Batch summaries as uploads / the live writer produce them, merged like crud.upsert_channel_stats
+    batches = [
+        sensor_stats.summarize_channels(np.full(len(chunk), TIRE_RPM_MSG_ID), times[chunk], packed[chunk])
+        for chunk in np.array_split(np.arange(FRAMES), 7)
+    ]
+    merged: Dict[int, float] = {}
+    for summary in batches:
+        for row in summary[summary["channel"] == "rpm"].itertuples():
+            merged[row.selector] = max(merged.get(row.selector, row.max_value), row.max_value)
+    check("summarize_channels: max RPM per tire", merged == {tire: float(rpm) for tire, rpm in expected.items()})
+    check("tire selector has no statistics of its own",
+          all("tire" not in set(summary["channel"]) for summary in batches))
+
+    temperature = pack_payloads(np.array([
+        frame("<BHHH", 0, 40, 50, 60),
+        frame("<BHHH", 1, 41, 51, 61),
+        frame("<BHHH", 0, 42, 52, 62),
+    ]))
+    rows = sensor_stats.exact_stats(TIRE_TEMPERATURE_MSG_ID, np.arange(3), temperature)
+    check("TireTemperature: inner / outer / core per tire",
+          {(row["channel"], row["selector"]): row["max_value"] for row in rows} == {
+              ("inner", 0): 42.0, ("inner", 1): 41.0,
+              ("outer", 0): 52.0, ("outer", 1): 51.0,
+              ("core", 0): 62.0, ("core", 1): 61.0,
+          })
+
+    gps = pack_payloads(np.array([frame("<ii", 401234567, -1116543210), frame("<ii", 401234577, -1116543200)]))
+    rows = sensor_stats.exact_stats(GPS_MSG_ID, np.arange(2), gps)
+    check("GPS: lat and long, not multiplexed",
+          {row["channel"] for row in rows} == {"lat", "long"}
+          and all(row["selector"] == sensor_stats.NO_SELECTOR for row in rows))
+
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+# file: batch_ingest.py
+# Desc: Parallel ingest of many drive logs (CSV or Pi binary) at once, e.g. a test day's SD cards.
+# Each file becomes its own drive and is parsed + COPY'd in a separate worker process.
+
+from concurrent.futures import ProcessPoolExecutor
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import zipfile
+
+from ..database import SessionLocal, engine
+from . import drive_ingest
+
+# Number of worker processes, one drive per worker at a time
+INGEST_PROCESSES : int = int(os.getenv("INGEST_PROCESSES", str(os.cpu_count() or 1)))
+SPOOL_CHUNK_BYTES = 1024 * 1024
+LOG_EXTENSIONS = (".csv",) + drive_ingest.BINARY_EXTENSIONS
+ARCHIVE_EXTENSION = ".zip"
+
+logger = logging.getLogger(__name__)
+
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+# ========== Spooling uploads ===========
+
+def spool_to_temp_file(source: BinaryIO) -> Tuple[str, str]:
+    '''Copy an upload (or zip member) to a temp file in chunks.
+    Returns the path and the sha256 hex digest used as the drive hash.'''
+    digest = hashlib.sha256()
+    with tempfile.NamedTemporaryFile(prefix="ava-batch-", delete=False) as spool:
+        try:
+            while chunk := source.read(SPOOL_CHUNK_BYTES):
+                digest.update(chunk)
+                spool.write(chunk)
+        except Exception:
+            # e.g. a zip member failing its CRC check halfway through
+            spool.close()
+            os.remove(spool.name)
+            raise
+    return spool.name, digest.hexdigest()
+
+
+def is_supported_upload(filename: Optional[str]) -> bool:
+    '''A drive log (CSV or Pi binary) or a zip archive of them'''
+    return (filename or "").lower().endswith(LOG_EXTENSIONS + (ARCHIVE_EXTENSION,))
+
+
+def iter_log_sources(filename: str, source: BinaryIO) -> Iterator[Tuple[str, BinaryIO]]:
+    '''Yield (name, file object) for every drive log in an upload. Zip archives are expanded
+    member by member (CSV and binary members only), anything else is a single log.'''
+    if not filename.lower().endswith(ARCHIVE_EXTENSION):
+        yield filename, source
+        return
+
+    with zipfile.ZipFile(source) as archive:
+        for member in archive.infolist():
+            name = member.filename
+            if member.is_dir() or name.startswith("__MACOSX/"):
+                continue
+            if not name.lower().endswith(LOG_EXTENSIONS):
+                continue
+            with archive.open(member) as member_source:
+                yield f"{filename}/{name}", member_source
+
+
+# ========== Worker processes ===========
+
+def _init_worker():
+    # Connections inherited from the parent can't be shared, each worker opens its own
+    engine.dispose(close=False)
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(
+            max_workers=INGEST_PROCESSES,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker
+        )
+    return _pool
+
+
+def ingest_path(drive_id: int, path: str, file_format: str) -> Dict:
+    '''Runs inside a worker process: stream one spooled log into its drive.
+    Errors are returned rather than raised so they always make it back to the parent.'''
+    db = SessionLocal()
+    try:
+        stats = drive_ingest.ingest_file(db, drive_id, path, file_format)
+        drive_ingest.finalize_drive(db, drive_id)
+        return {"status": "success", **stats.as_dict()}
+    except Exception as e:
+        db.rollback()
+        return {"status": "failed", "detail": f"Failed to insert data: {e}"}
+    finally:
+        db.close()
+
+
+def ingest_drives_in_parallel(jobs: List[Tuple[int, str, str]]) -> List[Dict]:
+    '''Ingest (drive_id, path, file_format) jobs across the process pool, results in the same order'''
+    pool = get_pool()
+    futures = [pool.submit(ingest_path, *job) for job in jobs]
+
+    results = []
+    for future in futures:
+        try:
+            results.append(future.result())
+        except Exception as e: # worker died
+            results.append({"status": "failed", "detail": f"Ingest worker failed: {e}"})
+    return results
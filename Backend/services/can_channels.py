@@ -0,0 +1,161 @@
+# file: can_channels.py
+# Desc: Table-driven CAN decoder registry. Every msg_id maps to named physical channels (field type,
+# byte offset, scale, unit) instead of per-id if/else chains. One table serves the live feed (one packet
+# at a time, raw field values like the frontend expects) and historical queries (whole sensor columns at
+# once with NumPy, scaled engineering values).
+
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+import struct
+
+import numpy as np
+
+GPS_MSG_ID = 9
+
+
+@dataclass(frozen=True)
+class Channel:
+    name: str
+    dtype: str # little-endian numpy field type
+    offset: int # first payload byte
+    scale: float = 1.0 # engineering value = field * scale
+    unit: str = ""
+
+    @property
+    def width(self) -> int:
+        return np.dtype(self.dtype).itemsize
+
+    @property
+    def struct_format(self) -> str:
+        return "<" + np.dtype(self.dtype).char
+
+
+@dataclass(frozen=True)
+class MessageSpec:
+    name: str
+    channels: Tuple[Channel, ...]
+    chart: str # channel the Analytics charts plot, what min / max / LTTB downsampling ranks samples by
+    live: bool = True # sent decoded on the live feed (only ids the Pi actually sends)
+    # Channel that says which instance the rest of the frame belongs to (the tire of a TireRPM frame).
+    # Statistics are kept per selector value, the selector itself has none
+    selector: Optional[str] = None
+
+    def channel(self, name: str) -> Channel:
+        return next(channel for channel in self.channels if channel.name == name)
+
+    @property
+    def value_channels(self) -> Tuple[Channel, ...]:
+        return tuple(channel for channel in self.channels if channel.name != self.selector)
+
+
+def _hot_box(name: str) -> MessageSpec:
+    return MessageSpec(name, (Channel("temperature", "<u2", 0, 0.01, "C"),), "temperature", live=False)
+
+
+def _accel(axis: int) -> MessageSpec:
+    return MessageSpec(f"Acceleration{axis}", (Channel("acceleration", "<f4", 0),), "acceleration", live=False)
+
+
+MESSAGES: Dict[int, MessageSpec] = {
+    # Frames from the Pi (the live feed sees these)
+    0: MessageSpec("StartSwitch", (Channel("state", "u1", 0, unit="0/1"),), "state"),
+    1: MessageSpec("Throttle1Position", (Channel("position", "<u2", 0, unit="raw"),), "position"),
+    2: MessageSpec("Throttle2Position", (Channel("position", "<u2", 0, unit="raw"),), "position"),
+    3: MessageSpec("BrakePressure", (Channel("pressure", "<u2", 0, unit="raw"),), "pressure"),
+    4: MessageSpec("RVC", (Channel("axis", "u1", 0), Channel("value", "<i4", 1)), "value", selector="axis"),
+    5: MessageSpec("TireRPM", (Channel("tire", "u1", 0), Channel("rpm", "<u4", 1, unit="rpm")), "rpm", selector="tire"),
+    6: MessageSpec("TireTemperature", (
+        Channel("tire", "u1", 0),
+        Channel("inner", "<u2", 1),
+        Channel("outer", "<u2", 3),
+        Channel("core", "<u2", 5),
+    ), "core", selector="tire"),
+    7: MessageSpec("BMSPercentage", (Channel("percentage", "u1", 0, unit="%"),), "percentage"),
+    8: MessageSpec("BMSTemperature", (Channel("temperature", "<u2", 0),), "temperature"),
+    # Fixed point degrees * 1e7, older logs hold float32 degrees instead (see decode_channels)
+    GPS_MSG_ID: MessageSpec("GPS", (
+        Channel("lat", "<i4", 0, 1e-7, "deg"),
+        Channel("long", "<i4", 4, 1e-7, "deg"),
+    ), "lat"),
+    10: MessageSpec("Lap", (Channel("lap", "u1", 0),), "lap"),
+
+    # Rows only uploads produce (drive_ingest.remap_can_frames) or the motor controller sends
+    192: MessageSpec("ControlCommand", (Channel("torque", "<u2", 0),), "torque", live=False),
+    201: MessageSpec("DC1Response", (Channel("health", "u1", 0),), "health", live=False),
+    202: MessageSpec("DC2Response", (Channel("health", "u1", 0),), "health", live=False),
+    **{400 + axis: _accel(axis) for axis in range(6)},
+    500: _hot_box("HotBox0"),
+    501: _hot_box("HotBox1"),
+    502: _hot_box("HotBox2"),
+}
+# Anything else charts as a little-endian u16 at byte 0
+DEFAULT_MESSAGE = MessageSpec("Unknown", (Channel("value", "<u2", 0, unit="raw"),), "value", live=False)
+
+
+def message_spec(msg_id: int) -> MessageSpec:
+    return MESSAGES.get(msg_id, DEFAULT_MESSAGE)
+
+
+# ========== Historical (vectorized) ===========
+
+def _field(payload: np.ndarray, channel: Channel) -> np.ndarray:
+    raw = np.ascontiguousarray(payload[:, channel.offset:channel.offset + channel.width])
+    return raw.view(channel.dtype).ravel()
+
+
+def decode_channels(msg_id: int, payload: np.ndarray, names: Optional[Sequence[str]] = None) -> Dict[str, np.ndarray]:
+    '''(n, 8) uint8 payloads of one sensor -> channel name -> float64 engineering values (all channels,
+    or just `names`). Non-finite floats (NaN / inf bit patterns) become 0 so they can't poison min / max.'''
+    spec = message_spec(msg_id)
+    channels = spec.channels if names is None else [spec.channel(name) for name in names]
+
+    # Arbitrary bytes read as float32 can be NaN / inf, that's expected here
+    with np.errstate(invalid="ignore", over="ignore"):
+        decoded = {channel.name: _field(payload, channel).astype(np.float64) * channel.scale for channel in channels}
+        if msg_id == GPS_MSG_ID:
+            # Same check as the frontend: use the float32 reading when both coordinates look like degrees
+            lat = _field(payload, Channel("lat", "<f4", 0)).astype(np.float64)
+            long = _field(payload, Channel("long", "<f4", 4)).astype(np.float64)
+            floats = np.isfinite(lat) & np.isfinite(long) & (np.abs(lat) <= 90) & (np.abs(long) <= 180)
+            for name, values in (("lat", lat), ("long", long)):
+                if name in decoded:
+                    decoded[name] = np.where(floats, values, decoded[name])
+
+    for values in decoded.values():
+        values[~np.isfinite(values)] = 0.0
+    return decoded
+
+
+def decode_chart(msg_id: int, payload: np.ndarray) -> np.ndarray:
+    chart = message_spec(msg_id).chart
+    return decode_channels(msg_id, payload, [chart])[chart]
+
+
+# ========== Live (one packet) ===========
+
+def packet_fields(msg_id: int, raw: List[int]) -> Optional[List]:
+    '''Raw (unscaled) channel fields of one live packet in table order, or None for ids the live feed
+    doesn't decode. Fields past the end of a short packet are 0.'''
+    spec = MESSAGES.get(msg_id)
+    if spec is None or not spec.live:
+        return None
+    packet = bytes(raw)
+    return [
+        struct.unpack_from(channel.struct_format, packet, channel.offset)[0]
+        if channel.offset + channel.width <= len(packet) else 0
+        for channel in spec.channels
+    ]
+
+
+def registry() -> List[Dict]:
+    '''JSON description of the table for the channel API'''
+    return [
+        {
+            "msg_id": msg_id,
+            "name": spec.name,
+            "chart": spec.chart,
+            "selector": spec.selector,
+            "channels": [{"name": channel.name, "unit": channel.unit} for channel in spec.channels],
+        }
+        for msg_id, spec in sorted(MESSAGES.items())
+    ]
@@ -0,0 +1,73 @@
+# file: columnar.py
+# Desc: Packed columnar binary encoding for the /api/data routes, picked with the Accept header.
+# JSON stays the default, clients that send `Accept: application/vnd.ava.columns` get the raw_data
+# columns as little-endian buffers instead, ready for typed array views without any parsing:
+#
+#   offset            type            content
+#   0                 char[4]         magic "AVAC"
+#   4                 u16             format version (1)
+#   6                 u16             reserved (0)
+#   8                 u32             row count n
+#   12                u32             reserved (0)
+#   16                u8[n * 8]       raw_data, 8 bytes per row (byte 0 first)
+#   16 + 8n           i32[n]          time
+#   16 + 12n          i32[n]          data_id
+#   16 + 16n          i32[n]          msg_id
+#
+# Rows come in the same order as the route's JSON rows.
+
+from typing import Dict, Optional
+import struct
+
+import numpy as np
+import pandas as pd
+from fastapi import Request, Response
+
+from .sensor_values import payload_bytes
+
+COLUMNAR_MEDIA_TYPE = "application/vnd.ava.columns"
+COLUMNAR_MAGIC = b"AVAC"
+COLUMNAR_VERSION = 1
+HEADER_FMT = "<4sHHII"
+
+
+def accepts(request: Request, media_type: str) -> bool:
+    '''True if the Accept header lists media_type explicitly (wildcards don't count, JSON stays the default)'''
+    accept = request.headers.get("accept", "")
+    return any(media_range.split(";")[0].strip() == media_type for media_range in accept.split(","))
+
+
+def wants_columnar(request: Request) -> bool:
+    return accepts(request, COLUMNAR_MEDIA_TYPE)
+
+
+def encode_columns(samples: pd.DataFrame) -> bytes:
+    '''(msg_id, data_id, time, payload) frame -> columnar body, straight from the column arrays'''
+    header = struct.pack(HEADER_FMT, COLUMNAR_MAGIC, COLUMNAR_VERSION, 0, len(samples), 0)
+    return b"".join((
+        header,
+        payload_bytes(samples["payload"].to_numpy()).tobytes(),
+        samples["time"].to_numpy().astype("<i4").tobytes(),
+        samples["data_id"].to_numpy().astype("<i4").tobytes(),
+        samples["msg_id"].to_numpy().astype("<i4").tobytes(),
+    ))
+
+
+def decode_columns(body: bytes) -> pd.DataFrame:
+    '''Inverse of encode_columns, for scripts and checks'''
+    magic, version, _, rows, _ = struct.unpack_from(HEADER_FMT, body)
+    if magic != COLUMNAR_MAGIC or version != COLUMNAR_VERSION:
+        raise ValueError("Not an AVAC v1 body")
+    offset = struct.calcsize(HEADER_FMT)
+    payload = np.frombuffer(body, dtype="<i8", count=rows, offset=offset)
+    offset += rows * 8
+    columns = {}
+    for name in ("time", "data_id", "msg_id"):
+        columns[name] = np.frombuffer(body, dtype="<i4", count=rows, offset=offset)
+        offset += rows * 4
+    return pd.DataFrame({"msg_id": columns["msg_id"], "data_id": columns["data_id"],
+                         "time": columns["time"], "payload": payload})
+
+
+def columnar_response(samples: pd.DataFrame, headers: Optional[Dict[str, str]] = None) -> Response:
+    return Response(content=encode_columns(samples), media_type=COLUMNAR_MEDIA_TYPE, headers=headers)
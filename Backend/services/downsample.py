@@ -0,0 +1,316 @@
+# file: downsample.py
+# Desc: Min/max pyramid for chart downsampling. Every (drive, sensor) gets power-of-two time buckets,
+# each keeping its first, last, min and max samples (M4), so a zoom request reads a few hundred
+# pre-aggregated rows instead of rescanning raw_data, and spikes show at every zoom level.
+
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import logging
+import math
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from .. import crud
+from .sensor_values import decode_values, raw_data_records
+
+# Default / largest point budget of a downsample request
+DOWNSAMPLE_POINTS : int = 500
+MAX_DOWNSAMPLE_POINTS : int = 10000
+# LTTB picks from this many min/max preselected candidates per output point
+LTTB_PRESELECT_RATIO : int = 2
+
+MINMAX, LTTB, FIRST = "minmax", "lttb", "first"
+ALGORITHMS = (MINMAX, LTTB, FIRST)
+# The finest stored level averages at least this many samples per bucket, narrower zooms read raw_data
+PYRAMID_MIN_SAMPLES_PER_BUCKET : int = 64
+
+SAMPLE_ROLES = ("first", "last", "min", "max")
+# Smallest point budget MINMAX can keep to, one bucket's four samples
+MINMAX_MIN_POINTS : int = len(SAMPLE_ROLES)
+SAMPLE_FIELDS = ("data_id", "time", "payload")
+
+logger = logging.getLogger(__name__)
+
+
+# ========== Bucket aggregation ===========
+
+def samples_as_level(samples: pd.DataFrame, values: np.ndarray) -> pd.DataFrame:
+    '''Raw (data_id, time, payload) samples in time order, shaped like pyramid rows
+    where every sample is its own bucket'''
+    level = {"bucket": samples["time"].to_numpy(), "sample_count": np.ones(len(samples), dtype=np.int64),
+             "min_value": values, "max_value": values}
+    for role in SAMPLE_ROLES:
+        for field in SAMPLE_FIELDS:
+            level[f"{role}_{field}"] = samples[field].to_numpy()
+    return pd.DataFrame(level)
+
+
+def merge_buckets(level: pd.DataFrame, keys: np.ndarray) -> pd.DataFrame:
+    '''Merge consecutive rows of a level that share a key (keys must be sorted) into one bucket each.
+    Vectorized: group starts from the key changes, argmin / argmax from a stable lexsort per group.'''
+    if len(level) == 0:
+        return level.assign(bucket=keys)
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    # lexsort's last key is the primary one, so each group's rows come out ordered by value
+    min_rows = np.lexsort((level["min_value"].to_numpy(), keys))[starts]
+    max_rows = np.lexsort((-level["max_value"].to_numpy(), keys))[starts]
+
+    merged = {
+        "bucket": keys[starts],
+        "sample_count": np.add.reduceat(level["sample_count"].to_numpy(), starts),
+        "min_value": level["min_value"].to_numpy()[min_rows],
+        "max_value": level["max_value"].to_numpy()[max_rows],
+    }
+    for role, rows in (("first", starts), ("last", ends), ("min", min_rows), ("max", max_rows)):
+        for field in SAMPLE_FIELDS:
+            merged[f"{role}_{field}"] = level[f"{role}_{field}"].to_numpy()[rows]
+    return pd.DataFrame(merged)
+
+
+def finest_level(sample_count: int, first_time: int, last_time: int) -> int:
+    span = last_time - first_time + 1
+    return max(math.ceil(math.log2(max(span * PYRAMID_MIN_SAMPLES_PER_BUCKET / sample_count, 1))), 0)
+
+
+def build_pyramid(samples: pd.DataFrame, values: np.ndarray) -> pd.DataFrame:
+    '''Every level of one sensor's pyramid, from the finest one up to a single bucket'''
+    times = samples["time"].to_numpy()
+    level = finest_level(len(samples), int(times[0]), int(times[-1]))
+    rows = merge_buckets(samples_as_level(samples, values), times >> level)
+
+    levels = [rows.assign(level=level)]
+    while len(rows) > 1:
+        level += 1
+        rows = merge_buckets(rows, rows["bucket"].to_numpy() >> 1)
+        levels.append(rows.assign(level=level))
+    return pd.concat(levels, ignore_index=True)
+
+
+# ========== Building ===========
+
+def build_drive_pyramids(db: Session, drive_id: int,
+                         on_sensor: Optional[Callable[[int, pd.DataFrame, np.ndarray], None]] = None) -> int:
+    '''(Re)build the pyramid of every sensor of a drive. Returns the number of pyramid rows written.
+    on_sensor(sensor_id, samples, values) gets each sensor's samples and decoded values, so other
+    per-sensor summaries don't need a scan of their own. Doesn't commit, the caller owns the transaction.'''
+    started = time.perf_counter()
+    crud.delete_sensor_pyramids(db, drive_id)
+
+    written = 0
+    for (sensor_id,) in crud.get_raw_data_sensor_ids(db, drive_id):
+        samples = crud.get_sensor_columns(db, drive_id, [sensor_id])
+        if samples.empty:
+            continue
+        values = decode_values(sensor_id, samples["payload"].to_numpy())
+        if on_sensor is not None:
+            on_sensor(sensor_id, samples, values)
+        rows = build_pyramid(samples, values).assign(drive_id=drive_id, msg_id=sensor_id)
+        crud.copy_sensor_pyramid(db, rows)
+        written += len(rows)
+
+    logger.info(
+        "Built sensor pyramids for drive_id=%s: %s rows in %.2fs",
+        drive_id, written, time.perf_counter() - started
+    )
+    return written
+
+
+# ========== Reading ===========
+
+def level_for_range(start: int, end: int, buckets: int) -> int:
+    # Widest power-of-two bucket that still gives at least `buckets` buckets over the range
+    return max(math.floor(math.log2(max((end - start + 1) / buckets, 1))), 0)
+
+
+def covering_buckets(first_time: int, last_time: int, level: int,
+                     finest_level: int) -> Tuple[List[Tuple[int, int, int]], List[Tuple[int, int]]]:
+    '''Pyramid (level, first_bucket, last_bucket) ranges and leftover raw_data (first_time, last_time) ranges
+    that exactly cover [first_time, last_time]: whole `level` buckets in the middle, the partial ends from
+    successively finer levels, and what's finer than the finest level from raw_data. No bucket reaches
+    outside the range, so none of its first / last / min / max samples get trimmed away.'''
+    middle_start = -(-first_time >> level) << level
+    middle_end = (last_time + 1) >> level << level
+    ranges = [(level, middle_start >> level, (middle_end >> level) - 1)] if middle_end > middle_start else []
+    raw = []
+
+    # Leading edge, widest buckets next to the middle
+    edge = middle_start
+    for finer in range(level - 1, finest_level - 1, -1):
+        if edge - first_time >= 1 << finer:
+            edge -= 1 << finer
+            ranges.append((finer, edge >> finer, edge >> finer))
+    if edge > first_time:
+        raw.append((first_time, edge - 1))
+
+    # Trailing edge
+    edge = middle_end
+    for finer in range(level - 1, finest_level - 1, -1):
+        if last_time + 1 - edge >= 1 << finer:
+            ranges.append((finer, edge >> finer, edge >> finer))
+            edge += 1 << finer
+    if edge <= last_time:
+        raw.append((edge, last_time))
+    return ranges, raw
+
+
+def budget_buckets(rows: pd.DataFrame, first_time: int, last_time: int, buckets: int) -> pd.DataFrame:
+    '''Merge pyramid-shaped rows inside [first_time, last_time] into `buckets` equal-width buckets by where
+    each row starts. Power-of-two levels alone land anywhere between half and all of the budget; the rows
+    come from a level at least this fine, so every new bucket gets at least one row wherever there's data.'''
+    rows = rows.sort_values("first_time", kind="stable", ignore_index=True)
+    span = max(last_time - first_time + 1, 1)
+    keys = (rows["first_time"].to_numpy() - first_time) / span * buckets
+    return merge_buckets(rows, np.clip(keys.astype(np.int64), 0, buckets - 1))
+
+
+def bucket_rows(db: Session, drive_id: int, sensor_ids: List[int], start: int, end: int,
+                buckets: int, points: int = 0) -> Dict[int, Tuple[pd.DataFrame, int]]:
+    '''sensor_id -> (pyramid-shaped rows for [start, end], resolved range end), end -1 = open ended.
+    At most `buckets` rows per sensor, merged from the pyramid level whose buckets are just narrow enough
+    (range edges from finer levels, see covering_buckets). Zooms finer than the stored levels, and drives
+    without a pyramid yet (still live), aggregate raw_data on the fly, and a sensor with no more than
+    `points` samples in the range comes back one row per sample. However many sensors are asked for,
+    it's one extent query, one pyramid query and one raw_data read.'''
+    extents = crud.get_sensor_pyramid_extents(db, drive_id, sensor_ids)
+
+    # Whole sensors read from raw_data get their range, pyramid sensors the edges finer than their finest level
+    pyramid_ranges, raw_ranges, range_ends, data_ranges = [], [], {}, {}
+    for sensor_id in sensor_ids:
+        extent = extents.get(sensor_id)
+        if extent is None:
+            raw_ranges.append((sensor_id, start, None if end == -1 else end))
+            continue
+        range_end = extent["last_time"] if end == -1 else end
+        range_ends[sensor_id] = range_end
+        # Bucket width comes from the part of the range that actually has data
+        first_time, last_time = max(start, extent["first_time"]), min(range_end, extent["last_time"])
+        if first_time > last_time:
+            continue
+        level = min(level_for_range(first_time, last_time, buckets), extent["top_level"])
+        if level < extent["finest_level"]:
+            raw_ranges.append((sensor_id, start, None if end == -1 else end))
+            continue
+        # A range edge at the sensor's first / last sample has nothing beyond it to trim, so it can round out to a whole bucket
+        cover_first = first_time >> level << level if first_time == extent["first_time"] else first_time
+        cover_last = (((last_time >> level) + 1) << level) - 1 if last_time == extent["last_time"] else last_time
+        ranges, edges = covering_buckets(cover_first, cover_last, level, extent["finest_level"])
+        pyramid_ranges.extend((sensor_id, *bucket_range) for bucket_range in ranges)
+        raw_ranges.extend((sensor_id, *edge) for edge in edges)
+        data_ranges[sensor_id] = (first_time, last_time)
+
+    result = {sensor_id: (pd.DataFrame(), range_ends.get(sensor_id, end)) for sensor_id in sensor_ids}
+    pyramid_rows: Dict[int, List[pd.DataFrame]] = {sensor_id: [] for sensor_id in data_ranges}
+    if pyramid_ranges:
+        rows = crud.get_sensor_pyramid_buckets(db, drive_id, pyramid_ranges)
+        for sensor_id, sensor_rows in rows.groupby("msg_id", sort=False):
+            pyramid_rows[int(sensor_id)].append(sensor_rows)
+
+    if raw_ranges:
+        samples = crud.get_sensor_range_columns(db, drive_id, raw_ranges)
+        for sensor_id, sensor_samples in samples.groupby("msg_id", sort=False):
+            sensor_id = int(sensor_id)
+            values = decode_values(sensor_id, sensor_samples["payload"].to_numpy())
+            rows = samples_as_level(sensor_samples, values)
+            if sensor_id in pyramid_rows:
+                pyramid_rows[sensor_id].append(rows)
+                continue
+            times = sensor_samples["time"].to_numpy()
+            if len(rows) > points:
+                rows = budget_buckets(rows, int(times[0]), int(times[-1]), buckets)
+            result[sensor_id] = (rows, int(times[-1]) if end == -1 else end)
+
+    for sensor_id, frames in pyramid_rows.items():
+        if frames:
+            rows = budget_buckets(pd.concat(frames, ignore_index=True), *data_ranges[sensor_id], buckets)
+            result[sensor_id] = (rows, range_ends[sensor_id])
+    return result
+
+
+def role_samples(rows: pd.DataFrame, roles: Sequence[str], start: int, end: int) -> pd.DataFrame:
+    '''(data_id, time, payload) of the given roles of every bucket, in time order. Samples shared
+    by several roles are kept once, edge buckets are trimmed to [start, end].'''
+    if rows.empty:
+        return pd.DataFrame({field: np.array([], dtype=np.int64) for field in SAMPLE_FIELDS})
+    samples = pd.DataFrame({
+        field: np.concatenate([rows[f"{role}_{field}"].to_numpy() for role in roles])
+        for field in SAMPLE_FIELDS
+    })
+    samples = samples[(samples["time"] >= start) & (samples["time"] <= end)]
+    return samples.drop_duplicates("data_id").sort_values(["time", "data_id"], kind="stable")
+
+
+def lttb_indices(x: np.ndarray, y: np.ndarray, points: int) -> np.ndarray:
+    '''Largest-Triangle-Three-Buckets: indices of `points` samples (first and last always kept).
+    Bucket edges and next-bucket averages are computed up front with NumPy, the selection walks the
+    buckets in order since each pick depends on the previous one.'''
+    n = len(x)
+    if points >= n:
+        return np.arange(n)
+    if points < 3:
+        # No buckets between the fixed ends
+        return np.array([0, n - 1]) if points == 2 else np.array([0])
+
+    # points - 2 equal-count buckets over the samples between the fixed first and last
+    edges = np.linspace(1, n - 1, points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    x_sums, y_sums = np.r_[0.0, np.cumsum(x)], np.r_[0.0, np.cumsum(y)]
+    avg_x = np.r_[(x_sums[edges[1:]] - x_sums[edges[:-1]]) / counts, x[-1]]
+    avg_y = np.r_[(y_sums[edges[1:]] - y_sums[edges[:-1]]) / counts, y[-1]]
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for bucket in range(points - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        # Twice the triangle area between the last pick, each candidate and the next bucket's average
+        area = np.abs(
+            (x[a] - avg_x[bucket + 1]) * (y[lo:hi] - y[a])
+            - (x[a] - x[lo:hi]) * (avg_y[bucket + 1] - y[a])
+        )
+        a = lo + int(np.argmax(area))
+        selected[bucket + 1] = a
+    return selected
+
+
+def downsample_series(db: Session, drive_id: int, sensor_ids: List[int], start: int = 0, end: int = -1,
+                      points: int = DOWNSAMPLE_POINTS, algorithm: str = MINMAX) -> Dict[int, pd.DataFrame]:
+    '''Downsample sensors of a drive between start and end (end -1 = open ended) to at most about
+    `points` samples each. Returns sensor_id -> (msg_id, data_id, time, payload) frame in time order.
+    MINMAX: first / min / max / last of points / 4 buckets, spikes always show. Needs points >= MINMAX_MIN_POINTS.
+    LTTB: Largest-Triangle-Three-Buckets over a MINMAX preselection of about LTTB_PRESELECT_RATIO * points
+    samples (MinMaxLTTB), so wide ranges never read raw_data.
+    FIRST: the first sample of each of `points` buckets, the old ntile behaviour.'''
+    if algorithm == MINMAX and points < MINMAX_MIN_POINTS:
+        raise ValueError(f"minmax needs at least {MINMAX_MIN_POINTS} points, got {points}")
+    if algorithm == FIRST:
+        roles, buckets = ("first",), points
+    elif algorithm == LTTB:
+        roles, buckets = SAMPLE_ROLES, max(points * LTTB_PRESELECT_RATIO // len(SAMPLE_ROLES), 1)
+    else:
+        roles, buckets = SAMPLE_ROLES, points // len(SAMPLE_ROLES)
+
+    series = {}
+    for sensor_id, (rows, range_end) in bucket_rows(db, drive_id, sensor_ids, start, end, buckets, points).items():
+        samples = role_samples(rows, roles, start, range_end)
+        if algorithm == LTTB and len(samples) > points:
+            times = samples["time"].to_numpy()
+            values = decode_values(sensor_id, samples["payload"].to_numpy())
+            samples = samples.iloc[lttb_indices((times - times[0]).astype(np.float64), values, points)]
+        series[sensor_id] = samples.assign(msg_id=sensor_id)
+    return series
+
+
+def downsample_sensors(db: Session, drive_id: int, sensor_ids: List[int], start: int = 0, end: int = -1,
+                       points: int = DOWNSAMPLE_POINTS, algorithm: str = MINMAX) -> Dict[int, List[Dict]]:
+    '''downsample_series as sensor_id -> RawData-shaped dicts'''
+    series = downsample_series(db, drive_id, sensor_ids, start, end, points, algorithm)
+    return {sensor_id: raw_data_records(samples) for sensor_id, samples in series.items()}
+
+
+def downsample_sensor(db: Session, drive_id: int, sensor_id: int, start: int = 0, end: int = -1,
+                      points: int = DOWNSAMPLE_POINTS, algorithm: str = MINMAX) -> List[Dict]:
+    return downsample_sensors(db, drive_id, [sensor_id], start, end, points, algorithm)[sensor_id]
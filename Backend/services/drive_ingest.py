@@ -0,0 +1,286 @@
+# file: drive_ingest.py
+# Desc: Bulk ingest engine for drive uploads (CSV or raw Pi binary logs). Remaps CAN frames with
+# vectorized column operations and writes them to raw_data in fixed-size COPY batches (no ORM objects)
+
+from typing import BinaryIO, Callable, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+from dataclasses import dataclass
+import logging
+import os
+import struct
+import time
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from .. import crud
+from . import downsample, response_cache, sensor_stats
+from .sensor_values import manifest_row, summarize_laps, summarize_sensors
+from .livetelemetry_decoder import PI_TO_SERVER_FMT
+
+# Max number of CSV rows transformed and copied at once. Bounds ingest memory use
+# regardless of how big the uploaded file is.
+INGEST_BATCH_ROWS : int = int(os.getenv("INGEST_BATCH_ROWS", "50000"))
+
+CSV_FORMAT, BINARY_FORMAT = "csv", "bin"
+FILE_FORMATS = (CSV_FORMAT, BINARY_FORMAT)
+BINARY_EXTENSIONS = (".bin", ".dat")
+
+HOT_BOX_MSG_IDS = (50, 54) # inclusive range, each frame holds 3 two-byte sensors
+ACCEL_MSG_ID = 4 # first byte selects the axis (400 + axis)
+
+# NumPy view of the Pi's 14 byte PI_TO_SERVER_FMT record (<I B B 8s), used to decode binary logs
+PI_RECORD_DTYPE = np.dtype([
+    ("time", "<u4"),
+    ("msg_id", "u1"),
+    ("length", "u1"),
+    ("payload", "u1", (8,)),
+])
+assert PI_RECORD_DTYPE.itemsize == struct.calcsize(PI_TO_SERVER_FMT)
+
+logger = logging.getLogger(__name__)
+
+
+class CanFrames(NamedTuple):
+    msg_id: np.ndarray # int64, shape (n,)
+    time: np.ndarray # int64, shape (n,)
+    payload: np.ndarray # int64, shape (n, 8)
+
+
+@dataclass
+class IngestStats:
+    rows_read: int = 0
+    rows_written: int = 0
+    seconds: float = 0.0
+
+    @property
+    def rows_per_sec(self) -> float:
+        return self.rows_written / self.seconds if self.seconds > 0 else 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "rows_read": self.rows_read,
+            "rows_written": self.rows_written,
+            "seconds": round(self.seconds, 3),
+            "rows_per_sec": round(self.rows_per_sec, 1),
+        }
+
+
+# ========== Transforming CSV rows ===========
+
+def split_csv_columns(frame: pd.DataFrame) -> CanFrames:
+    '''Pull msg_id, time and the 8 buffer columns out of an uploaded CSV chunk by position.
+    Missing buffer columns/cells are zero padded like live packets are.'''
+    columns = frame.iloc[:, :10]
+    msg_id = columns.iloc[:, 0].to_numpy(dtype=np.int64)
+    timestamps = columns.iloc[:, 1].to_numpy(dtype=np.int64)
+
+    payload = np.zeros((len(columns), 8), dtype=np.int64)
+    buffers = columns.iloc[:, 2:].fillna(0).to_numpy(dtype=np.int64)
+    payload[:, :buffers.shape[1]] = buffers
+
+    return CanFrames(msg_id, timestamps, payload)
+
+
+def split_binary_records(records: np.ndarray) -> CanFrames:
+    '''Columns from PI_RECORD_DTYPE records. Bytes past each record's length are zeroed,
+    same as live_writer does for live packets.'''
+    payload = records["payload"].astype(np.int64)
+    payload[np.arange(8) >= records["length"][:, None]] = 0
+    return CanFrames(
+        records["msg_id"].astype(np.int64),
+        records["time"].astype(np.int64),
+        payload,
+    )
+
+
+def remap_can_frames(frames: CanFrames) -> CanFrames:
+    '''Vectorized version of the per-row hot box / accelerometer remapping.
+    Hot box (msg 50-54) -> three rows msg*10 + k holding buffers [2k, 2k+1]
+    Accelerometer (msg 4) -> one row 400 + buffers[0] holding buffers [1:5]
+    Everything else is passed through. Output keeps the original file order.'''
+    msg_id, timestamps, payload = frames
+
+    hot_box = (msg_id >= HOT_BOX_MSG_IDS[0]) & (msg_id <= HOT_BOX_MSG_IDS[1])
+    accel = msg_id == ACCEL_MSG_ID
+
+    # Sort keys: every input row owns 3 output slots so expanded rows stay in place
+    keys, msg_ids, times, payloads = [], [], [], []
+
+    rows = np.flatnonzero(~(hot_box | accel))
+    keys.append(rows * 3)
+    msg_ids.append(msg_id[rows])
+    times.append(timestamps[rows])
+    payloads.append(payload[rows])
+
+    rows = np.flatnonzero(accel)
+    accel_payload = np.zeros((len(rows), 8), dtype=np.int64)
+    accel_payload[:, :4] = payload[rows, 1:5]
+    keys.append(rows * 3)
+    msg_ids.append(msg_id[rows] * 100 + payload[rows, 0])
+    times.append(timestamps[rows])
+    payloads.append(accel_payload)
+
+    rows = np.flatnonzero(hot_box)
+    for k in range(3):
+        hot_box_payload = np.zeros((len(rows), 8), dtype=np.int64)
+        hot_box_payload[:, :2] = payload[rows, 2 * k:2 * k + 2]
+        keys.append(rows * 3 + k)
+        msg_ids.append(msg_id[rows] * 10 + k)
+        times.append(timestamps[rows])
+        payloads.append(hot_box_payload)
+
+    order = np.argsort(np.concatenate(keys), kind="stable")
+    return CanFrames(
+        np.concatenate(msg_ids)[order],
+        np.concatenate(times)[order],
+        np.concatenate(payloads)[order],
+    )
+
+
+# ========== Writing to database ===========
+
+def iter_csv_batches(source: BinaryIO) -> Iterator[pd.DataFrame]:
+    '''Incrementally parse an uploaded CSV file object, INGEST_BATCH_ROWS rows at a time.
+    Only one batch is ever held in memory.'''
+    return pd.read_csv(source, chunksize=INGEST_BATCH_ROWS)
+
+
+def ingest_frames(db: Session, drive_id: int, batches: Iterable[Tuple[int, CanFrames]],
+                  commit_each_batch: bool = False,
+                  on_batch: Optional[Callable[[IngestStats], None]] = None) -> IngestStats:
+    '''COPY every (source rows, remapped frames) batch into raw_data for drive_id.
+    With commit_each_batch every batch is committed as soon as it is written, otherwise
+    the caller owns the transaction (commit / rollback).
+    on_batch is called with the running stats after every batch; raising from it stops the ingest.'''
+    stats = IngestStats()
+    started = time.perf_counter()
+
+    for rows_read, frames in batches:
+        crud.copy_raw_data(db, drive_id, frames.msg_id, frames.time, frames.payload)
+        update_drive_summaries(db, drive_id, frames.msg_id, frames.time, crud.pack_payloads(frames.payload))
+
+        if commit_each_batch:
+            db.commit()
+
+        stats.rows_read += rows_read
+        stats.rows_written += len(frames.msg_id)
+        stats.seconds = time.perf_counter() - started
+        if on_batch is not None:
+            on_batch(stats)
+
+    stats.seconds = time.perf_counter() - started
+    logger.info(
+        "Ingested drive_id=%s: %s source rows -> %s raw_data rows in %.2fs (%.0f rows/s)",
+        drive_id,
+        stats.rows_read,
+        stats.rows_written,
+        stats.seconds,
+        stats.rows_per_sec
+    )
+    return stats
+
+
+def ingest_csv_frames(db: Session, drive_id: int, chunks: Iterable[pd.DataFrame],
+                      commit_each_batch: bool = False,
+                      on_batch: Optional[Callable[[IngestStats], None]] = None) -> IngestStats:
+    '''Transform and COPY every chunk of CSV rows into raw_data for drive_id.
+    Chunks larger than INGEST_BATCH_ROWS are split so memory per batch stays fixed.'''
+    def batches():
+        for chunk in chunks:
+            for offset in range(0, len(chunk), INGEST_BATCH_ROWS):
+                batch = chunk.iloc[offset:offset + INGEST_BATCH_ROWS]
+                yield len(batch), remap_can_frames(split_csv_columns(batch))
+
+    return ingest_frames(db, drive_id, batches(), commit_each_batch, on_batch)
+
+
+def ingest_csv_file(db: Session, drive_id: int, source: BinaryIO,
+                    on_batch: Optional[Callable[[IngestStats], None]] = None) -> IngestStats:
+    '''Stream a CSV file object into raw_data, committing batch by batch.
+    If a batch fails, the batches before it stay committed.'''
+    return ingest_csv_frames(
+        db, drive_id, iter_csv_batches(source), commit_each_batch=True, on_batch=on_batch
+    )
+
+
+def ingest_binary_file(db: Session, drive_id: int, path: str,
+                       on_batch: Optional[Callable[[IngestStats], None]] = None) -> IngestStats:
+    '''Ingest a raw Pi log (concatenated 14 byte PI_TO_SERVER_FMT records) from disk.
+    The file is memory-mapped and decoded a batch at a time straight into NumPy columns,
+    then committed batch by batch like ingest_csv_file.'''
+    size = os.path.getsize(path)
+    if size % PI_RECORD_DTYPE.itemsize != 0:
+        raise ValueError(
+            f"Binary log size {size} is not a multiple of the {PI_RECORD_DTYPE.itemsize} byte record size"
+        )
+
+    records = np.memmap(path, dtype=PI_RECORD_DTYPE, mode="r") if size else np.empty(0, PI_RECORD_DTYPE)
+
+    def batches():
+        for offset in range(0, len(records), INGEST_BATCH_ROWS):
+            batch = records[offset:offset + INGEST_BATCH_ROWS]
+            yield len(batch), remap_can_frames(split_binary_records(batch))
+
+    return ingest_frames(db, drive_id, batches(), commit_each_batch=True, on_batch=on_batch)
+
+
+def detect_format(filename: Optional[str]) -> str:
+    return BINARY_FORMAT if (filename or "").lower().endswith(BINARY_EXTENSIONS) else CSV_FORMAT
+
+
+def ingest_file(db: Session, drive_id: int, path: str, file_format: str,
+                on_batch: Optional[Callable[[IngestStats], None]] = None) -> IngestStats:
+    '''Ingest a spooled upload from disk in either CSV_FORMAT or BINARY_FORMAT'''
+    if file_format == BINARY_FORMAT:
+        return ingest_binary_file(db, drive_id, path, on_batch)
+    with open(path, "rb") as source:
+        return ingest_csv_file(db, drive_id, source, on_batch)
+
+
+# ========== Summaries ===========
+
+def update_drive_summaries(db: Session, drive_id: int, msg_ids: np.ndarray, times: np.ndarray, packed: np.ndarray):
+    '''Fold rows just written to raw_data (packed payloads) into the drive's sensor manifest, channel
+    statistics and lap index. Doesn't commit, so they land in the same transaction as the rows.'''
+    # Sensors with samples but no channel statistics yet (drives from before the statistics) are computed
+    # from raw_data once, the batch is already in it. After that they merge batch by batch like every other sensor
+    stale = crud.get_sensors_without_channel_stats(db, drive_id, np.unique(msg_ids).tolist())
+    if stale:
+        rebuild_channel_stats(db, drive_id, stale)
+    fresh = ~np.isin(msg_ids, stale)
+    crud.upsert_sensor_manifest(db, drive_id, summarize_sensors(msg_ids, times, packed))
+    crud.upsert_channel_stats(db, drive_id, sensor_stats.summarize_channels(msg_ids[fresh], times[fresh], packed[fresh]))
+    crud.upsert_drive_laps(db, drive_id, summarize_laps(msg_ids, times, packed))
+
+
+def rebuild_channel_stats(db: Session, drive_id: int, sensor_ids: Optional[List[int]] = None):
+    '''Exact channel statistics of a drive's sensors (default all) from raw_data. Doesn't commit'''
+    samples = crud.get_sensor_columns(db, drive_id, sensor_ids)
+    rows = []
+    for msg_id, sensor in samples.groupby("msg_id"):
+        rows.extend(sensor_stats.exact_stats(int(msg_id), sensor["time"].to_numpy(), sensor["payload"].to_numpy()))
+    crud.replace_channel_stats(db, drive_id, rows, sensor_ids)
+
+
+# ========== After ingest ===========
+
+def finalize_drive(db: Session, drive_id: int):
+    '''Build everything derived from a drive's raw_data once no more rows are coming
+    (upload finished or cancelled, live drive closed). Safe to re-run, it rebuilds from scratch.'''
+    # The manifest and statistics were kept up to date batch by batch, this recomputes them from what's
+    # actually stored and adds the percentiles, off the same scan the pyramids are built from
+    manifest, channel_stats = [], []
+
+    def summarize(sensor_id: int, samples: pd.DataFrame, values: np.ndarray):
+        times = samples["time"].to_numpy()
+        manifest.append(manifest_row(sensor_id, times, values))
+        channel_stats.extend(sensor_stats.exact_stats(sensor_id, times, samples["payload"].to_numpy()))
+
+    downsample.build_drive_pyramids(db, drive_id, on_sensor=summarize)
+    crud.replace_sensor_manifest(db, drive_id, manifest)
+    crud.replace_channel_stats(db, drive_id, channel_stats)
+    crud.rebuild_drive_laps(db, drive_id)
+    db.commit()
+    # Also clears the on-disk tier when this runs outside the API process (batch workers, backfill script)
+    response_cache.cache.invalidate_drive(drive_id)
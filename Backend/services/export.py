@@ -0,0 +1,117 @@
+# file: export.py
+# Desc: Streams Postgres COPY ... TO STDOUT output to HTTP clients in chunks, optionally gzipped on the fly.
+# psycopg2 only pushes COPY data into a file object, so the COPY runs in a worker thread that fills a small
+# bounded queue and the response generator drains it. Memory stays at a few chunks however big the drive
+# is, and the first rows go out as soon as Postgres produces them.
+
+from typing import Iterable, Iterator, List
+import logging
+import queue
+import threading
+import zlib
+
+from ..database import engine
+
+EXPORT_CHUNK_BYTES : int = 256 * 1024
+# Chunks buffered between the COPY thread and the client, bounds memory for slow clients
+EXPORT_QUEUE_CHUNKS : int = 8
+# Fastest level: ~2.5x smaller CSV at ~50 MB/s, level 6 only saves another 15% at a tenth of the speed
+GZIP_LEVEL : int = 1
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class _ChunkWriter:
+    '''File-like target for copy_expert: batches psycopg2's per-row writes into EXPORT_CHUNK_BYTES chunks'''
+
+    def __init__(self, chunks: queue.Queue, cancelled: threading.Event):
+        self.chunks = chunks
+        self.cancelled = cancelled
+        self.buffer = bytearray()
+
+    def write(self, data: bytes):
+        self.buffer += data
+        if len(self.buffer) >= EXPORT_CHUNK_BYTES:
+            self.flush()
+
+    def flush(self):
+        if not self.buffer:
+            return
+        chunk, self.buffer = bytes(self.buffer), bytearray()
+        while True:
+            if self.cancelled.is_set():
+                raise ExportCancelled()
+            try:
+                self.chunks.put(chunk, timeout=0.5)
+                return
+            except queue.Full:
+                continue
+
+
+def stream_copy_out(copy_sql: str) -> Iterator[bytes]:
+    '''Yield the output of a `COPY (...) TO STDOUT` statement in chunks that always end on a row boundary.
+    Runs on its own pooled connection, not a request session, because FastAPI closes those before
+    streaming starts.'''
+    chunks: queue.Queue = queue.Queue(maxsize=EXPORT_QUEUE_CHUNKS)
+    cancelled = threading.Event()
+    errors: List[Exception] = []
+
+    def produce():
+        connection = engine.raw_connection()
+        try:
+            writer = _ChunkWriter(chunks, cancelled)
+            cursor = connection.cursor()
+            cursor.copy_expert(copy_sql, writer)
+            writer.flush()
+            connection.rollback()
+            connection.close()
+        except Exception as e:
+            # Aborted mid-COPY, the connection can't go back to the pool
+            connection.invalidate()
+            if not isinstance(e, ExportCancelled):
+                errors.append(e)
+        finally:
+            chunks.put(_DONE)
+
+    producer = threading.Thread(target=produce, name="copy-export", daemon=True)
+    producer.start()
+    try:
+        while (chunk := chunks.get()) is not _DONE:
+            yield chunk
+        if errors:
+            logger.error("COPY export failed: %s", errors[0])
+            raise errors[0]
+    finally:
+        # Client went away (or we're done): stop the COPY and let the thread finish
+        cancelled.set()
+        while producer.is_alive():
+            try:
+                chunks.get(timeout=0.5)
+            except queue.Empty:
+                pass
+
+
+def gzip_chunks(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    compressor = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def json_array_chunks(lines: Iterable[bytes]) -> Iterator[bytes]:
+    '''NDJSON chunks (whole lines only, as stream_copy_out yields them) -> one streamed JSON array'''
+    yield b"["
+    separator = b""
+    for chunk in lines:
+        yield separator + chunk.rstrip(b"\n").replace(b"\n", b",")
+        separator = b","
+    yield b"]"
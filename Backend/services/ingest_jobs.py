@@ -0,0 +1,206 @@
+# file: ingest_jobs.py
+# Desc: Background ingest jobs. Uploads are spooled to a temp file and handed to a worker
+# thread pool, so the HTTP request returns a job id right away. Tracks progress and cancellation.
+
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import BinaryIO, Dict, List, Optional
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from sqlalchemy.orm import Session
+
+from ..database import SessionLocal
+from . import drive_ingest, response_cache
+
+# Number of uploads parsed / inserted at the same time
+INGEST_WORKERS : int = int(os.getenv("INGEST_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Finished jobs kept around so clients can still read their final status
+MAX_FINISHED_JOBS : int = 200
+UPLOAD_COPY_CHUNK_BYTES = 1024 * 1024
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED_STATES = {SUCCEEDED, FAILED, CANCELLED}
+
+logger = logging.getLogger(__name__)
+
+
+class IngestCancelled(Exception):
+    pass
+
+
+class IngestJob:
+    def __init__(self, drive_id: int, filename: str, path: str, file_format: str):
+        self.job_id: str = uuid.uuid4().hex
+        self.drive_id = drive_id
+        self.filename = filename
+        self.path = path
+        self.file_format = file_format
+        self.status: str = QUEUED
+        self.error: Optional[str] = None
+
+        self.total_bytes: int = os.path.getsize(path)
+        self.bytes_read: int = 0
+        self.stats = drive_ingest.IngestStats()
+
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[datetime] = None
+
+        self.cancel_requested = threading.Event()
+        self.future: Optional[Future] = None
+
+    def eta_seconds(self) -> Optional[float]:
+        if self.status != RUNNING or self.bytes_read <= 0 or self.started_at is None:
+            return None
+        elapsed = time.perf_counter() - self.started_at
+        remaining = max(self.total_bytes - self.bytes_read, 0)
+        return round(remaining * elapsed / self.bytes_read, 1)
+
+    def as_dict(self) -> Dict:
+        return {
+            "job_id": self.job_id,
+            "drive_id": self.drive_id,
+            "filename": self.filename,
+            "format": self.file_format,
+            "status": self.status,
+            "error": self.error,
+            "total_bytes": self.total_bytes,
+            "bytes_read": self.bytes_read,
+            **self.stats.as_dict(),
+            "eta_seconds": self.eta_seconds(),
+            "created_at": self.created_at.isoformat(),
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+        }
+
+
+class IngestJobManager:
+    def __init__(self, max_workers: int = INGEST_WORKERS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        # Guards _jobs and every job's status / finished_at, which worker threads change while requests read them
+        self._jobs: Dict[str, IngestJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, drive_id: int, upload: BinaryIO, filename: str, file_format: str) -> IngestJob:
+        '''Copy the upload out of the request (it's closed once the response is sent) and queue it.
+        file_format is drive_ingest.CSV_FORMAT or drive_ingest.BINARY_FORMAT'''
+        with tempfile.NamedTemporaryFile(prefix="ava-ingest-", suffix=f".{file_format}", delete=False) as spool:
+            shutil.copyfileobj(upload, spool, UPLOAD_COPY_CHUNK_BYTES)
+
+        job = IngestJob(drive_id, filename, spool.name, file_format)
+        # The drive's cached responses are stale from here until the job finishes
+        response_cache.cache.begin_write(drive_id)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune_finished()
+        job.future = self._executor.submit(self._run, job)
+
+        logger.info("Queued ingest job %s for drive_id=%s (%s bytes)", job.job_id, drive_id, job.total_bytes)
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list_jobs(self, drive_id: Optional[int] = None) -> List[IngestJob]:
+        with self._lock:
+            jobs = list(self._jobs.values())
+        if drive_id is not None:
+            jobs = [job for job in jobs if job.drive_id == drive_id]
+        return sorted(jobs, key=lambda job: job.created_at, reverse=True)
+
+    def cancel(self, job_id: str) -> Optional[IngestJob]:
+        '''Stop a job. Queued jobs never start, running jobs stop after their current batch
+        (batches already committed stay in the drive).'''
+        job = self.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return job
+
+        job.cancel_requested.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, CANCELLED)
+        return job
+
+    def _run(self, job: IngestJob):
+        if job.cancel_requested.is_set():
+            self._finish(job, CANCELLED)
+            return
+
+        with self._lock:
+            job.status = RUNNING
+        job.started_at = time.perf_counter()
+        db = SessionLocal()
+        try:
+            def track(bytes_read):
+                def on_batch(stats: drive_ingest.IngestStats):
+                    job.stats = stats
+                    job.bytes_read = min(bytes_read(stats), job.total_bytes)
+                    if job.cancel_requested.is_set():
+                        raise IngestCancelled()
+                return on_batch
+
+            if job.file_format == drive_ingest.BINARY_FORMAT:
+                record_size = drive_ingest.PI_RECORD_DTYPE.itemsize
+                job.stats = drive_ingest.ingest_binary_file(
+                    db, job.drive_id, job.path, track(lambda stats: stats.rows_read * record_size)
+                )
+            else:
+                with open(job.path, "rb") as source:
+                    job.stats = drive_ingest.ingest_csv_file(
+                        db, job.drive_id, source, track(lambda stats: source.tell())
+                    )
+            job.bytes_read = job.total_bytes
+            self._finalize(db, job)
+            self._finish(job, SUCCEEDED)
+        except IngestCancelled:
+            # Batches before the cancel are committed and stay, so they get summarized too
+            self._finalize(db, job)
+            self._finish(job, CANCELLED)
+        except Exception as e:
+            db.rollback()
+            job.error = str(e)
+            self._finalize(db, job)
+            self._finish(job, FAILED)
+        finally:
+            db.close()
+
+    def _finalize(self, db: Session, job: IngestJob):
+        try:
+            drive_ingest.finalize_drive(db, job.drive_id)
+        except Exception as e:
+            db.rollback()
+            logger.error("Failed to finalize drive_id=%s after ingest job %s: %s", job.drive_id, job.job_id, e)
+
+    def _finish(self, job: IngestJob, status: str):
+        # finished_at before status, both under the lock: _prune_finished sorts finished jobs by finished_at
+        with self._lock:
+            job.finished_at = datetime.now(timezone.utc)
+            job.status = status
+        response_cache.cache.end_write(job.drive_id)
+        try:
+            os.remove(job.path)
+        except OSError:
+            pass
+        logger.info(
+            "Ingest job %s for drive_id=%s %s after %s rows%s",
+            job.job_id,
+            job.drive_id,
+            status,
+            job.stats.rows_written,
+            f" ({job.error})" if job.error else ""
+        )
+
+    def _prune_finished(self):
+        # Caller holds self._lock
+        finished = [job for job in self._jobs.values() if job.status in FINISHED_STATES]
+        finished.sort(key=lambda job: job.finished_at)
+        for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+            del self._jobs[job.job_id]
+
+
+manager = IngestJobManager()
@@ -0,0 +1,265 @@
+# file: live_clients.py
+# Desc: Per-client outbound queues for the live telemetry fan-out. Broadcasting only appends to each
+# dashboard's bounded queue; every client has its own sender task draining it, so one slow phone on
+# pit-lane Wi-Fi can't hold up the other dashboards or the /ws/send receive loop. Messages are encoded
+# once per broadcast (orjson) and every queue holds the same pre-encoded frame.
+# Feed formats, picked with ?format= on /ws/livetelemetry:
+#   json      every message is a JSON text frame (default, what the dashboard uses)
+#   protobuf  telemetry and telemetry batches arrive as binary ava3.TelemetryBatch frames (proto/ava3.proto),
+#             control messages (connection, drive, database...) stay JSON text frames
+# Telemetry delivery, picked with ?batch= on /ws/livetelemetry:
+#   off (default)  one telemetry message per CAN frame, as it arrives
+#   ?batch=1       one telemetry_batch message per coalescing tick (services/live_coalescer.py)
+# Overflow policies:
+#   drop_oldest  oldest queued message goes when the queue is full
+#   latest       telemetry keeps only the newest value per msg_id (a slow client skips intermediate
+#                values but still sees every sensor), other messages queue as usual. Telemetry batches
+#                (services/live_coalescer.py) merge into the client's one pending batch per msg_id, which
+#                is only encoded once the sender gets to it
+# Clients that fall more than LIVE_CLIENT_MAX_LAG_SEC behind (oldest queued message that old, or no send
+# finishing for that long while messages wait) are disconnected.
+
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Optional, Union
+import asyncio
+import itertools
+import logging
+import os
+import time
+
+import orjson
+from fastapi import WebSocket
+
+from ..protobuf.proto import ava3_pb2
+
+DROP_OLDEST = "drop_oldest"
+LATEST = "latest"
+OVERFLOW_POLICIES = (DROP_OLDEST, LATEST)
+JSON_FORMAT = "json"
+PROTOBUF_FORMAT = "protobuf"
+LIVE_FORMATS = (JSON_FORMAT, PROTOBUF_FORMAT)
+
+# Messages queued per client
+LIVE_CLIENT_QUEUE_MESSAGES : int = int(os.getenv("LIVE_CLIENT_QUEUE_MESSAGES", "2000"))
+# Default overflow policy, clients can pick another with ?overflow= on /ws/livetelemetry
+LIVE_CLIENT_OVERFLOW : str = os.getenv("LIVE_CLIENT_OVERFLOW", DROP_OLDEST)
+# A client this far behind is disconnected (it can reconnect and start from live data again)
+LIVE_CLIENT_MAX_LAG_SEC : float = float(os.getenv("LIVE_CLIENT_MAX_LAG_SEC", "5"))
+# Largest binary frame a sender builds out of queued protobuf batches
+LIVE_CLIENT_MAX_FRAME_BYTES : int = int(os.getenv("LIVE_CLIENT_MAX_FRAME_BYTES", str(64 * 1024)))
+# Close code for lagging clients, 1013 = try again later
+LAGGING_CLOSE_CODE = 1013
+
+logger = logging.getLogger(__name__)
+
+# Pre-encoded message: text (JSON) or binary WebSocket frame
+Frame = Union[str, bytes]
+# Queue key of a latest client's pending merged telemetry batch
+BATCH_KEY = ("telemetry_batch",)
+
+
+def telemetry_samples(message: Dict) -> Optional[List[Dict]]:
+    '''Telemetry messages carried by a telemetry or telemetry_batch message (services/live_coalescer.py),
+    None for control messages'''
+    message_type = message.get("type")
+    if message_type == "telemetry":
+        return [message]
+    if message_type == "telemetry_batch":
+        return message["messages"]
+    return None
+
+
+def encode_frame(message: Dict, live_format: str = JSON_FORMAT) -> Frame:
+    '''JSON text frame (same compact JSON Starlette's send_json produces), or for protobuf clients an
+    ava3.TelemetryBatch binary frame with the message's samples'''
+    samples = telemetry_samples(message) if live_format == PROTOBUF_FORMAT else None
+    if samples is not None:
+        batch = ava3_pb2.TelemetryBatch()
+        for sample in samples:
+            batch.samples.add(
+                type=sample["type"],
+                timestamp=str(sample["timestamp"]),
+                id=sample["id"],
+                data=[str(value) for value in sample["data"]],
+            )
+        return batch.SerializeToString()
+    return orjson.dumps(message).decode()
+
+
+def latest_key(message: Dict) -> Optional[Hashable]:
+    '''Key the latest overflow policy coalesces on, None for messages that always queue'''
+    if message.get("type") == "telemetry":
+        return ("telemetry", message.get("id"))
+    return None
+
+
+class LiveClient:
+    def __init__(self, websocket: WebSocket, on_closed: Callable[["LiveClient"], None],
+                 overflow: str = LIVE_CLIENT_OVERFLOW, live_format: str = JSON_FORMAT, batch: bool = False,
+                 max_messages: int = LIVE_CLIENT_QUEUE_MESSAGES, max_lag: float = LIVE_CLIENT_MAX_LAG_SEC):
+        self.websocket = websocket
+        self.overflow = overflow
+        self.live_format = live_format
+        self.batch = batch
+        self.max_messages = max_messages
+        self.max_lag = max_lag
+        self._on_closed = on_closed
+        # key -> (enqueued at, frame), in send order. The frame under BATCH_KEY is a telemetry_batch message
+        # whose "messages" is a msg_id -> message dict, encoded when it's sent
+        self._queue: "OrderedDict[object, tuple]" = OrderedDict()
+        self._keys = itertools.count()
+        self._ready = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self._sending = False
+        # Last time the client made progress: a send finished, or a message arrived with nothing pending
+        self._progress_at = time.monotonic()
+        self.closed = False
+
+        self.sent: int = 0
+        self.frames: int = 0
+        self.dropped: int = 0
+        self.replaced: int = 0
+        self.connected_at = time.monotonic()
+
+    def start(self):
+        self._task = asyncio.create_task(self._send_loop())
+
+    # ========== Producer side (never awaits) ===========
+
+    def enqueue(self, frame: Frame, key: Optional[Hashable] = None) -> bool:
+        '''Queue an encoded frame for this client (key: see latest_key). False if the client is lagging too
+        far behind and should be dropped.'''
+        if self.closed:
+            return True
+        now = time.monotonic()
+        if self.lag(now) > self.max_lag:
+            return False
+        if not self._queue and not self._sending:
+            self._progress_at = now
+
+        if self.overflow == LATEST and key is not None:
+            queued = self._queue.get(key)
+            if queued is not None:
+                # Keeps its place (and age) in the queue, just with the newer value
+                self._queue[key] = (queued[0], frame)
+                self.replaced += 1
+                return True
+        else:
+            key = next(self._keys)
+
+        self._queue[key] = (now, frame)
+        while len(self._queue) > self.max_messages:
+            self._queue.popitem(last=False)
+            self.dropped += 1
+        self._ready.set()
+        return True
+
+    def enqueue_batch(self, message: Dict) -> bool:
+        '''latest policy for a telemetry_batch message: its samples merge into the pending batch per msg_id,
+        so the client still gets every sensor's newest value. False if the client is lagging too far behind.'''
+        if self.closed:
+            return True
+        now = time.monotonic()
+        if self.lag(now) > self.max_lag:
+            return False
+        if not self._queue and not self._sending:
+            self._progress_at = now
+
+        queued = self._queue.get(BATCH_KEY)
+        if queued is None:
+            pending = {"type": message["type"], "timestamp": message["timestamp"], "messages": {}}
+            self._queue[BATCH_KEY] = (now, pending)
+        else:
+            # Keeps its place (and age) in the queue, like a single telemetry message does
+            pending = queued[1]
+            pending["timestamp"] = message["timestamp"]
+
+        samples = pending["messages"]
+        for sample in message["messages"]:
+            if sample.get("id") in samples:
+                self.replaced += 1
+            samples[sample.get("id")] = sample
+
+        while len(self._queue) > self.max_messages:
+            self._queue.popitem(last=False)
+            self.dropped += 1
+        self._ready.set()
+        return True
+
+    # ========== Sender task ===========
+
+    async def _send_loop(self):
+        try:
+            while True:
+                await self._ready.wait()
+                while self._queue:
+                    _, (_, frame) = self._queue.popitem(last=False)
+                    self._sending = True
+                    if isinstance(frame, dict):
+                        frame = encode_frame({**frame, "messages": list(frame["messages"].values())}, self.live_format)
+                    if isinstance(frame, str):
+                        messages = 1
+                        await self.websocket.send_text(frame)
+                    else:
+                        # Repeated message fields merge by concatenation, so back-to-back one-sample
+                        # TelemetryBatch frames joined together are one valid batch
+                        parts, size = [frame], len(frame)
+                        while self._queue and size < LIVE_CLIENT_MAX_FRAME_BYTES:
+                            queued = next(iter(self._queue.values()))[1]
+                            if not isinstance(queued, bytes):
+                                break
+                            self._queue.popitem(last=False)
+                            parts.append(queued)
+                            size += len(queued)
+                        messages = len(parts)
+                        await self.websocket.send_bytes(b"".join(parts))
+                    self._sending = False
+                    self._progress_at = time.monotonic()
+                    self.sent += messages
+                    self.frames += 1
+                self._ready.clear()
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Error sending to client: {e}")
+            self.closed = True
+            self._on_closed(self)
+
+    async def close(self, code: Optional[int] = None):
+        '''Stop the sender task, and close the socket with `code` if given (lagging clients)'''
+        self.closed = True
+        self._queue.clear()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+        if code is not None:
+            try:
+                await self.websocket.close(code=code)
+            except Exception:
+                pass
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._queue)
+
+    def lag(self, now: Optional[float] = None) -> float:
+        '''Seconds this client is behind, 0 while it's keeping up'''
+        if not self._queue and not self._sending:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        oldest = next(iter(self._queue.values()))[0] if self._queue else now
+        return now - min(oldest, self._progress_at)
+
+    def stats(self) -> Dict:
+        return {
+            "client": f"{self.websocket.client.host}:{self.websocket.client.port}" if self.websocket.client else None,
+            "overflow": self.overflow,
+            "format": self.live_format,
+            "batch": self.batch,
+            "queue_depth": self.queue_depth,
+            "lag_sec": round(self.lag(), 3),
+            "sent": self.sent,
+            "frames": self.frames,
+            "dropped": self.dropped,
+            "replaced": self.replaced,
+            "connected_sec": round(time.monotonic() - self.connected_at, 1),
+        }
@@ -0,0 +1,104 @@
+# file: live_coalescer.py
+# Desc: Tick-based coalescing of the live telemetry feed for dashboards that opt in with ?batch=1 on
+# /ws/livetelemetry. Instead of one WebSocket message per CAN frame, their telemetry from /ws/send is gathered
+# for LIVE_TICK_MS and sent as one batch per tick:
+#   {"type": "telemetry_batch", "timestamp": "<iso8601>", "messages": [<telemetry message>, ...]}
+# (one ava3.TelemetryBatch frame for protobuf clients). Dashboards repaint at 30-60 Hz, so a 25 ms tick
+# loses nothing they can show. With LIVE_TICK_LATEST only the newest message per msg_id is kept each tick.
+# Clients that don't opt in keep getting every telemetry message on its own. LIVE_TICK_MS=0 turns coalescing
+# off and batch clients get single messages too.
+
+from datetime import datetime, timezone
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional
+import asyncio
+import itertools
+import logging
+import os
+
+# Coalescing window, 0 = broadcast every message immediately
+LIVE_TICK_MS : int = int(os.getenv("LIVE_TICK_MS", "25"))
+# Keep only the newest message per msg_id within a tick
+LIVE_TICK_LATEST : bool = os.getenv("LIVE_TICK_LATEST", "false").lower() in ("1", "true", "yes")
+
+logger = logging.getLogger(__name__)
+
+
+def batch_message(messages: List[Dict]) -> Dict:
+    return {
+        "type": "telemetry_batch",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "messages": messages,
+    }
+
+
+class TickCoalescer:
+    def __init__(self, emit: Callable[[Dict], Awaitable[None]], tick_ms: int = LIVE_TICK_MS,
+                 latest_only: bool = LIVE_TICK_LATEST):
+        self.emit = emit
+        self.tick_ms = tick_ms
+        self.latest_only = latest_only
+        # key -> message in arrival order, key is the msg_id when only the latest value is kept
+        self._pending: Dict[Hashable, Dict] = {}
+        self._keys = itertools.count()
+        self._task: Optional[asyncio.Task] = None
+
+        self.messages_in: int = 0
+        self.messages_out: int = 0
+        self.replaced: int = 0
+        self.batches: int = 0
+
+    async def add(self, message: Dict):
+        '''Telemetry message for the next tick (broadcast right away when coalescing is off)'''
+        self.messages_in += 1
+        if self.tick_ms <= 0:
+            self.messages_out += 1
+            await self.emit(message)
+            return
+
+        if self.latest_only:
+            key = message.get("id")
+            if key in self._pending:
+                self.replaced += 1
+        else:
+            key = next(self._keys)
+        # Replacing keeps the msg_id's place in the batch
+        self._pending[key] = message
+
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.tick_ms / 1000)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error broadcasting telemetry batch: {e}")
+
+    async def flush(self):
+        '''Broadcast whatever the current tick has gathered'''
+        if not self._pending:
+            return
+        messages, self._pending = list(self._pending.values()), {}
+        self.messages_out += len(messages)
+        self.batches += 1
+        await self.emit(batch_message(messages))
+
+    async def close(self):
+        '''Sender went away: send the last partial tick and stop ticking until the next message'''
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict:
+        return {
+            "tick_ms": self.tick_ms,
+            "latest_only": self.latest_only,
+            "pending": len(self._pending),
+            "messages_in": self.messages_in,
+            "messages_out": self.messages_out,
+            "replaced": self.replaced,
+            "batches": self.batches,
+            "mean_batch_size": round(self.messages_out / self.batches, 1) if self.batches else None,
+        }
@@ -0,0 +1,200 @@
+# file: live_writer.py
+# Desc: Write-behind persistence for live telemetry. The /ws/send handler only drops decoded packets on a
+# bounded queue; a writer thread (one per live drive, with its own DB session) COPYs them into raw_data in
+# batches, flushed when a batch fills up or LIVE_WRITE_INTERVAL_SEC after its first packet, whichever comes
+# first. Keeps one round trip / commit per batch instead of per CAN frame and keeps the event loop free.
+
+from typing import Dict, List, Optional, Tuple
+import logging
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+
+from .. import crud, models
+from ..database import SessionLocal
+from . import drive_ingest
+
+# Packets waiting to be written, past this new packets are dropped (and counted) instead of blocking the feed
+LIVE_WRITE_QUEUE_PACKETS : int = int(os.getenv("LIVE_WRITE_QUEUE_PACKETS", "100000"))
+# Rows per COPY batch
+LIVE_WRITE_BATCH_ROWS : int = int(os.getenv("LIVE_WRITE_BATCH_ROWS", "2000"))
+# Longest a packet waits in a partial batch
+LIVE_WRITE_INTERVAL_SEC : float = float(os.getenv("LIVE_WRITE_INTERVAL_SEC", "0.25"))
+# Longest flush / close wait on the writer thread (a stuck COPY or a dead thread mustn't hang the caller)
+LIVE_WRITE_FLUSH_TIMEOUT_SEC : float = float(os.getenv("LIVE_WRITE_FLUSH_TIMEOUT_SEC", "30"))
+# How often a flush waiting on the writer checks that its thread is still alive
+WRITER_ALIVE_CHECK_SEC = 0.5
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class LiveWriter:
+    def __init__(self, drive_id: int, max_packets: int = LIVE_WRITE_QUEUE_PACKETS,
+                 batch_rows: int = LIVE_WRITE_BATCH_ROWS, interval: float = LIVE_WRITE_INTERVAL_SEC):
+        self.drive_id = drive_id
+        self.batch_rows = batch_rows
+        self.interval = interval
+        self._queue: queue.Queue = queue.Queue(maxsize=max_packets)
+        self._lock = threading.Lock()
+
+        self.packets_queued: int = 0
+        self.packets_written: int = 0
+        self.packets_dropped: int = 0
+        self.packets_failed: int = 0
+        self.batches: int = 0
+        self.max_queue_depth: int = 0
+        self.last_flush_ms: Optional[float] = None
+        self.max_flush_ms: float = 0.0
+        self.total_flush_ms: float = 0.0
+        self.closed: bool = False
+
+        self._thread = threading.Thread(target=self._run, name=f"live-writer-{drive_id}", daemon=True)
+        self._thread.start()
+
+    # ========== Event loop side ===========
+
+    def submit(self, msg_id: int, timestamp: int, raw_data: List[int]) -> bool:
+        '''Queue one decoded packet, never blocks. False if the queue is full and the packet was dropped.'''
+        try:
+            self._queue.put_nowait((msg_id, timestamp, raw_data))
+        except queue.Full:
+            with self._lock:
+                self.packets_dropped += 1
+                if self.packets_dropped == 1 or self.packets_dropped % 10000 == 0:
+                    logger.warning("Live write queue full for drive_id=%s, %s packets dropped", self.drive_id, self.packets_dropped)
+            return False
+        with self._lock:
+            self.packets_queued += 1
+            self.max_queue_depth = max(self.max_queue_depth, self._queue.qsize())
+        return True
+
+    # ========== Blocking (call with asyncio.to_thread) ===========
+
+    def flush(self, timeout: float = LIVE_WRITE_FLUSH_TIMEOUT_SEC) -> bool:
+        '''Wait until every packet submitted so far is committed (or failed). False if that didn't happen
+        within `timeout` seconds or the writer thread is gone.'''
+        if self.closed:
+            return True
+        deadline = time.monotonic() + timeout
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            logger.error("Live writer for drive_id=%s: flush timed out after %ss, queue still full", self.drive_id, timeout)
+            return False
+        while not done.wait(min(WRITER_ALIVE_CHECK_SEC, max(deadline - time.monotonic(), 0))):
+            if not self._thread.is_alive():
+                logger.error("Live writer for drive_id=%s: writer thread died, queue depth %s",
+                             self.drive_id, self._queue.qsize())
+                return False
+            if time.monotonic() >= deadline:
+                logger.error("Live writer for drive_id=%s: flush timed out after %ss, queue depth %s",
+                             self.drive_id, timeout, self._queue.qsize())
+                return False
+        return True
+
+    def close(self, timeout: float = LIVE_WRITE_FLUSH_TIMEOUT_SEC):
+        '''Flush what's left and stop the writer thread (gives up after `timeout` seconds, the thread is a daemon)'''
+        if self.closed:
+            return
+        try:
+            self._queue.put(_STOP, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logger.error("Live writer for drive_id=%s didn't stop within %ss, queue depth %s",
+                         self.drive_id, timeout, self._queue.qsize())
+        self.closed = True
+        logger.info(
+            "Live writer for drive_id=%s closed: %s packets written in %s batches, %s dropped, %s failed",
+            self.drive_id, self.packets_written, self.batches, self.packets_dropped, self.packets_failed
+        )
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "drive_id": self.drive_id,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self.max_queue_depth,
+                "queue_capacity": self._queue.maxsize,
+                "packets_queued": self.packets_queued,
+                "packets_written": self.packets_written,
+                "packets_dropped": self.packets_dropped,
+                "packets_failed": self.packets_failed,
+                "batches": self.batches,
+                "last_flush_ms": self.last_flush_ms,
+                "mean_flush_ms": round(self.total_flush_ms / self.batches, 2) if self.batches else None,
+                "max_flush_ms": self.max_flush_ms,
+                "closed": self.closed,
+            }
+
+    # ========== Writer thread ===========
+
+    def _run(self):
+        db = SessionLocal()
+        try:
+            stopping = False
+            while not stopping:
+                packets: List[Tuple[int, int, List[int]]] = []
+                waiters: List[threading.Event] = []
+                deadline: Optional[float] = None
+                # Block for the first packet, then fill the batch until it's full or the interval is up
+                while len(packets) < self.batch_rows:
+                    timeout = None if deadline is None else deadline - time.monotonic()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    try:
+                        item = self._queue.get(timeout=timeout)
+                    except queue.Empty:
+                        break
+                    if item is _STOP:
+                        stopping = True
+                        break
+                    if isinstance(item, threading.Event):
+                        waiters.append(item)
+                        break
+                    packets.append(item)
+                    if deadline is None:
+                        deadline = time.monotonic() + self.interval
+
+                if packets:
+                    self._write(db, packets)
+                for waiter in waiters:
+                    waiter.set()
+        finally:
+            db.close()
+
+    def _write(self, db, packets: List[Tuple[int, int, List[int]]]):
+        msg_ids = np.fromiter((packet[0] for packet in packets), dtype=np.int64, count=len(packets))
+        times = np.fromiter((packet[1] for packet in packets), dtype=np.int64, count=len(packets))
+        # Analysis pipeline expects 8-byte payloads, short packets are zero padded
+        payload = np.zeros((len(packets), models.PAYLOAD_BYTES), dtype=np.int64)
+        for row, packet in enumerate(packets):
+            raw_data = packet[2][:models.PAYLOAD_BYTES]
+            payload[row, :len(raw_data)] = raw_data
+
+        started = time.perf_counter()
+        try:
+            crud.copy_raw_data(db, self.drive_id, msg_ids, times, payload)
+            drive_ingest.update_drive_summaries(db, self.drive_id, msg_ids, times, crud.pack_payloads(payload))
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            with self._lock:
+                self.packets_failed += len(packets)
+            logger.error("Failed to persist %s live telemetry packets for drive_id=%s: %s", len(packets), self.drive_id, exc)
+            return
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.packets_written += len(packets)
+            self.batches += 1
+            self.last_flush_ms = round(elapsed_ms, 2)
+            self.max_flush_ms = max(self.max_flush_ms, round(elapsed_ms, 2))
+            self.total_flush_ms += elapsed_ms
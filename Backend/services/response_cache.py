@@ -0,0 +1,305 @@
+# file: response_cache.py
+# Desc: Response cache for the drive read endpoints. A drive's data stops changing once its upload
+# finishes or its live session closes, so identical requests can be answered from memory (or disk).
+# Byte-bounded LRU in memory, optional on-disk tier, strong ETags / If-None-Match -> 304.
+# Drives that are being written (upload job running, live session open) are never cached, and every
+# write, finalize or delete invalidates the drive's entries.
+# Single API process only: the memory tier and the which-drives-are-being-written state live in the
+# process, so with several uvicorn workers one worker keeps serving (and writing to disk) entries another
+# worker's write made stale. Run one worker, or leave the cache off (RESPONSE_CACHE_BYTES=0, no
+# RESPONSE_CACHE_DIR). The batch ingest pool is fine, the API process brackets it with begin_write /
+# end_write and the pool workers only ever invalidate.
+# Disk entries are the body behind a length-prefixed JSON header, never pickled, and are only served if
+# the body still hashes to the ETag in the header.
+
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Set
+import hashlib
+import json
+import logging
+import os
+import shutil
+import struct
+import tempfile
+import threading
+
+from fastapi import Request, Response
+from fastapi.responses import StreamingResponse
+
+# Memory budget for cached bodies
+RESPONSE_CACHE_BYTES : int = int(os.getenv("RESPONSE_CACHE_BYTES", str(256 * 1024 * 1024)))
+# Bigger responses (full drive exports...) are never cached
+RESPONSE_CACHE_MAX_ENTRY_BYTES : int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRY_BYTES", str(32 * 1024 * 1024)))
+# Directory for the on-disk tier, disabled when empty
+RESPONSE_CACHE_DIR : str = os.getenv("RESPONSE_CACHE_DIR", "")
+
+logger = logging.getLogger(__name__)
+
+# Disk entry layout: u32 header length (big-endian), JSON header, body
+DISK_HEADER_FMT = ">I"
+
+
+@dataclass
+class CachedResponse:
+    body: bytes
+    media_type: str
+    etag: str
+    headers: Dict[str, str] = field(default_factory=dict)
+
+    def to_response(self) -> Response:
+        return Response(content=self.body, media_type=self.media_type, headers=self.response_headers())
+
+    def response_headers(self) -> Dict[str, str]:
+        # no-cache: browsers keep the body but revalidate, which is a cheap 304 while the drive is unchanged
+        return {**self.headers, "ETag": self.etag, "Cache-Control": "no-cache"}
+
+
+def make_etag(body: bytes) -> str:
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if not if_none_match:
+        return False
+    # If-None-Match uses weak comparison, so a W/ prefix doesn't matter
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+class ResponseCache:
+    def __init__(self, max_bytes: int, max_entry_bytes: int, disk_dir: str = ""):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.disk_dir = disk_dir
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._drive_keys: Dict[int, Set[str]] = {}
+        self._key_drives: Dict[str, int] = {}
+        self._bytes = 0
+        # Drives with a write in progress, and a per-drive counter bumped by every invalidation so a
+        # response computed before a write can't be stored after it
+        self._writers: Counter = Counter()
+        self._generations: Counter = Counter()
+        self._lock = threading.Lock()
+        self.counters: Counter = Counter()
+
+    # ========== Lookups ===========
+
+    def get(self, drive_id: int, key: str) -> Optional[CachedResponse]:
+        with self._lock:
+            if self._writers[drive_id]:
+                self.counters["bypassed"] += 1
+                return None
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.counters["hits"] += 1
+                return entry
+
+        entry = self._read_disk(drive_id, key)
+        with self._lock:
+            if entry is not None and not self._writers[drive_id]:
+                self.counters["disk_hits"] += 1
+                self._store(drive_id, key, entry)
+                return entry
+            self.counters["misses"] += 1
+            return None
+
+    def generation(self, drive_id: int) -> int:
+        with self._lock:
+            return self._generations[drive_id]
+
+    def put(self, drive_id: int, key: str, generation: int, entry: CachedResponse):
+        if len(entry.body) > self.max_entry_bytes:
+            return
+        with self._lock:
+            if self._writers[drive_id] or self._generations[drive_id] != generation:
+                return
+            self._store(drive_id, key, entry)
+        self._write_disk(drive_id, key, entry)
+
+    def _store(self, drive_id: int, key: str, entry: CachedResponse):
+        # Caller holds the lock
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= len(previous.body)
+        self._entries[key] = entry
+        self._bytes += len(entry.body)
+        self._drive_keys.setdefault(drive_id, set()).add(key)
+        self._key_drives[key] = drive_id
+        self.counters["stores"] += 1
+
+        while self._bytes > self.max_bytes and self._entries:
+            evicted_key, evicted = self._entries.popitem(last=False)
+            self._bytes -= len(evicted.body)
+            self._drive_keys.get(self._key_drives.pop(evicted_key), set()).discard(evicted_key)
+            self.counters["evictions"] += 1
+
+    # ========== Invalidation ===========
+
+    def invalidate_drive(self, drive_id: int):
+        with self._lock:
+            self._generations[drive_id] += 1
+            for key in self._drive_keys.pop(drive_id, set()):
+                self._key_drives.pop(key, None)
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._bytes -= len(entry.body)
+            self.counters["invalidations"] += 1
+        if self.disk_dir:
+            shutil.rmtree(self._drive_dir(drive_id), ignore_errors=True)
+
+    def begin_write(self, drive_id: int):
+        '''Drive is about to change (upload queued, live session started): stop caching it'''
+        with self._lock:
+            self._writers[drive_id] += 1
+        self.invalidate_drive(drive_id)
+
+    def end_write(self, drive_id: int):
+        '''Drive's data is final again (after finalize_drive)'''
+        with self._lock:
+            self._writers[drive_id] = max(self._writers[drive_id] - 1, 0)
+            if not self._writers[drive_id]:
+                del self._writers[drive_id]
+        self.invalidate_drive(drive_id)
+
+    def is_being_written(self, drive_id: int) -> bool:
+        with self._lock:
+            return bool(self._writers[drive_id])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            lookups = self.counters["hits"] + self.counters["disk_hits"] + self.counters["misses"]
+            return {
+                "hits": self.counters["hits"],
+                "disk_hits": self.counters["disk_hits"],
+                "misses": self.counters["misses"],
+                "bypassed": self.counters["bypassed"],
+                "not_modified": self.counters["not_modified"],
+                "stores": self.counters["stores"],
+                "evictions": self.counters["evictions"],
+                "invalidations": self.counters["invalidations"],
+                "hit_rate": (self.counters["hits"] + self.counters["disk_hits"]) / lookups if lookups else None,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "disk_dir": self.disk_dir or None,
+                "drives_being_written": sorted(self._writers),
+            }
+
+    def count(self, counter: str):
+        with self._lock:
+            self.counters[counter] += 1
+
+    # ========== Disk tier ===========
+
+    def _drive_dir(self, drive_id: int) -> str:
+        return os.path.join(self.disk_dir, f"drive_{int(drive_id)}")
+
+    def _disk_path(self, drive_id: int, key: str) -> str:
+        return os.path.join(self._drive_dir(drive_id), hashlib.sha256(key.encode()).hexdigest())
+
+    def _read_disk(self, drive_id: int, key: str) -> Optional[CachedResponse]:
+        if not self.disk_dir:
+            return None
+        try:
+            with open(self._disk_path(drive_id, key), "rb") as cached:
+                data = cached.read()
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning("Unreadable response cache file for drive_id=%s: %s", drive_id, e)
+            return None
+        try:
+            (header_size,) = struct.unpack_from(DISK_HEADER_FMT, data)
+            offset = struct.calcsize(DISK_HEADER_FMT)
+            header = json.loads(data[offset:offset + header_size])
+            body = data[offset + header_size:]
+            # Wrong key (hash collision, moved file) or a body that no longer matches its ETag isn't served
+            if header["key"] != key or make_etag(body) != header["etag"]:
+                raise ValueError("key or ETag mismatch")
+            return CachedResponse(body, header["media_type"], header["etag"], dict(header["headers"]))
+        except (struct.error, ValueError, KeyError, TypeError) as e:
+            logger.warning("Invalid response cache file for drive_id=%s: %s", drive_id, e)
+            return None
+
+    def _write_disk(self, drive_id: int, key: str, entry: CachedResponse):
+        if not self.disk_dir:
+            return
+        try:
+            os.makedirs(self._drive_dir(drive_id), exist_ok=True)
+            # Write + rename so readers never see a partial file
+            header = json.dumps({
+                "key": key,
+                "etag": entry.etag,
+                "media_type": entry.media_type,
+                "headers": entry.headers,
+            }).encode()
+            with tempfile.NamedTemporaryFile(dir=self._drive_dir(drive_id), delete=False) as spool:
+                spool.write(struct.pack(DISK_HEADER_FMT, len(header)))
+                spool.write(header)
+                spool.write(entry.body)
+            os.replace(spool.name, self._disk_path(drive_id, key))
+        except OSError as e:
+            logger.warning("Could not write response cache file for drive_id=%s: %s", drive_id, e)
+
+
+cache = ResponseCache(RESPONSE_CACHE_BYTES, RESPONSE_CACHE_MAX_ENTRY_BYTES, RESPONSE_CACHE_DIR)
+
+
+# ========== Endpoint helper ===========
+
+def request_key(request: Request, response_format: str) -> str:
+    '''Path + sorted query string + negotiated format, e.g. /api/data/3/192/0/-1?points=500|json'''
+    query = "&".join(f"{name}={value}" for name, value in sorted(request.query_params.multi_items()))
+    return f"{request.url.path}?{query}|{response_format}"
+
+
+def cached_response(request: Request, drive_id: int, response_format: str, build: Callable[[], Response]) -> Response:
+    '''Answer from the cache when possible, otherwise build() the response and cache it on the way out.
+    Streamed responses are teed into the cache as they're sent (if they end up small enough).'''
+    key = request_key(request, response_format)
+    entry = cache.get(drive_id, key)
+    if entry is not None:
+        if etag_matches(request, entry.etag):
+            cache.count("not_modified")
+            return Response(status_code=304, headers=entry.response_headers())
+        return entry.to_response()
+
+    generation = cache.generation(drive_id)
+    response = build()
+    if response.status_code != 200:
+        return response
+    headers = {name: value for name, value in response.headers.items()
+               if name in ("content-disposition", "x-next-cursor")}
+    media_type = response.media_type or response.headers.get("content-type")
+
+    if isinstance(response, StreamingResponse):
+        original = response.body_iterator
+
+        async def tee():
+            parts, size = [], 0
+            async for chunk in original:
+                if parts is not None:
+                    size += len(chunk)
+                    if size <= cache.max_entry_bytes:
+                        parts.append(chunk)
+                    else:
+                        parts = None
+                yield chunk
+            if parts is not None:
+                body = b"".join(parts)
+                cache.put(drive_id, key, generation, CachedResponse(body, media_type, make_etag(body), headers))
+
+        response.body_iterator = tee()
+        return response
+
+    entry = CachedResponse(response.body, media_type, make_etag(response.body), headers)
+    cache.put(drive_id, key, generation, entry)
+    if etag_matches(request, entry.etag):
+        cache.count("not_modified")
+        return Response(status_code=304, headers=entry.response_headers())
+    response.headers["ETag"] = entry.etag
+    response.headers["Cache-Control"] = "no-cache"
+    return response
@@ -0,0 +1,115 @@
+# file: sensor_stats.py
+# Desc: Per-drive statistics of every decoded channel of every sensor (count, min, max, mean, stddev,
+# percentiles), stored in sensor_channel_stats. Messages that multiplex several instances through a selector
+# channel (TireRPM / TireTemperature per tire, RVC per axis, see can_channels) get one row per selector
+# value, so "max RPM of each tire" is a plain lookup. Count / min / max / mean / variance are merged batch by
+# batch as rows are written (parallel variance formula in crud.upsert_channel_stats), so uploads and live
+# drives keep them current without rescanning. Percentiles need every sample at once, so they're computed
+# exactly when the drive is finalized and cleared whenever more rows arrive.
+
+from typing import Dict, Iterator, List, Optional, Tuple
+import math
+
+import numpy as np
+import pandas as pd
+
+from . import can_channels
+from .sensor_values import payload_bytes
+
+STAT_PERCENTILES : Tuple[int, ...] = (1, 5, 25, 50, 75, 95, 99)
+PERCENTILE_COLUMNS = tuple(f"p{q}" for q in STAT_PERCENTILES)
+# selector of channels of messages that aren't multiplexed (it's part of the primary key, so not NULL)
+NO_SELECTOR = -1
+
+
+def channel_values(msg_id: int, packed: np.ndarray) -> Iterator[Tuple[str, np.ndarray, np.ndarray]]:
+    '''(channel, selector per sample, engineering value per sample) of every value channel of one sensor'''
+    spec = can_channels.message_spec(msg_id)
+    decoded = can_channels.decode_channels(msg_id, payload_bytes(packed))
+    if spec.selector is None:
+        selectors = np.full(len(packed), NO_SELECTOR, dtype=np.int64)
+    else:
+        selectors = decoded[spec.selector].astype(np.int64)
+    for channel in spec.value_channels:
+        yield channel.name, selectors, decoded[channel.name]
+
+
+def summarize_channels(msg_ids: np.ndarray, times: np.ndarray, packed: np.ndarray) -> pd.DataFrame:
+    '''Per (sensor, channel, selector) sample count, time range, value range, mean and sum of squared
+    deviations of a batch of samples, shaped like models.SensorChannelStats rows'''
+    frames = []
+    for msg_id in np.unique(msg_ids):
+        rows = msg_ids == msg_id
+        for channel, selectors, values in channel_values(int(msg_id), packed[rows]):
+            frames.append(pd.DataFrame({
+                "msg_id": msg_id, "channel": channel, "selector": selectors, "time": times[rows], "value": values,
+            }))
+    if not frames:
+        return pd.DataFrame()
+
+    grouped = pd.concat(frames, ignore_index=True).groupby(["msg_id", "channel", "selector"], sort=True)
+    summary = grouped.agg(
+        sample_count=("time", "size"),
+        first_time=("time", "min"),
+        last_time=("time", "max"),
+        min_value=("value", "min"),
+        max_value=("value", "max"),
+        mean_value=("value", "mean"),
+    )
+    summary["m2_value"] = grouped["value"].var(ddof=0) * summary["sample_count"]
+    return summary.reset_index()
+
+
+def exact_stats(msg_id: int, times: np.ndarray, packed: np.ndarray) -> List[Dict]:
+    '''Full sensor_channel_stats rows (percentiles included) for every sample of one sensor'''
+    rows = []
+    for channel, selectors, values in channel_values(msg_id, packed):
+        for selector in np.unique(selectors):
+            selected = selectors == selector
+            samples = values[selected]
+            mean = float(samples.mean())
+            rows.append({
+                "msg_id": msg_id,
+                "channel": channel,
+                "selector": int(selector),
+                "sample_count": len(samples),
+                "first_time": int(times[selected].min()),
+                "last_time": int(times[selected].max()),
+                "min_value": float(samples.min()),
+                "max_value": float(samples.max()),
+                "mean_value": mean,
+                "m2_value": float(np.square(samples - mean).sum()),
+                **dict(zip(PERCENTILE_COLUMNS, np.percentile(samples, STAT_PERCENTILES).tolist())),
+            })
+    return rows
+
+
+def stddev(sample_count: int, m2_value: Optional[float]) -> Optional[float]:
+    # Sample standard deviation from the sum of squared deviations
+    if m2_value is None or sample_count < 2:
+        return None
+    return math.sqrt(max(m2_value, 0.0) / (sample_count - 1))
+
+
+def stats_record(row) -> Dict:
+    '''models.SensorChannelStats row -> schemas.SensorStats shaped dict'''
+    spec = can_channels.message_spec(row.msg_id)
+    units = {channel.name: channel.unit for channel in spec.channels}
+    percentiles = {column: getattr(row, column) for column in PERCENTILE_COLUMNS}
+    multiplexed = row.selector != NO_SELECTOR
+    return {
+        "msg_id": row.msg_id,
+        "channel": row.channel,
+        "unit": units.get(row.channel, ""),
+        "selector_channel": spec.selector if multiplexed else None,
+        "selector": row.selector if multiplexed else None,
+        "count": row.sample_count,
+        "first_time": row.first_time,
+        "last_time": row.last_time,
+        "min": row.min_value,
+        "max": row.max_value,
+        "mean": row.mean_value,
+        "stddev": stddev(row.sample_count, row.m2_value),
+        # Only known once the drive is finalized
+        "percentiles": percentiles if None not in percentiles.values() else None,
+    }
@@ -0,0 +1,78 @@
+# file: sensor_values.py
+# Desc: Vectorized server-side version of the chart decoding in Frontend CANtransformations.js.
+# Turns packed raw_data payloads into the one number per sample the charts plot, so the backend can
+# rank samples (min / max, triangle areas) by the same value the user sees. Field layouts live in the
+# can_channels registry.
+
+from typing import Dict, List
+import numpy as np
+import pandas as pd
+
+from .. import models
+from . import can_channels
+
+LAP_MSG_ID = 10
+
+
+def payload_bytes(packed: np.ndarray) -> np.ndarray:
+    '''(n,) packed bigint payloads -> (n, 8) uint8, byte 0 first (see models.PackedPayload)'''
+    return np.ascontiguousarray(packed, dtype="<i8").view(np.uint8).reshape(-1, models.PAYLOAD_BYTES)
+
+
+def raw_data_records(samples: pd.DataFrame) -> List[Dict]:
+    '''(msg_id, data_id, time, payload) frame -> RawData-shaped dicts (see schemas.RawData)'''
+    raw_data = payload_bytes(samples["payload"].to_numpy()).tolist()
+    return [
+        {"data_id": data_id, "msg_id": msg_id, "time": sample_time, "raw_data": payload}
+        for data_id, msg_id, sample_time, payload in zip(
+            samples["data_id"].tolist(), samples["msg_id"].tolist(), samples["time"].tolist(), raw_data
+        )
+    ]
+
+
+def decode_values(msg_id: int, packed: np.ndarray) -> np.ndarray:
+    '''Chart value of every sample of one sensor as float64 (the registry's chart channel, scaled).
+    Non-finite floats (NaN / inf bit patterns) become 0 so they can't poison min / max.'''
+    return can_channels.decode_chart(msg_id, payload_bytes(packed))
+
+
+def summarize_sensors(msg_ids: np.ndarray, times: np.ndarray, packed: np.ndarray) -> pd.DataFrame:
+    '''Per-sensor sample count, time range and chart value range of a batch of samples, shaped like
+    models.SensorManifest rows (see crud.upsert_sensor_manifest)'''
+    values = np.empty(len(msg_ids), dtype=np.float64)
+    for msg_id in np.unique(msg_ids):
+        rows = msg_ids == msg_id
+        values[rows] = decode_values(int(msg_id), packed[rows])
+
+    grouped = pd.DataFrame({"msg_id": msg_ids, "time": times, "value": values}).groupby("msg_id", sort=True)
+    summary = grouped.agg(
+        sample_count=("time", "size"),
+        first_time=("time", "min"),
+        last_time=("time", "max"),
+        min_value=("value", "min"),
+        max_value=("value", "max"),
+    )
+    return summary.reset_index()
+
+
+def manifest_row(msg_id: int, times: np.ndarray, values: np.ndarray) -> Dict:
+    '''sensor_manifest row for every sample of one sensor (values: decode_values)'''
+    return {
+        "msg_id": msg_id,
+        "sample_count": len(values),
+        "first_time": int(times.min()),
+        "last_time": int(times.max()),
+        "min_value": float(values.min()),
+        "max_value": float(values.max()),
+    }
+
+
+def summarize_laps(msg_ids: np.ndarray, times: np.ndarray, packed: np.ndarray) -> pd.DataFrame:
+    '''(lap, start_time, end_time) of every lap number seen in a batch's lap frames, end = last frame seen
+    (see crud.upsert_drive_laps)'''
+    rows = msg_ids == LAP_MSG_ID
+    laps = pd.DataFrame({
+        "lap": decode_values(LAP_MSG_ID, packed[rows]).astype(np.int64),
+        "time": times[rows],
+    })
+    return laps.groupby("lap", sort=True).agg(start_time=("time", "min"), end_time=("time", "max")).reset_index()
@@ -14,6 +14,11 @@ import ClearIcon from "@mui/icons-material/Clear";
 import LoadingButton from "@mui/lab/LoadingButton";
 import CryptoJS from "crypto-js";
 
+const JOB_POLL_INTERVAL = 1000;
+const FINISHED_JOB_STATES = ["succeeded", "failed", "cancelled"];
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
 function AddDrive() {
   const [driverId, setDriverId] = useState("NULL");
   const [isLoading, setIsLoading] = useState(false);
@@ -23,6 +28,7 @@ function AddDrive() {
   const [file, setFile] = useState(null);
   const [notes, setNotes] = useState("");
   const [currError, setCurrError] = useState("");
+  const [progress, setProgress] = useState(null);
 
   const handleChange = (event) => {
     setDriverId(event.target.value);
@@ -53,10 +59,32 @@ function AddDrive() {
     });
   };
 
+  // The upload is ingested in the background, poll its job until it finishes
+  const waitForIngestJob = async (jobId) => {
+    while (true) {
+      const response = await fetch(`/api/ingest/jobs/${jobId}`);
+      if (!response.ok) {
+        setCurrError("Failed to fetch upload status");
+        throw new Error(`Failed to fetch upload status (${response.status})`);
+      }
+
+      const job = await response.json();
+      if (FINISHED_JOB_STATES.includes(job.status)) {
+        return job;
+      }
+      setProgress(
+        job.total_bytes ? Math.round((job.bytes_read / job.total_bytes) * 100) : 0
+      );
+      await sleep(JOB_POLL_INTERVAL);
+    }
+  };
+
   const createDrive = async () => {
     const currentDate = new Date().toISOString();
 
     setSuccessful(false);
+    setFailure(false);
+    setProgress(null);
     setIsLoading(true);
 
     try {
@@ -100,12 +128,21 @@ function AddDrive() {
         throw new Error("Failed to complete second request");
       }
 
+      const queuedJob = await response2.json();
+      setProgress(0);
+      const job = await waitForIngestJob(queuedJob.job_id);
+      if (job.status !== "succeeded") {
+        setCurrError(job.error || `Upload ${job.status}`);
+        throw new Error(job.error || `Upload ${job.status}`);
+      }
+
       setSuccessful(true);
     } catch (error) {
       console.error("Error in createDrive:", error);
       setFailure(true);
     }
 
+    setProgress(null);
     setIsLoading(false);
   };
 
@@ -139,6 +176,9 @@ function AddDrive() {
     <div>
       {failure && <Alert severity="error">Error: {currError}</Alert>}
       {successful && <Alert severity="success">Succesfully added drive</Alert>}
+      {progress !== null && (
+        <Alert severity="info">Processing upload... {progress}%</Alert>
+      )}
 
       <FormControl fullWidth variant="outlined" margin="normal">
         <InputLabel id="driver-select-label">Driver</InputLabel>
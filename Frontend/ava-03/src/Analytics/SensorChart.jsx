@@ -154,30 +154,50 @@ function SensorChart({
         nRight = -1;
       }
 
-      const tempDataSets = await Promise.all(
-        sensorIds.map(async ({ driveId, sensorId }) => {
-          if (isFullRange) {
-            const prefetchedData = await getPrefetchedSeries(driveId, sensorId);
-            if (prefetchedData && prefetchedData.length > 0) {
-              return { driveId, sensorId, data: prefetchedData };
-            }
-          }
+      const prefetched = await Promise.all(
+        sensorIds.map(async ({ driveId, sensorId }) =>
+          isFullRange ? await getPrefetchedSeries(driveId, sensorId) : null
+        )
+      );
 
-          const response = await fetch(
-            `/api/data/${driveId}/${sensorId}/${nLeft}/${nRight}`
-          );
-          if (!response.ok) {
-            throw new Error(
-              `Failed to fetch chart data for ${driveId}:${sensorId} (${response.status})`
-            );
-          }
-          const canMessages = await response.json();
-          const timeSeriesData = CANtoTimeseries(canMessages, sensorId);
+      // Everything not prefetched is fetched with one batch request per drive
+      const missingByDrive = {};
+      sensorIds.forEach(({ driveId, sensorId }, index) => {
+        if (!(prefetched[index] && prefetched[index].length > 0)) {
+          (missingByDrive[driveId] ??= []).push(sensorId);
+        }
+      });
+
+      const fetchedByDrive = Object.fromEntries(
+        await Promise.all(
+          Object.entries(missingByDrive).map(async ([driveId, driveSensorIds]) => {
+            const params = new URLSearchParams();
+            driveSensorIds.forEach((sensorId) => params.append("sensor_ids", sensorId));
 
-          return { driveId, sensorId, data: timeSeriesData };
-        })
+            const response = await fetch(
+              `/api/data/${driveId}/batch/${nLeft}/${nRight}?${params}`
+            );
+            if (!response.ok) {
+              throw new Error(
+                `Failed to fetch chart data for drive ${driveId} (${response.status})`
+              );
+            }
+            return [driveId, await response.json()];
+          })
+        )
       );
 
+      const tempDataSets = sensorIds.map(({ driveId, sensorId }, index) => {
+        if (prefetched[index] && prefetched[index].length > 0) {
+          return { driveId, sensorId, data: prefetched[index] };
+        }
+
+        const canMessages = fetchedByDrive[driveId]?.[sensorId] ?? [];
+        const timeSeriesData = CANtoTimeseries(canMessages, sensorId);
+
+        return { driveId, sensorId, data: timeSeriesData };
+      });
+
       setNewDataSets(tempDataSets);
       setLoadingData(false);
       return tempDataSets;
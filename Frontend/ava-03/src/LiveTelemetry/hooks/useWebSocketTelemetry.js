@@ -35,8 +35,11 @@ export function useWebSocketTelemetry(onMessage) {
     }
 
     try {
-      console.log("Connecting to WebSocket:", WS_URL);
-      const ws = new WebSocket(WS_URL);
+      // Telemetry coalesced into one batch per server tick instead of one message per CAN frame
+      const url = new URL(WS_URL);
+      url.searchParams.set("batch", "1");
+      console.log("Connecting to WebSocket:", url.toString());
+      const ws = new WebSocket(url.toString());
 
       ws.onopen = () => {
         console.log("WebSocket Connected!");
@@ -60,6 +63,12 @@ export function useWebSocketTelemetry(onMessage) {
             if (onMessage) {
               onMessage(data);
             }
+          } else if (data.type === "telemetry_batch") {
+            // Server coalesces telemetry into one batch per tick (?batch=1)
+            setSenderConnected(true);
+            if (onMessage) {
+              data.messages.forEach((message) => onMessage(message));
+            }
           } else if (data.type === "database" || data.type === "db") {
             setDatabaseEnabled(data.database_enabled);
           }
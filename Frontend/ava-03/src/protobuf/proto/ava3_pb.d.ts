@@ -47,3 +47,29 @@ export declare class Telemetry extends Message<Telemetry> {
   static equals(a: Telemetry | PlainMessage<Telemetry> | undefined, b: Telemetry | PlainMessage<Telemetry> | undefined): boolean;
 }
 
+/**
+ * Telemetry samples sent together in one binary WebSocket frame (/ws/livetelemetry?format=protobuf)
+ *
+ * @generated from message ava3.TelemetryBatch
+ */
+export declare class TelemetryBatch extends Message<TelemetryBatch> {
+  /**
+   * @generated from field: repeated ava3.Telemetry samples = 1;
+   */
+  samples: Telemetry[];
+
+  constructor(data?: PartialMessage<TelemetryBatch>);
+
+  static readonly runtime: typeof proto3;
+  static readonly typeName = "ava3.TelemetryBatch";
+  static readonly fields: FieldList;
+
+  static fromBinary(bytes: Uint8Array, options?: Partial<BinaryReadOptions>): TelemetryBatch;
+
+  static fromJson(jsonValue: JsonValue, options?: Partial<JsonReadOptions>): TelemetryBatch;
+
+  static fromJsonString(jsonString: string, options?: Partial<JsonReadOptions>): TelemetryBatch;
+
+  static equals(a: TelemetryBatch | PlainMessage<TelemetryBatch> | undefined, b: TelemetryBatch | PlainMessage<TelemetryBatch> | undefined): boolean;
+}
+
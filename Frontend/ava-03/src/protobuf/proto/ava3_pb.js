@@ -20,3 +20,15 @@ export const Telemetry = /*@__PURE__*/ proto3.makeMessageType(
   ],
 );
 
+/**
+ * Telemetry samples sent together in one binary WebSocket frame (/ws/livetelemetry?format=protobuf)
+ *
+ * @generated from message ava3.TelemetryBatch
+ */
+export const TelemetryBatch = /*@__PURE__*/ proto3.makeMessageType(
+  "ava3.TelemetryBatch",
+  () => [
+    { no: 1, name: "samples", kind: "message", T: Telemetry, repeated: true },
+  ],
+);
+